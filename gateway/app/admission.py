@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Collection, Optional
+
+from fastapi import HTTPException, Request
+from redis import Redis
+
+from .eta import model_slots, model_stats
+from .metrics import METRICS
+from .queue import get_redis_conn
+from .ratelimit import retry_after_header
+from .scheduler import QUEUED_COST_KEY, pending_key, priority_classes
+
+# A request's cost is its estimated tokens: the prompt (body bytes / bytes_per_token,
+# weighted down because prefill is far cheaper than decoding) plus max_tokens. Each
+# model's queued cost, over its decode throughput (tokens_per_sec x slots) and plus a
+# switch when the model is not resident, is the backlog a new job would wait behind.
+# Admission adds the cost only if that stays within the class's max_backlog_sec; an
+# empty queue always admits. A model with no pending jobs resets its total, so drift
+# (e.g. from a crashed worker) cannot build up.
+_ADMIT_LUA = """
+local queued = math.max(tonumber(redis.call('hget', KEYS[1], ARGV[1])) or 0, 0)
+local pending = 0
+for i = 2, #KEYS do pending = pending + redis.call('zcard', KEYS[i]) end
+if pending == 0 then queued = 0 end
+local cost = tonumber(ARGV[2])
+if queued > 0 and queued + cost > tonumber(ARGV[3]) then
+  return {0, tostring(queued)}
+end
+redis.call('hset', KEYS[1], ARGV[1], tostring(queued + cost))
+return {1, tostring(queued)}
+"""
+
+
+def check_max_tokens(cfg, max_tokens: Optional[int]):
+    bound = cfg.gateway.get("security", {}).get("max_tokens_upper_bound")
+    if bound and max_tokens and max_tokens > int(bound):
+        raise HTTPException(status_code=422, detail=f"max_tokens must be at most {int(bound)}")
+
+
+def request_cost(cfg, body_bytes: int, max_tokens: int) -> float:
+    acfg = cfg.gateway.get("admission", {})
+    prompt_tokens = body_bytes / float(acfg.get("bytes_per_token", 4))
+    return round(prompt_tokens * float(acfg.get("prompt_token_weight", 0.1)) + max_tokens, 1)
+
+
+def max_backlog_sec(cfg, priority: str) -> float:
+    default = float(cfg.gateway.get("admission", {}).get("max_backlog_sec", 3600))
+    return float(priority_classes(cfg).get(priority, {}).get("max_backlog_sec", default))
+
+
+def admit(conn: Redis, cfg, model: str, priority: str, cost: float, resident: Collection[str]) -> float:
+    # Adds cost to the model's queued total and returns 0, or returns the seconds until it would fit.
+    stats = model_stats(conn, cfg, [model])[model]
+    rate = max(stats["tokens_per_sec"] * model_slots(cfg, model), 1e-6)
+    switch = stats["switch_sec"] if model not in resident else 0.0
+    budget = max_backlog_sec(cfg, priority)
+    keys = [QUEUED_COST_KEY, *(pending_key(model, p) for p in priority_classes(cfg))]
+    allowed, queued = conn.register_script(_ADMIT_LUA)(keys=keys, args=[model, cost, (budget - switch) * rate])
+    if allowed:
+        return 0.0
+    return max((float(queued) + cost) / rate + switch - budget, 1.0)
+
+
+def release_admission(conn: Redis, model: str, cost: float):
+    # For a request admitted but never enqueued; queued jobs release through scheduler.release_cost.
+    if cost:
+        conn.hincrbyfloat(QUEUED_COST_KEY, model, -cost)
+
+
+async def admit_request(request: Request, model: str, priority: str, max_tokens: int) -> float:
+    # Returns the admitted cost (0 with admission disabled) for the job's meta, or raises 503.
+    cfg = request.app.state.cfg
+    check_max_tokens(cfg, max_tokens)
+    if not cfg.gateway.get("admission", {}).get("enabled", True):
+        return 0.0
+    cost = request_cost(cfg, len(await request.body()), max_tokens)
+    retry_after = await asyncio.to_thread(admit, get_redis_conn(), cfg, model, priority, cost, request.app.state.switcher.resident_models())
+    if retry_after:
+        METRICS.inc("llm_requests_shed_total", action="rejected", model=model, priority=priority)
+        raise HTTPException(status_code=503, detail=f"Backlog for {model} is over its limit; retry later", headers=retry_after_header(retry_after))
+    return cost
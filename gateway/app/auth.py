@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from fastapi import Header, HTTPException, Request
 
-from .config import get_admin_api_key, get_api_key
+from .config import get_admin_api_key, get_api_key, get_api_key_classes
 
 
 def require_api_key(request: Request, x_api_key: str | None = Header(default=None)):
@@ -10,7 +10,7 @@ def require_api_key(request: Request, x_api_key: str | None = Header(default=Non
     require_key = cfg.get("security", {}).get("require_api_key", True)
     if not require_key:
         return
-    if not x_api_key or x_api_key != get_api_key():
+    if not x_api_key or (x_api_key != get_api_key() and x_api_key not in get_api_key_classes()):
         raise HTTPException(status_code=401, detail="Invalid or missing API key")
 
 
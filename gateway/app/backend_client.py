@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from .config import AppConfig
+
+
+class BackendClient:
+    def __init__(self, cfg: AppConfig):
+        client_cfg = cfg.gateway.get("backend_client", {})
+        self.host = client_cfg.get("host", "127.0.0.1")
+        self.max_connections = int(client_cfg.get("max_connections", 64))
+        self.max_keepalive = int(client_cfg.get("max_keepalive_connections", 32))
+        self.keepalive_expiry = float(client_cfg.get("keepalive_expiry_sec", 30))
+        self.connect_timeout = float(client_cfg.get("connect_timeout_sec", 5))
+        self.read_timeout = float(cfg.gateway.get("timeouts", {}).get("INFERENCE_TIMEOUT_SEC", 1200))
+        self._clients: Dict[Tuple[str, int], httpx.AsyncClient] = {}
+
+    def for_model(self, model_cfg: Dict[str, Any], model: Optional[str] = None) -> httpx.AsyncClient:
+        # The instance the switcher placed model on (on another worker's host, for the
+        # gateway), else the port configured for it.
+        backend = model_cfg.get("backend", {})
+        host, port = _ROUTES.get(model) or (None, int(backend.get("port", 8001)))
+        host = host or self.host
+        client = self._clients.get((host, port))
+        if client is None:
+            max_connections = int(backend.get("max_connections", self.max_connections))
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=min(self.max_keepalive, max_connections),
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            client = httpx.AsyncClient(
+                base_url=f"http://{host}:{port}",
+                limits=limits,
+                timeout=self.timeout(self.read_timeout),
+            )
+            self._clients[(host, port)] = client
+        return client
+
+    def timeout(self, read_sec: float) -> httpx.Timeout:
+        return httpx.Timeout(read_sec, connect=self.connect_timeout)
+
+    async def aclose(self):
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+_CLIENT: Optional[BackendClient] = None
+# Model -> (host, port) of its running instance, kept current by the worker's ModelSwitcher
+# and the gateway's PoolView. A host of None means backend_client.host.
+_ROUTES: Dict[str, Tuple[Optional[str], int]] = {}
+
+
+def set_backend_routes(routes: Dict[str, Tuple[Optional[str], int]]):
+    global _ROUTES
+    _ROUTES = dict(routes)
+
+
+def init_backend_client(cfg: AppConfig) -> BackendClient:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = BackendClient(cfg)
+    return _CLIENT
+
+
+def get_backend_client() -> BackendClient:
+    if _CLIENT is None:
+        raise RuntimeError("Backend client is not initialised")
+    return _CLIENT
+
+
+async def close_backend_client():
+    global _CLIENT
+    if _CLIENT is not None:
+        client, _CLIENT = _CLIENT, None
+        await client.aclose()
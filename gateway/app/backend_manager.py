@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from docker.errors import NotFound
+
+log = logging.getLogger(__name__)
+
+
+def make_docker_client():
+    import docker
+
+    return docker.from_env()
+
+
+# Async facade over the Docker SDK: every blocking SDK call runs in a worker
+# thread so a model switch never stalls the event loop serving other requests.
+class BackendManager:
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = make_docker_client()
+        return self._client
+
+    async def run(
+        self,
+        name: str,
+        image: str,
+        command: List[str],
+        environment: Dict[str, str],
+        volumes: Dict[str, Dict[str, str]],
+        labels: Dict[str, str],
+        network_mode: str = "host",
+    ):
+        def _run():
+            self._remove_if_exists(name)
+            return self.client.containers.run(
+                image,
+                command,
+                name=name,
+                detach=True,
+                network_mode=network_mode,
+                environment=environment,
+                volumes=volumes,
+                labels=labels,
+            )
+
+        return await asyncio.to_thread(_run)
+
+    async def stop(self, name: str, graceful_sec: int) -> bool:
+        def _stop() -> bool:
+            try:
+                container = self.client.containers.get(name)
+            except NotFound:
+                return False
+            try:
+                # SIGTERM, then the daemon sends SIGKILL once graceful_sec elapses.
+                container.stop(timeout=graceful_sec)
+            except Exception:
+                log.warning("Graceful stop of %s failed, killing", name, exc_info=True)
+                try:
+                    container.kill()
+                except Exception:
+                    pass
+            self._remove_if_exists(name)
+            return True
+
+        return await asyncio.to_thread(_stop)
+
+    async def inspect(self, name: str) -> Optional[Dict[str, Any]]:
+        def _inspect():
+            try:
+                return self.client.containers.get(name).attrs
+            except NotFound:
+                return None
+
+        return await asyncio.to_thread(_inspect)
+
+    async def list(self, label: str) -> List[Dict[str, Any]]:
+        # Every container (running or not) carrying label.
+        def _list():
+            return [c.attrs for c in self.client.containers.list(all=True, filters={"label": label})]
+
+        return await asyncio.to_thread(_list)
+
+    async def state(self, name: str) -> Optional[Dict[str, Any]]:
+        info = await self.inspect(name)
+        return info.get("State", {}) if info is not None else None
+
+    async def logs(self, name: str, tail: int = 200) -> str:
+        def _logs() -> str:
+            try:
+                return self.client.containers.get(name).logs(tail=tail).decode(errors="replace")
+            except NotFound:
+                return ""
+
+        return await asyncio.to_thread(_logs)
+
+    async def follow_logs(self, name: str) -> AsyncIterator[str]:
+        # Docker's log stream is a blocking generator; pump it from a daemon
+        # thread into the loop line by line. It ends when the container stops.
+        loop = asyncio.get_running_loop()
+        lines: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def _emit(item):
+            try:
+                loop.call_soon_threadsafe(lines.put_nowait, item)
+            except RuntimeError:
+                stop.set()
+
+        def _pump():
+            buf = b""
+            try:
+                container = self.client.containers.get(name)
+                for chunk in container.logs(stream=True, follow=True):
+                    if stop.is_set():
+                        return
+                    buf += chunk
+                    *complete, buf = buf.split(b"\n")
+                    for line in complete:
+                        _emit(line.decode(errors="replace"))
+            except Exception:
+                pass
+            finally:
+                if buf:
+                    _emit(buf.decode(errors="replace"))
+                _emit(None)
+
+        threading.Thread(target=_pump, name=f"logs-{name}", daemon=True).start()
+        try:
+            while True:
+                line = await lines.get()
+                if line is None:
+                    return
+                yield line
+        finally:
+            stop.set()
+
+    def _remove_if_exists(self, name: str):
+        try:
+            self.client.containers.get(name).remove(force=True)
+        except NotFound:
+            pass
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import orjson
+from pydantic import ValidationError
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from rq import Queue
+from rq.job import Job
+from rq.results import Result
+from rq.serializers import resolve_serializer
+
+from .completion import public_status
+from .models import JOB_OPTIONS, JobCreateRequest
+from .results import read_result, result_key
+from .scheduler import enqueue_many, scheduling_meta
+
+BATCH_PREFIX = "llm:batch"
+OUTCOMES = ("succeeded", "failed", "cancelled", "expired")
+
+# First outcome wins: a job cancelled by the gateway and then failed by the
+# worker (its backend was killed) is counted once, as cancelled.
+_RECORD_OUTCOME_LUA = """
+if redis.call('hsetnx', KEYS[2], ARGV[1], ARGV[2]) == 1 then
+  redis.call('hincrby', KEYS[1], ARGV[2], 1)
+  local ttl = redis.call('ttl', KEYS[1])
+  if ttl > 0 then redis.call('expire', KEYS[2], ttl) end
+end
+"""
+
+_SERIALIZER = resolve_serializer(None)
+
+
+class BatchParseError(ValueError):
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def batch_key(batch_id: str) -> str:
+    return f"{BATCH_PREFIX}:{batch_id}"
+
+
+def jobs_key(batch_id: str) -> str:
+    return f"{BATCH_PREFIX}:{batch_id}:jobs"
+
+
+def outcomes_key(batch_id: str) -> str:
+    return f"{BATCH_PREFIX}:{batch_id}:outcomes"
+
+
+def parse_batch(
+    raw: bytes, models: Dict[str, Any], classes: Dict[str, Any], max_requests: int, max_tokens_bound: Optional[int] = None
+) -> List[Tuple[str, JobCreateRequest]]:
+    # Accepts OpenAI Batch API lines ({"custom_id", "method", "url", "body"}) or bare
+    # JobCreateRequest objects. Every error is reported, so one upload fixes them all.
+    items: List[Tuple[str, JobCreateRequest]] = []
+    errors: List[str] = []
+    for lineno, line in enumerate(raw.splitlines(), start=1):
+        if not line.strip():
+            continue
+        if len(errors) >= 50:
+            break
+        if len(items) >= max_requests:
+            raise BatchParseError([f"batch exceeds {max_requests} requests"])
+        try:
+            obj = orjson.loads(line)
+            body = obj.get("body", obj) if isinstance(obj, dict) else obj
+            req = JobCreateRequest.model_validate(body)
+        except (orjson.JSONDecodeError, ValidationError) as exc:
+            errors.append(f"line {lineno}: {exc}".replace("\n", " "))
+            continue
+        if req.model not in models:
+            errors.append(f"line {lineno}: unknown model {req.model}")
+            continue
+        if req.priority is not None and req.priority not in classes:
+            errors.append(f"line {lineno}: unknown priority class {req.priority}")
+            continue
+        if max_tokens_bound and req.max_tokens > max_tokens_bound:
+            errors.append(f"line {lineno}: max_tokens must be at most {max_tokens_bound}")
+            continue
+        items.append((str(obj.get("custom_id", lineno)), req))
+    if errors:
+        raise BatchParseError(errors)
+    if not items:
+        raise BatchParseError(["batch is empty"])
+    return items
+
+
+def create_batch(
+    q: Queue,
+    items: List[Tuple[str, JobCreateRequest]],
+    ttl_sec: int,
+    priority: str,
+    **job_kwargs,
+) -> Tuple[str, List[Job]]:
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    specs = []
+    for custom_id, req in items:
+        payload = req.model_dump(exclude=JOB_OPTIONS)
+        payload["async"] = True
+        meta = {"batch_id": batch_id, "custom_id": custom_id, **scheduling_meta(req.priority or priority, req.deadline_sec)}
+        specs.append((req.model, {"payload": payload}, meta))
+    with q.connection.pipeline() as pipe:
+        jobs = enqueue_many(q, "worker.tasks.process_chat_job", specs, pipe=pipe, **job_kwargs)
+        pipe.hset(batch_key(batch_id), mapping={"created_at": int(time.time()), "total": len(jobs), **{o: 0 for o in OUTCOMES}})
+        for i in range(0, len(jobs), 1000):
+            pipe.rpush(jobs_key(batch_id), *(job.id for job in jobs[i:i + 1000]))
+        for key in (batch_key(batch_id), jobs_key(batch_id)):
+            pipe.expire(key, ttl_sec)
+        pipe.execute()
+    return batch_id, jobs
+
+
+def record_batch_outcome(conn: Redis, job: Job, outcome: str, pipe=None):
+    batch_id = (job.meta or {}).get("batch_id")
+    if not batch_id:
+        return
+    script = conn.register_script(_RECORD_OUTCOME_LUA)
+    script(keys=[batch_key(batch_id), outcomes_key(batch_id)], args=[job.id, outcome], client=pipe or conn)
+
+
+async def batch_summary(aconn: AsyncRedis, batch_id: str) -> Optional[Dict[str, Any]]:
+    raw = await aconn.hgetall(batch_key(batch_id))
+    if not raw:
+        return None
+    counts = {k.decode(): int(v) for k, v in raw.items()}
+    total = counts["total"]
+    done = sum(counts.get(o, 0) for o in OUTCOMES)
+    return {
+        "id": batch_id,
+        "status": "completed" if done >= total else "in_progress",
+        "created_at": counts["created_at"],
+        "total": total,
+        "pending": total - done,
+        **{o: counts.get(o, 0) for o in OUTCOMES},
+        "progress": done / total if total else 1.0,
+    }
+
+
+async def batch_job_ids(aconn: AsyncRedis, batch_id: str, chunk: int = 500) -> AsyncIterator[List[str]]:
+    start = 0
+    while True:
+        ids = await aconn.lrange(jobs_key(batch_id), start, start + chunk - 1)
+        if not ids:
+            return
+        yield [i.decode() for i in ids]
+        start += chunk
+
+
+async def iter_batch_results(aconn: AsyncRedis, cfg, batch_id: str) -> AsyncIterator[bytes]:
+    # One pipelined round trip per chunk: job status/meta, the stored result and the latest rq Result.
+    async for ids in batch_job_ids(aconn, batch_id):
+        async with aconn.pipeline(transaction=False) as pipe:
+            for job_id in ids:
+                pipe.hmget(Job.key_for(job_id), "status", "meta", "result")
+                pipe.hgetall(result_key(job_id))
+                pipe.xrevrange(Result.get_key(job_id), "+", "-", count=1)
+            rows = await pipe.execute()
+        for i, job_id in enumerate(ids):
+            (status, meta, legacy_result), stored, latest = rows[3 * i:3 * i + 3]
+            meta = _SERIALIZER.loads(meta) if meta else {}
+            line: Dict[str, Any] = {
+                "id": job_id,
+                "custom_id": meta.get("custom_id"),
+                "status": public_status(status.decode()) if status else "missing",
+                "response": None,
+                "error": None,
+            }
+            if latest:
+                result_id, payload = latest[0]
+                res = Result.restore(job_id, result_id.decode(), payload, connection=None)
+                line["response"] = res.return_value
+                line["error"] = res.exc_string[-4000:] if res.exc_string else None
+            elif legacy_result:
+                line["response"] = _SERIALIZER.loads(legacy_result)
+            if stored:
+                line["response"] = await read_result(cfg, stored)
+            if meta.get("expired"):
+                line["status"] = "expired"
+            if line["status"] in {"failed", "cancelled", "expired"} and not line["error"]:
+                line["error"] = meta.get("error")
+            yield orjson.dumps(line) + b"\n"
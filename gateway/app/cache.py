@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import orjson
+from redis import Redis
+from rq import Queue
+from rq.job import Job
+from rq.utils import utcnow
+
+from .results import store_result
+
+CACHE_PREFIX = "llm:cache"
+ENTRY_PREFIX = f"{CACHE_PREFIX}:entry:"
+LRU_KEY = f"{CACHE_PREFIX}:lru"
+SIZES_KEY = f"{CACHE_PREFIX}:sizes"
+BYTES_KEY = f"{CACHE_PREFIX}:bytes"
+HITS_KEY = f"{CACHE_PREFIX}:hits"
+MISSES_KEY = f"{CACHE_PREFIX}:misses"
+
+# Fields that change how a response is delivered, not what it contains.
+_TRANSPORT_FIELDS = {"async", "async_mode", "stream", "stream_options", "webhook_url"}
+
+# Stores one entry and evicts least-recently-used entries until the cache is
+# back under its byte budget. Sizes are tracked separately so entries that
+# already expired through their TTL are still accounted for correctly.
+_PUT_LUA = """
+local old = redis.call('hget', KEYS[3], ARGV[4])
+if old then redis.call('decrby', KEYS[4], old) end
+redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+local size = string.len(ARGV[1])
+redis.call('hset', KEYS[3], ARGV[4], size)
+redis.call('zadd', KEYS[2], ARGV[3], ARGV[4])
+local total = redis.call('incrby', KEYS[4], size)
+while total > tonumber(ARGV[5]) do
+  local victim = redis.call('zpopmin', KEYS[2])
+  if #victim == 0 then break end
+  local vsize = redis.call('hget', KEYS[3], victim[1]) or 0
+  redis.call('hdel', KEYS[3], victim[1])
+  redis.call('del', ARGV[6] .. victim[1])
+  total = redis.call('decrby', KEYS[4], vsize)
+end
+return total
+"""
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    canonical = {k: v for k, v in payload.items() if k not in _TRANSPORT_FIELDS and v is not None}
+    return hashlib.sha256(orjson.dumps(canonical, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, conn: Redis, cfg):
+        cache_cfg = cfg.gateway.get("cache", {})
+        self.conn = conn
+        self.enabled = bool(cache_cfg.get("enabled", True))
+        self.ttl = int(cache_cfg.get("ttl_sec", 86400))
+        self.max_bytes = int(cache_cfg.get("max_bytes", 256 * 1024 * 1024))
+        self.only_deterministic = bool(cache_cfg.get("only_deterministic", True))
+        self._put = conn.register_script(_PUT_LUA)
+
+    def cacheable(self, payload: Dict[str, Any]) -> bool:
+        if not self.enabled or payload.get("stream"):
+            return False
+        if self.only_deterministic and payload.get("temperature") != 0:
+            return False
+        return int(payload.get("n") or 1) == 1
+
+    def get(self, payload: Dict[str, Any], record_miss: bool = True) -> Optional[Dict[str, Any]]:
+        if not self.cacheable(payload):
+            return None
+        key = cache_key(payload)
+        model = payload.get("model", "unknown")
+        raw = self.conn.get(ENTRY_PREFIX + key)
+        with self.conn.pipeline(transaction=False) as pipe:
+            if raw is not None:
+                pipe.zadd(LRU_KEY, {key: time.time()}, xx=True)
+                pipe.hincrby(HITS_KEY, model, 1)
+            elif record_miss:
+                pipe.hincrby(MISSES_KEY, model, 1)
+            pipe.execute()
+        return orjson.loads(raw) if raw is not None else None
+
+    def put(self, payload: Dict[str, Any], result: Dict[str, Any]):
+        if not self.cacheable(payload):
+            return
+        key = cache_key(payload)
+        self._put(
+            keys=[ENTRY_PREFIX + key, LRU_KEY, SIZES_KEY, BYTES_KEY],
+            args=[orjson.dumps(result), self.ttl, time.time(), key, self.max_bytes, ENTRY_PREFIX],
+        )
+
+
+def cache_stats(conn: Redis) -> Dict[str, Dict[str, int]]:
+    with conn.pipeline(transaction=False) as pipe:
+        pipe.hgetall(HITS_KEY)
+        pipe.hgetall(MISSES_KEY)
+        hits, misses = pipe.execute()
+    stats: Dict[str, Dict[str, int]] = {}
+    for model in {*hits, *misses}:
+        stats[model.decode()] = {"hits": int(hits.get(model, 0)), "misses": int(misses.get(model, 0))}
+    return stats
+
+
+def create_cached_job(q: Queue, cfg, payload: Dict[str, Any], result: Dict[str, Any], result_ttl: int) -> Job:
+    # A cache hit on the async path still gets a job id, born already finished,
+    # so /jobs/{id} and /jobs/{id}/result behave exactly like a real run.
+    now = utcnow()
+    finished_at = datetime.now(timezone.utc).isoformat()
+    job = Job.create(
+        "worker.tasks.process_chat_job",
+        kwargs={"payload": payload},
+        connection=q.connection,
+        result_ttl=result_ttl,
+        origin=q.name,
+        meta={
+            "requested_model": payload.get("model"),
+            "cache_hit": True,
+            "started_at": finished_at,
+            "finished_at": finished_at,
+            "progress": 1.0,
+        },
+    )
+    job.started_at = job.ended_at = now
+    store_result(q.connection, cfg, job.id, result, result_ttl)
+    with q.connection.pipeline() as pipe:
+        job.save(pipeline=pipe)
+        job._handle_success(result_ttl, pipeline=pipe)
+        pipe.execute()
+    return job
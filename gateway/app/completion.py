@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, Set
+
+from redis import Redis
+
+from .queue import get_async_redis_conn
+
+log = logging.getLogger(__name__)
+
+DONE_CHANNEL = "llm:jobs:done"
+CANCEL_CHANNEL = "llm:jobs:cancel"
+CANCEL_PREFIX = "llm:cancel"
+TERMINAL_STATUSES = {"finished", "failed", "canceled", "stopped"}
+
+_PUBLIC_STATUS = {
+    "finished": "succeeded",
+    "failed": "failed",
+    "canceled": "cancelled",
+    "started": "running",
+}
+
+
+def public_status(rq_status) -> str:
+    # rq's JobStatus enum hashes by name, so look it up by value.
+    rq_status = getattr(rq_status, "value", rq_status)
+    return _PUBLIC_STATUS.get(rq_status or "", "queued")
+
+
+def publish_done(conn: Redis, job_id: str):
+    # conn may be a pipeline, so the signal goes out with the status change itself.
+    conn.publish(DONE_CHANNEL, job_id)
+
+
+def cancel_key(job_id: str) -> str:
+    return f"{CANCEL_PREFIX}:{job_id}"
+
+
+def request_cancel(conn: Redis, cfg, job_id: str):
+    # The flag covers a worker that was not subscribed when the message went out;
+    # a running job cannot outlive the inference timeout, so neither does the flag.
+    ttl = int(cfg.gateway.get("timeouts", {}).get("INFERENCE_TIMEOUT_SEC", 1800))
+    with conn.pipeline() as pipe:
+        pipe.set(cancel_key(job_id), 1, ex=ttl)
+        pipe.publish(CANCEL_CHANNEL, job_id)
+        pipe.execute()
+
+
+# One subscription per process fans completion signals out to every waiting
+# request, instead of one Redis connection per long-poll.
+class CompletionHub:
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+
+    @contextmanager
+    def watch(self, job_id: str) -> Iterator[asyncio.Event]:
+        event = asyncio.Event()
+        self._waiters.setdefault(job_id, set()).add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    def _wake(self, job_id: str):
+        for event in self._waiters.get(job_id, ()):
+            event.set()
+
+    def _wake_all(self):
+        for job_id in list(self._waiters):
+            self._wake(job_id)
+
+    async def follow(self):
+        while True:
+            aconn = get_async_redis_conn()
+            try:
+                async with aconn.pubsub() as pubsub:
+                    await pubsub.subscribe(DONE_CHANNEL)
+                    # Signals may have been missed while unsubscribed; let every waiter re-check.
+                    self._wake_all()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._wake(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Job completion subscription lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await aconn.aclose()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import socket
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict
@@ -36,3 +37,18 @@ def get_api_key() -> str:
 
 def get_admin_api_key() -> str:
     return os.getenv("GATEWAY_ADMIN_API_KEY", get_api_key())
+
+
+def get_api_key_classes() -> Dict[str, str]:
+    # GATEWAY_EXTRA_API_KEYS="key1=batch,key2=interactive": extra client keys, each bound to a priority class.
+    classes = {}
+    for item in os.getenv("GATEWAY_EXTRA_API_KEYS", "").split(","):
+        key, _, priority = item.strip().partition("=")
+        if key:
+            classes[key] = priority
+    return classes
+
+
+def get_worker_name() -> str:
+    # Names this worker in the pool (llm:pool:*) and on its backend containers; unique per worker.
+    return os.getenv("WORKER_NAME") or socket.gethostname()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from redis import Redis
+from rq.job import Job
+from rq.serializers import resolve_serializer
+
+from .scheduler import DEFAULT_CLASS, _lanes, pending_key, priority_classes, queued_cost, split_lane
+
+STATS_PREFIX = "llm:stats"
+
+# Exponentially weighted means, so estimates follow the current prompt mix.
+_EWMA_LUA = """
+local alpha = tonumber(ARGV[1])
+for i = 2, #ARGV, 2 do
+  local v = tonumber(ARGV[i + 1])
+  local old = tonumber(redis.call('hget', KEYS[1], ARGV[i]))
+  if old then v = old + alpha * (v - old) end
+  redis.call('hset', KEYS[1], ARGV[i], v)
+end
+"""
+
+_SERIALIZER = resolve_serializer(None)
+
+
+def stats_key(model: str) -> str:
+    return f"{STATS_PREFIX}:model:{model}"
+
+
+def model_slots(cfg, model: Optional[str]) -> int:
+    default = int(cfg.gateway.get("jobs", {}).get("max_concurrency", 1))
+    model_cfg = cfg.models.get("models", {}).get(model or "", {})
+    return max(1, int(model_cfg.get("backend", {}).get("max_concurrency", default)))
+
+
+def _record(conn: Redis, cfg, model: str, values: Dict[str, float], pipe=None):
+    alpha = float(cfg.gateway.get("eta", {}).get("ewma_alpha", 0.2))
+    args: list = [alpha]
+    for field, value in values.items():
+        args += [field, value]
+    conn.register_script(_EWMA_LUA)(keys=[stats_key(model)], args=args, client=pipe or conn)
+
+
+def record_job_stats(conn: Redis, cfg, model: str, generation_sec: float, usage: Optional[Dict[str, Any]]):
+    values = {"job_sec": round(generation_sec, 3)}
+    tokens = (usage or {}).get("completion_tokens")
+    if tokens:
+        values["completion_tokens"] = tokens
+        if generation_sec > 0:
+            values["tokens_per_sec"] = round(tokens / generation_sec, 2)
+    _record(conn, cfg, model, values)
+
+
+def record_switch_stats(conn: Redis, cfg, model: str, switch_sec: float, pipe=None):
+    _record(conn, cfg, model, {"switch_sec": round(switch_sec, 3)}, pipe=pipe)
+
+
+def model_stats(conn: Redis, cfg, models: Iterable[str]) -> Dict[str, Dict[str, float]]:
+    ecfg = cfg.gateway.get("eta", {})
+    defaults = {
+        "job_sec": float(ecfg.get("default_job_sec", 30)),
+        "switch_sec": float(ecfg.get("default_switch_sec", 120)),
+        "tokens_per_sec": float(ecfg.get("default_tokens_per_sec", 30)),
+    }
+    models = sorted(set(models))
+    with conn.pipeline() as pipe:
+        for model in models:
+            pipe.hgetall(stats_key(model))
+        rows = pipe.execute()
+    return {m: {**defaults, **{k.decode(): float(v) for k, v in raw.items()}} for m, raw in zip(models, rows)}
+
+
+def running_estimate(meta: Dict[str, Any], stats: Dict[str, float]) -> Tuple[Optional[float], float]:
+    # (progress, seconds left) for a started job. Streaming jobs report real progress;
+    # for the rest it is extrapolated from the model's mean generation time.
+    began = meta.get("generation_started_at")
+    if began is None:
+        return meta.get("progress"), stats["job_sec"]
+    elapsed = max(time.time() - began, 0.0)
+    progress = meta.get("progress")
+    if progress:
+        return progress, round(elapsed * (1 - progress) / progress, 1)
+    return round(min(0.95, elapsed / stats["job_sec"]), 3), round(max(stats["job_sec"] - elapsed, 0.0), 1)
+
+
+def inflight_left(conn: Redis, cfg, model: Optional[str]) -> float:
+    # Seconds until the worker that will serve model has worked off the jobs it is running
+    # (as advertised in its heartbeat): the least loaded of the workers with model
+    # resident, else of all live workers.
+    from .pool import live_workers
+
+    workers = list(live_workers(conn, cfg).values())
+    serving = [i for i in workers if i["resident"].get(model or "", {}).get("state") not in (None, "failed")]
+    running = [i.get("running", []) for i in serving or workers]
+    if not any(running):
+        return 0.0
+    with conn.pipeline() as pipe:
+        for job_id in (j for ids in running for j in ids):
+            pipe.hmget(Job.key_for(job_id), "status", "meta")
+        rows = iter(pipe.execute())
+    metas = []
+    for ids in running:
+        # Finished jobs linger in the list until the worker's next heartbeat.
+        fields = [next(rows) for _ in ids]
+        metas.append([_SERIALIZER.loads(raw) for status, raw in fields if status == b"started" and raw])
+    stats = model_stats(conn, cfg, {m.get("requested_model") or "" for ms in metas for m in ms})
+    left = []
+    for ms in metas:
+        sec = sum(running_estimate(m, stats[m.get("requested_model") or ""])[1] for m in ms)
+        left.append(sec / model_slots(cfg, ms[0].get("requested_model")) if ms else 0.0)
+    return round(min(left), 1)
+
+
+def drain_estimate(conn: Redis, cfg, work: Dict[str, float], active_model: Optional[str], model: Optional[str] = None) -> float:
+    # Seconds to run `work` (jobs per model): generation time over each model's slots,
+    # plus one switch per model other than the loaded one, since the affinity
+    # scheduler runs a model's pending work in one stretch, after the running jobs
+    # of the worker that will serve model.
+    stats = model_stats(conn, cfg, [*work, *([active_model] if active_model else [])])
+    sec = sum(n * stats[m]["job_sec"] / model_slots(cfg, m) for m, n in work.items())
+    sec += sum(stats[m]["switch_sec"] for m, n in work.items() if n and m != active_model)
+    return round(sec + inflight_left(conn, cfg, model or active_model), 1)
+
+
+def queue_estimate(conn: Redis, cfg, job_id: str, meta: Dict[str, Any], active_model: Optional[str]) -> Optional[Dict[str, Any]]:
+    model, priority = meta.get("requested_model"), meta.get("priority", DEFAULT_CLASS)
+    score = conn.zscore(pending_key(model, priority), job_id) if model else None
+    if score is None:
+        return None
+    # Lane scores are enqueue times, so ZCOUNT below our score is O(log n) per lane.
+    lanes = [split_lane(lane) for lane in _lanes(conn)]
+    with conn.pipeline() as pipe:
+        for p, m in lanes:
+            if p == priority:
+                pipe.zcount(pending_key(m, p), "-inf", f"({score}")
+            else:
+                pipe.zcard(pending_key(m, p))
+        counts = pipe.execute()
+    weights = {name: float(c.get("weight", 1)) for name, c in priority_classes(cfg).items()}
+    turns = 1 + sum(c for (p, _), c in zip(lanes, counts) if p == priority)
+    class_totals: Dict[str, int] = {}
+    for (p, _), c in zip(lanes, counts):
+        class_totals[p] = class_totals.get(p, 0) + c
+    # While our class serves the jobs ahead of us, every other class gets its
+    # weighted share of turns.
+    ahead: Dict[str, float] = {}
+    for (p, m), c in zip(lanes, counts):
+        if p != priority and c:
+            c *= min(1.0, turns * weights.get(p, 1.0) / weights.get(priority, 1.0) / class_totals[p])
+        ahead[m] = ahead.get(m, 0) + c
+    work = {**ahead, model: ahead.get(model, 0) + 1}
+    return {
+        "queue_position": int(round(sum(ahead.values()))) + 1,
+        "eta_sec": drain_estimate(conn, cfg, work, active_model, model),
+    }
+
+
+def queue_overview(conn: Redis, cfg, pending: Dict[str, int], active_model: Optional[str]) -> Dict[str, Any]:
+    return {
+        "model_stats": model_stats(conn, cfg, cfg.models.get("models", {})),
+        "estimated_drain_sec": drain_estimate(conn, cfg, pending, active_model),
+        "queued_cost_tokens": queued_cost(conn),
+    }
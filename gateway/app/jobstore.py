@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from redis.asyncio import Redis as AsyncRedis
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from rq.serializers import resolve_serializer
+from rq.utils import str_to_date
+
+from .batches import record_batch_outcome
+from .completion import publish_done
+from .metrics import METRICS
+from .queue import get_queue, get_redis_conn
+from .ratelimit import refund
+from .scheduler import forget_job, resolve_priority, scheduling_meta
+from .webhooks import webhook_meta
+
+_SERIALIZER = resolve_serializer(None)
+
+
+async def job_options(cfg, req, api_key: Optional[str]) -> Dict[str, Any]:
+    # Job meta derived from the request's JOB_OPTIONS fields.
+    try:
+        priority = resolve_priority(cfg, req.priority, api_key)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {**await webhook_meta(cfg, req.webhook_url), **scheduling_meta(priority, req.deadline_sec)}
+
+
+async def fetch_job(job_id: str) -> Optional[Job]:
+    # rq is sync-only; full job loads (payload, result, exc_info) run on the default executor.
+    try:
+        return await asyncio.to_thread(Job.fetch, job_id, connection=get_redis_conn())
+    except NoSuchJobError:
+        return None
+
+
+async def job_summary(aconn: AsyncRedis, job_id: str) -> Optional[Dict[str, Any]]:
+    # Status polling only needs a few hash fields, read without unpickling the payload.
+    status, created_at, meta = await aconn.hmget(Job.key_for(job_id), "status", "created_at", "meta")
+    if status is None and created_at is None:
+        return None
+    return {
+        "status": status.decode() if status else None,
+        "created_at": str_to_date(created_at),
+        "meta": _SERIALIZER.loads(meta) if meta else {},
+    }
+
+
+def _count_cancelled(job: Job):
+    meta = job.meta or {}
+    METRICS.inc("llm_jobs_total", outcome="cancelled", model=meta.get("requested_model", ""), priority=meta.get("priority", ""))
+
+
+def cancel_queued_job(job: Job, cfg):
+    q = get_queue(job.connection)
+    q.remove(job.id)
+    forget_job(job.connection, job)
+    job.meta["cancelled_at"] = datetime.now(timezone.utc).isoformat()
+    job.set_status("canceled")
+    job.save_meta()
+    record_batch_outcome(job.connection, job, "cancelled")
+    publish_done(job.connection, job.id)
+    _count_cancelled(job)
+    refund(job.connection, cfg, job.meta.get("rate_limit"))
+
+
+def mark_job_cancelled(job: Job):
+    job.meta["cancelled_at"] = datetime.now(timezone.utc).isoformat()
+    job.meta["finished_at"] = datetime.now(timezone.utc).isoformat()
+    job.set_status("canceled")
+    job.save_meta()
+    record_batch_outcome(job.connection, job, "cancelled")
+    publish_done(job.connection, job.id)
+    _count_cancelled(job)
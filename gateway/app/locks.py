@@ -1,17 +1,19 @@
 from __future__ import annotations
 
 import asyncio
-from contextlib import contextmanager
+from contextlib import asynccontextmanager
 from filelock import FileLock
 
 
 switch_lock = asyncio.Lock()
 
 
-@contextmanager
-def file_switch_lock(lock_path: str, timeout: int = 120):
-    lock = FileLock(lock_path, timeout=timeout)
-    lock.acquire()
+@asynccontextmanager
+async def async_file_switch_lock(lock_path: str, timeout: int = 120):
+    # FileLock's thread-local mode would tie the lock to the acquiring thread;
+    # disable it so the lock taken in a worker thread can be released here.
+    lock = FileLock(lock_path, timeout=timeout, thread_local=False)
+    await asyncio.to_thread(lock.acquire)
     try:
         yield
     finally:
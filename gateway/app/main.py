@@ -1,30 +1,62 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
 
+from .backend_client import close_backend_client, init_backend_client
+from .completion import CompletionHub
 from .config import load_config
-from .middleware import RequestContextMiddleware, SimpleRateLimitMiddleware
+from .metrics import METRICS
+from .pool import PoolView
+from .queue import get_redis_conn
+from .results import publish_spill_probe
+from .middleware import install_middleware
 from .routes_admin import router as admin_router
+from .routes_batches import router as batches_router
 from .routes_jobs import router as jobs_router
 from .routes_openai import router as openai_router
-from .switcher import ModelSwitcher
+from .webhooks import close_webhook_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_backend_client(app.state.cfg)
+    # Tells workers whether they see this spill_dir (see results.py).
+    await asyncio.to_thread(publish_spill_probe, get_redis_conn(), app.state.cfg)
+    switcher = app.state.switcher
+    followers = [
+        asyncio.create_task(switcher.follow_shared_state()),
+        asyncio.create_task(app.state.completions.follow()),
+    ]
+    interval = float(app.state.cfg.gateway.get("metrics", {}).get("flush_interval_sec", 5))
+    flusher = asyncio.create_task(METRICS.run_flusher(get_redis_conn(), interval))
+    yield
+    for follower in followers:
+        follower.cancel()
+    flusher.cancel()
+    await asyncio.gather(flusher, return_exceptions=True)
+    await close_backend_client()
+    await close_webhook_client()
 
 
 def create_app() -> FastAPI:
     cfg = load_config()
-    app = FastAPI(title="LLM Switchboard", default_response_class=ORJSONResponse)
+    app = FastAPI(title="LLM Switchboard", default_response_class=ORJSONResponse, lifespan=lifespan)
     app.state.cfg = cfg
-    app.state.switcher = ModelSwitcher(cfg)
+    # Workers own the backends; the gateway follows their state and routes to them.
+    app.state.switcher = PoolView(get_redis_conn())
+    app.state.completions = CompletionHub()
 
-    app.add_middleware(RequestContextMiddleware)
-    app.add_middleware(SimpleRateLimitMiddleware)
+    install_middleware(app, cfg)
 
     app.include_router(openai_router)
     app.include_router(jobs_router)
+    app.include_router(batches_router)
     app.include_router(admin_router)
     return app
 
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from redis import Redis
+
+from .cache import cache_stats
+
+log = logging.getLogger(__name__)
+
+METRICS_KEY = "llm:metrics"
+
+_SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+HISTOGRAMS: Dict[str, Tuple[str, Tuple[float, ...]]] = {
+    "llm_queue_wait_seconds": ("Time a job spent queued before a worker claimed it", _SECONDS),
+    "llm_model_switch_seconds": ("Model switch duration, from stopping the old backend to the new one being ready", (5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600, 900)),
+    "llm_backend_ttft_seconds": ("Backend time to first token of streaming requests", (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)),
+    "llm_inference_seconds": ("Backend chat completion duration", _SECONDS),
+    "llm_tokens_per_second": ("Completion tokens per second of backend time", (1, 5, 10, 20, 30, 40, 60, 80, 100, 150, 200, 400)),
+    "llm_model_switch_cached_ratio": ("Share of the checkpoint already in the page cache when a switch began", (0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1)),
+}
+COUNTERS = {
+    "llm_jobs_total": "Jobs by final outcome",
+    "llm_model_switches_total": "Model switches by outcome",
+    "llm_rate_limited_total": "Requests rejected by the rate limiter",
+    "llm_requests_shed_total": "Requests rejected or downgraded to async by admission control",
+    "llm_prestage_bytes_total": "Weight bytes read into the page cache ahead of a model switch",
+    "llm_preloads_total": "Models loaded by the idle preloader, by reason (pinned or predicted)",
+    "llm_model_hits_total": "Chat requests by whether their model was loaded and ready on arrival",
+    "llm_pool_dead_workers_total": "Workers declared dead after their heartbeat stopped",
+    "llm_pool_requeued_jobs_total": "Jobs put back in the queue after their worker died",
+}
+
+
+def _fmt(value: float) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _labels(labels: Dict[str, object]) -> str:
+    return ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in sorted(labels.items())
+    )
+
+
+# Observations accumulate in-process and are flushed to one Redis hash in a single
+# pipeline, so the hot path never waits on Redis and every gateway and worker
+# process adds up in one scrape. Fields are "name|labels|le".
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = defaultdict(float)
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        field = f"{name}|{_labels(labels)}|"
+        with self._lock:
+            self._pending[field] += value
+
+    def observe(self, name: str, value: float, **labels):
+        bounds = HISTOGRAMS[name][1]
+        i = bisect_left(bounds, value)
+        le = _fmt(bounds[i]) if i < len(bounds) else "+Inf"
+        base = _labels(labels)
+        with self._lock:
+            self._pending[f"{name}|{base}|{le}"] += 1
+            self._pending[f"{name}_sum|{base}|"] += value
+            self._pending[f"{name}_count|{base}|"] += 1
+
+    def flush(self, conn: Redis):
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+        if not pending:
+            return
+        try:
+            with conn.pipeline(transaction=False) as pipe:
+                for field, value in pending.items():
+                    pipe.hincrbyfloat(METRICS_KEY, field, value)
+                pipe.execute()
+        except Exception:
+            log.warning("Could not flush metrics", exc_info=True)
+            with self._lock:
+                for field, value in pending.items():
+                    self._pending[field] += value
+
+    async def run_flusher(self, conn: Redis, interval_sec: float):
+        try:
+            while True:
+                await asyncio.sleep(interval_sec)
+                await asyncio.to_thread(self.flush, conn)
+        finally:
+            self.flush(conn)
+
+
+METRICS = Metrics()
+
+
+def _series(labels: str, extra: str = "") -> str:
+    inner = ",".join(part for part in (labels, extra) if part)
+    return f"{{{inner}}}" if inner else ""
+
+
+def render_metrics(conn: Redis, pending: Dict[Tuple[str, str], int]) -> str:
+    # Prometheus text format. pending is the scheduler's (priority, model) lane sizes.
+    series: Dict[str, Dict[str, float]] = defaultdict(dict)
+    buckets: Dict[str, Dict[str, Dict[str, float]]] = defaultdict(lambda: defaultdict(dict))
+    for field, value in conn.hgetall(METRICS_KEY).items():
+        name, rest = field.decode().split("|", 1)
+        labels, le = rest.rsplit("|", 1)
+        if le:
+            buckets[name][labels][le] = float(value)
+        else:
+            series[name][labels] = float(value)
+
+    lines: List[str] = []
+    for name, (doc, bounds) in HISTOGRAMS.items():
+        lines += [f"# HELP {name} {doc}", f"# TYPE {name} histogram"]
+        for labels in sorted(series[f"{name}_count"]):
+            counts, total = buckets[name].get(labels, {}), 0.0
+            for le in [*map(_fmt, bounds), "+Inf"]:
+                total += counts.get(le, 0)
+                lines.append(f"{name}_bucket{_series(labels, _labels({'le': le}))} {_fmt(total)}")
+            count = series[f"{name}_count"][labels]
+            lines.append(f"{name}_sum{_series(labels)} {_fmt(series[f'{name}_sum'].get(labels, 0))}")
+            lines.append(f"{name}_count{_series(labels)} {_fmt(count)}")
+    for name, doc in COUNTERS.items():
+        lines += [f"# HELP {name} {doc}", f"# TYPE {name} counter"]
+        lines += [f"{name}{_series(labels)} {_fmt(v)}" for labels, v in sorted(series[name].items())]
+
+    lines += ["# HELP llm_cache_requests_total Response cache lookups", "# TYPE llm_cache_requests_total counter"]
+    for model, stats in sorted(cache_stats(conn).items()):
+        for field, result in (("hits", "hit"), ("misses", "miss")):
+            lines.append(f"llm_cache_requests_total{{{_labels({'model': model, 'result': result})}}} {stats[field]}")
+    lines += ["# HELP llm_jobs_pending Jobs waiting in the scheduler", "# TYPE llm_jobs_pending gauge"]
+    for (priority, model), count in sorted(pending.items()):
+        lines.append(f"llm_jobs_pending{{{_labels({'model': model, 'priority': priority})}}} {count}")
+    return "\n".join(lines) + "\n"
@@ -1,43 +1,101 @@
 from __future__ import annotations
 
-import time
 import uuid
-from collections import defaultdict, deque
-from typing import Deque, Dict
+from typing import Optional
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.middleware.cors import CORSMiddleware
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
+from .queue import get_async_redis_conn
+from .ratelimit import bucket_limits, client_id, retry_after_header, take
 
-class RequestContextMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
+# Plain ASGI middleware: no per-request task or response-stream wrapping (as
+# BaseHTTPMiddleware does), so streaming responses keep their backpressure, and
+# config is read once when the app is built.
+
+
+class RequestContextMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
         request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
-        response = await call_next(request)
-        response.headers["X-Request-Id"] = request_id
-        return response
-
-
-class SimpleRateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, rpm: int = 120):
-        super().__init__(app)
-        self.rpm = rpm
-        self.reqs: Dict[str, Deque[float]] = defaultdict(deque)
-
-    async def dispatch(self, request: Request, call_next):
-        cfg = request.app.state.cfg.gateway
-        limiter_cfg = cfg.get("security", {}).get("rate_limit", {})
-        if not limiter_cfg.get("enabled", True):
-            return await call_next(request)
-
-        rpm = int(limiter_cfg.get("requests_per_minute", self.rpm))
-        key = request.headers.get("x-api-key") or (request.client.host if request.client else "unknown")
-        now = time.time()
-        bucket = self.reqs[key]
-        while bucket and bucket[0] < now - 60:
-            bucket.popleft()
-        if len(bucket) >= rpm:
-            return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
-        bucket.append(now)
-        return await call_next(request)
+        scope.setdefault("state", {})["request_id"] = request_id
+        header = (b"x-request-id", request_id.encode())
+
+        async def send_with_id(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), header]
+            await send(message)
+
+        await self.app(scope, receive, send_with_id)
+
+
+class RateLimitMiddleware:
+    # Per-client request budget, shared by every gateway process through Redis.
+    # Token budgets are charged by the chat routes, which know max_tokens.
+    def __init__(self, app: ASGIApp, cfg):
+        self.app = app
+        self.limits = bucket_limits(cfg, "requests")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.limits is None:
+            return await self.app(scope, receive, send)
+        client = client_id(Headers(scope=scope).get("x-api-key"), scope["client"][0] if scope.get("client") else None)
+        retry_after = await take(get_async_redis_conn(), self.limits, "requests", client)
+        if retry_after:
+            response = JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"}, headers=retry_after_header(retry_after))
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
+
+
+class BodyLimitMiddleware:
+    # Rejects a declared Content-Length over the limit before the route runs, and
+    # counts chunked bodies as they are read. The 413 is an HTTPException so FastAPI's
+    # body parsing passes it through instead of turning it into a 400.
+    def __init__(self, app: ASGIApp, max_bytes: int, exempt_prefixes: tuple = ()):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.exempt_prefixes = exempt_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self.max_bytes <= 0 or scope["path"].startswith(self.exempt_prefixes):
+            return await self.app(scope, receive, send)
+        length: Optional[str] = Headers(scope=scope).get("content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse(status_code=413, content={"detail": f"Request body exceeds {self.max_bytes} bytes"})
+            return await response(scope, receive, send)
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {self.max_bytes} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def install_middleware(app, cfg):
+    # Added innermost first: CORS wraps everything, so 413/429 responses carry its headers too.
+    security = cfg.gateway.get("security", {})
+    # /batches enforces batches.max_upload_mb itself.
+    app.add_middleware(BodyLimitMiddleware, max_bytes=int(float(security.get("request_body_limit_mb", 4)) * 1024 * 1024), exempt_prefixes=("/batches",))
+    app.add_middleware(RateLimitMiddleware, cfg=cfg)
+    app.add_middleware(RequestContextMiddleware)
+    if security.get("cors_enabled", False):
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=security.get("cors_allow_origins") or ["*"],
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["X-Request-Id", "Retry-After", "X-Cache"],
+        )
@@ -1,38 +1,55 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Literal, Optional
-from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional, Union
+from pydantic import BaseModel, ConfigDict, Field
 
 
-JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled", "expired"]
 
+# Request fields that steer how a job is queued and reported, never sent to the backend.
+JOB_OPTIONS = {"webhook_url", "priority", "deadline_sec"}
 
+
+# Unknown fields (tools, top_p, stop, logprobs, tool_calls, ...) are kept and sent to the backend.
 class ChatMessage(BaseModel):
-    role: Literal["system", "user", "assistant", "tool"]
-    content: str
+    model_config = ConfigDict(extra="allow")
+
+    role: Literal["system", "developer", "user", "assistant", "tool"]
+    content: Union[str, List[Dict[str, Any]], None] = None
 
 
 class ChatCompletionRequest(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     model: str
     messages: List[ChatMessage]
     temperature: float = 0.7
     max_tokens: int = 512
     stream: bool = False
     async_mode: bool = Field(default=True, alias="async")
+    webhook_url: Optional[str] = None
+    priority: Optional[str] = None
+    deadline_sec: Optional[float] = Field(default=None, gt=0)
 
 
 class JobCreateRequest(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     model: str
     messages: List[ChatMessage]
     temperature: float = 0.7
     max_tokens: int = 512
     stream: bool = False
+    webhook_url: Optional[str] = None
+    priority: Optional[str] = None
+    deadline_sec: Optional[float] = Field(default=None, gt=0)
 
 
 class JobCreateResponse(BaseModel):
     id: str
     status: JobStatus
     status_url: str
+    stream_url: Optional[str] = None
 
 
 class JobStatusResponse(BaseModel):
@@ -44,9 +61,35 @@ class JobStatusResponse(BaseModel):
     finished_at: Optional[str] = None
     queue_position: Optional[int] = None
     progress: Optional[float] = None
+    eta_sec: Optional[float] = None
     error: Optional[str] = None
 
 
+class JobWaitResponse(JobStatusResponse):
+    result: Optional[Dict[str, Any]] = None
+
+
+class BatchCreateResponse(BaseModel):
+    id: str
+    status: str
+    total: int
+    status_url: str
+    results_url: str
+
+
+class BatchStatusResponse(BaseModel):
+    id: str
+    status: Literal["in_progress", "completed"]
+    created_at: str
+    total: int
+    pending: int
+    succeeded: int
+    failed: int
+    cancelled: int
+    expired: int = 0
+    progress: float
+
+
 class OpenAIModel(BaseModel):
     id: str
     object: str = "model"
@@ -64,9 +107,20 @@ class SwitchRequest(BaseModel):
     model: str
 
 
+class PinRequest(BaseModel):
+    model: Optional[str] = None
+
+
 class QueueInfoResponse(BaseModel):
     queue_length: int
+    pending_by_model: Dict[str, int] = {}
+    pending_by_class: Dict[str, int] = {}
+    wait_percentiles: Dict[str, Dict[str, float]] = {}
+    model_stats: Dict[str, Dict[str, float]] = {}
+    estimated_drain_sec: Optional[float] = None
+    queued_cost_tokens: Dict[str, float] = {}
     current_job_id: Optional[str]
+    running_job_ids: List[str] = []
     active_model: Optional[str]
     switching: bool
     drain_mode: bool
@@ -90,5 +144,10 @@ class StatusResponse(BaseModel):
     active_model: Optional[str]
     switching: bool
     backend_state: str
+    resident_models: Dict[str, Dict[str, Any]] = {}
+    workers: Dict[str, Dict[str, Any]] = {}
     queue_length: int
     uptime_sec: int
+    switches_avoided: int = 0
+    cache: Dict[str, Dict[str, int]] = {}
+    recent_switches: List[Dict[str, Any]] = []
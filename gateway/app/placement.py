@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+# Which models share the machine. Each model declares its footprint in models.yaml
+# (resources.memory_gb: weights plus the KV cache it is given); as many run side by
+# side, each in its own container and on its own port, as fit placement.memory_budget_gb.
+# A model without a footprint takes the whole budget, i.e. runs alone. With placement
+# disabled there is a single backend (llm-backend-active), as before.
+
+
+def placement_enabled(cfg) -> bool:
+    pcfg = cfg.gateway.get("placement", {})
+    return bool(pcfg.get("enabled", True)) and float(pcfg.get("memory_budget_gb", 0)) > 0
+
+
+def memory_budget_gb(cfg) -> float:
+    return float(cfg.gateway.get("placement", {}).get("memory_budget_gb", 0))
+
+
+def model_memory_gb(cfg, model: str) -> float:
+    resources = cfg.models.get("models", {}).get(model, {}).get("resources", {})
+    return float(resources.get("memory_gb") or memory_budget_gb(cfg))
+
+
+def container_name(cfg, prefix: str, model: Optional[str]) -> str:
+    if not placement_enabled(cfg) or model is None:
+        return f"{prefix}-active"
+    return f"{prefix}-{re.sub(r'[^a-zA-Z0-9_.-]', '-', model)}"
+
+
+def instance_port(cfg, model: str, taken: Iterable[int], base_port: Optional[int] = None) -> int:
+    if not placement_enabled(cfg):
+        return int(cfg.models["models"][model].get("backend", {}).get("port", 8001))
+    pcfg = cfg.gateway.get("placement", {})
+    base = int(pcfg.get("base_port", 8101)) if base_port is None else base_port
+    free = [p for p in range(base, base + int(pcfg.get("max_instances", 4))) if p not in set(taken)]
+    if not free:
+        raise RuntimeError("No free backend port; raise placement.max_instances")
+    return free[0]
+
+
+def can_share(cfg, model: str) -> bool:
+    # Whether model fits in the budget next to any other model.
+    if int(cfg.gateway.get("placement", {}).get("max_instances", 4)) < 2:
+        return False
+    need = memory_budget_gb(cfg) - model_memory_gb(cfg, model)
+    return any(model_memory_gb(cfg, m) <= need for m in cfg.models.get("models", {}) if m != model)
+
+
+def instance_args(cfg, model: str, port: int) -> List[str]:
+    # --port, plus vLLM's share of device memory sized to the model's footprint so the
+    # co-resident instances do not each claim the default 90%. A model that always runs
+    # alone keeps vLLM's default, and the KV cache it allows.
+    args = list(cfg.models["models"][model].get("backend", {}).get("vllm_args", []))
+    args = ["--port", str(port), *args]
+    if placement_enabled(cfg) and can_share(cfg, model) and "--gpu-memory-utilization" not in args:
+        total = float(cfg.gateway.get("placement", {}).get("total_memory_gb", 128))
+        share = min(model_memory_gb(cfg, model) / total, 0.95)
+        args += ["--gpu-memory-utilization", f"{share:.2f}"]
+    return args
+
+
+def plan_evictions(
+    cfg,
+    resident: Dict[str, Dict[str, Any]],
+    model: str,
+    switch_sec: Optional[Dict[str, float]] = None,
+) -> List[str]:
+    # The resident models to stop so that model fits. Failed instances always go; the
+    # rest in eviction order: least recently used first ("lru"), or ("cost") cheapest
+    # to reload per second idle first, so rarely used models that are slow to load stay.
+    others = {m: info for m, info in resident.items() if m != model}
+    if not placement_enabled(cfg):
+        return list(others)
+    pcfg = cfg.gateway.get("placement", {})
+    victims = [m for m, info in others.items() if info.get("state") == "failed"]
+    now = time.time()
+
+    def key(m: str) -> float:
+        idle = max(now - float(others[m].get("last_used", 0)), 1.0)
+        if pcfg.get("eviction", "lru") == "cost" and switch_sec:
+            return switch_sec.get(m, 0.0) / idle
+        return -idle
+
+    used = sum(model_memory_gb(cfg, m) for m in others if m not in victims)
+    count = len(others) - len(victims)
+    max_instances = int(pcfg.get("max_instances", 4))
+    for m in sorted((m for m in others if m not in victims), key=key):
+        if used + model_memory_gb(cfg, model) <= memory_budget_gb(cfg) and count < max_instances:
+            break
+        victims.append(m)
+        used -= model_memory_gb(cfg, m)
+        count -= 1
+    return victims
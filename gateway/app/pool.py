@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Collection, Dict, List, Optional, Set, Tuple
+
+import orjson
+from redis import Redis
+from rq import Queue
+from rq.job import Job, JobStatus
+
+from .backend_client import set_backend_routes
+from .eta import model_stats
+from .placement import plan_evictions
+from .queue import get_async_redis_conn
+from .switcher import STATE_CHANNEL, parse_state, state_key
+
+log = logging.getLogger(__name__)
+
+POOL_PREFIX = "llm:pool"
+# Worker name -> time of its last heartbeat.
+WORKERS_KEY = f"{POOL_PREFIX}:workers"
+
+# Several workers, each on its own host with its own backends, can share the queue.
+# Every worker advertises what it has loaded and how busy it is with a heartbeat, and
+# before claiming leaves a job to the worker that can start it soonest: one that has
+# the model loaded, else the one whose switch is cheapest. A worker whose heartbeat
+# stops for dead_after_sec is declared dead by the first live worker to notice, which
+# requeues the jobs it was running.
+
+
+def worker_key(name: str) -> str:
+    return f"{POOL_PREFIX}:worker:{name}"
+
+
+def _dead_after(cfg) -> float:
+    return float(cfg.gateway.get("pool", {}).get("dead_after_sec", 15))
+
+
+def advertise(conn, name: str, info: Dict[str, Any]):
+    # conn may be a pipeline.
+    conn.set(worker_key(name), orjson.dumps({**info, "heartbeat_at": time.time()}))
+    conn.zadd(WORKERS_KEY, {name: time.time()})
+
+
+def heartbeat(conn: Redis, name: str, info: Dict[str, Any]) -> bool:
+    # True if the pool did not know this worker: its first beat, or it had been declared dead.
+    with conn.pipeline() as pipe:
+        advertise(pipe, name, info)
+        return bool(pipe.execute()[-1])
+
+
+def live_workers(conn: Redis, cfg) -> Dict[str, Dict[str, Any]]:
+    names = [n.decode() for n in conn.zrangebyscore(WORKERS_KEY, time.time() - _dead_after(cfg), "+inf")]
+    raws = conn.mget([worker_key(n) for n in names]) if names else []
+    return {n: orjson.loads(raw) for n, raw in zip(names, raws) if raw}
+
+
+def pool_resident_models(conn: Redis, cfg) -> Set[str]:
+    return {m for info in live_workers(conn, cfg).values() for m, i in info["resident"].items() if i.get("state") != "failed"}
+
+
+def start_cost(cfg, info: Dict[str, Any], model: str, stats: Dict[str, Dict[str, float]], pending: Collection[str]) -> float:
+    # Seconds until the worker could start a job for model: its current work drains (or
+    # its switch finishes); then, unless model is resident, one switch, plus the reloads
+    # later needed for the models it evicts that still have queued work.
+    def sec(m: Optional[str], field: str) -> float:
+        return stats.get(m or "", {}).get(field, 0.0)
+
+    resident = {m: i for m, i in info["resident"].items() if i.get("state") != "failed"}
+    cost = 0.0
+    if info.get("switching"):
+        cost += sec(info.get("active_model"), "switch_sec")
+    elif info.get("inflight") and not (info.get("inflight_model") == model and info.get("free_slots", 0) > 0):
+        cost += sec(info.get("inflight_model"), "job_sec")
+    if model in resident:
+        return cost
+    cost += sec(model, "switch_sec")
+    return cost + sum(sec(v, "switch_sec") for v in plan_evictions(cfg, resident, model) if v in pending)
+
+
+def claimable_models(conn: Redis, cfg, me: str, workers: Dict[str, Dict[str, Any]], heads: Dict[Tuple[str, str], float]) -> Set[str]:
+    # The pending models worker `me` should claim now. A job that can start right away
+    # is always taken; otherwise it is left to the worker with the lowest start_cost
+    # (ties by name) until it has been due for locality_wait_sec, after which any worker
+    # takes it, so stale heartbeats cannot strand it.
+    wait = float(cfg.gateway.get("pool", {}).get("locality_wait_sec", 30))
+    due: Dict[str, float] = {}
+    for (_, model), score in heads.items():
+        due[model] = min(due.get(model, score), score)
+    stats = model_stats(conn, cfg, cfg.models.get("models", {}))
+    now = time.time()
+    claimable = set()
+    for model, score in due.items():
+        costs = {name: start_cost(cfg, info, model, stats, due) for name, info in workers.items()}
+        best = min(costs, key=lambda n: (costs[n], n))
+        if costs[me] == 0 or best == me or now - score > wait:
+            claimable.add(model)
+    return claimable
+
+
+def claim_dead_workers(conn: Redis, cfg, me: str) -> List[str]:
+    # ZREM succeeds for one caller only, so each dead worker is reaped exactly once.
+    names = [n.decode() for n in conn.zrangebyscore(WORKERS_KEY, "-inf", f"({time.time() - _dead_after(cfg)}")]
+    return [n for n in names if n != me and conn.zrem(WORKERS_KEY, n)]
+
+
+def orphaned_jobs(queue: Queue, name: str) -> List[Job]:
+    # Jobs the named worker had started and not finished.
+    jobs = Job.fetch_many(queue.started_job_registry.get_job_ids(), connection=queue.connection)
+    return [j for j in jobs if j is not None and j.worker_name == name and j.get_status(refresh=False) == JobStatus.STARTED]
+
+
+def forget_worker(conn: Redis, name: str):
+    with conn.pipeline() as pipe:
+        pipe.zrem(WORKERS_KEY, name)
+        pipe.delete(worker_key(name), state_key(name))
+        pipe.publish(STATE_CHANNEL, orjson.dumps({"worker": name, "gone": True}))
+        pipe.execute()
+
+
+# The gateway's view of the pool, in place of a ModelSwitcher: a model is resident (and
+# ready) if it is on any worker, and requests for it are routed to that worker's
+# instance. active_model and backend_state are those of the worker that changed last.
+class PoolView:
+    def __init__(self, conn: Redis):
+        self.conn = conn
+        self._workers: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        self._resident: Dict[str, Dict[str, Any]] = {}
+
+    def _latest(self) -> Dict[str, Any]:
+        return max(self._workers.values(), key=lambda s: s.get("updated_at") or "", default={})
+
+    @property
+    def active_model(self) -> Optional[str]:
+        return self._latest().get("active_model")
+
+    @property
+    def backend_state(self) -> str:
+        return self._latest().get("backend_state", "idle")
+
+    @property
+    def switching(self) -> bool:
+        return any(s["switching"] for s in self._workers.values())
+
+    @property
+    def resident(self) -> Dict[str, Dict[str, Any]]:
+        return self._resident
+
+    def is_ready(self, model: Optional[str]) -> bool:
+        return self.resident.get(model, {}).get("state") == "ready"
+
+    def resident_models(self) -> Set[str]:
+        return {m for m, info in self.resident.items() if info.get("state") != "failed"}
+
+    def _apply(self, data: Dict[str, Any]):
+        worker = data.get("worker")
+        if not worker:
+            return
+        if data.get("gone"):
+            self._workers.pop(worker, None)
+            self._versions.pop(worker, None)
+        else:
+            version = int(data.get("version") or 0)
+            if version <= self._versions.get(worker, 0):
+                return
+            self._versions[worker] = version
+            self._workers[worker] = parse_state(data)
+        self._merge()
+
+    def _merge(self):
+        # A model loaded on several workers is routed to a ready instance if there is one.
+        resident: Dict[str, Dict[str, Any]] = {}
+        for worker, state in sorted(self._workers.items()):
+            for model, info in state["resident"].items():
+                current = resident.get(model)
+                if current is None or (current.get("state") != "ready" and info.get("state") == "ready"):
+                    resident[model] = {**info, "worker": worker}
+        self._resident = resident
+        set_backend_routes({m: (info.get("host"), info["port"]) for m, info in resident.items()})
+
+    def _load(self):
+        names = [n.decode() for n in self.conn.zrange(WORKERS_KEY, 0, -1)]
+        with self.conn.pipeline() as pipe:
+            for name in names:
+                pipe.hgetall(state_key(name))
+            rows = pipe.execute()
+        self._workers, self._versions = {}, {}
+        for name, raw in zip(names, rows):
+            if raw:
+                self._apply({**{k.decode(): v.decode() for k, v in raw.items()}, "worker": name})
+        self._merge()
+
+    async def follow_shared_state(self):
+        while True:
+            aconn = get_async_redis_conn()
+            try:
+                async with aconn.pubsub() as pubsub:
+                    await pubsub.subscribe(STATE_CHANNEL)
+                    # Load after subscribing so no change can slip in between.
+                    await asyncio.to_thread(self._load)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._apply(orjson.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Pool state subscription lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await aconn.aclose()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from redis import Redis
+
+from .metrics import METRICS
+from .pool import live_workers, pool_resident_models
+
+log = logging.getLogger(__name__)
+
+DEMAND_PREFIX = "llm:demand"
+RECENT_KEY = f"{DEMAND_PREFIX}:recent"
+PINNED_KEY = "llm:preload:pinned"
+# Held by the worker preloading a model, so idle workers in a pool do not all load it.
+CLAIM_PREFIX = "llm:preload:claim"
+
+# Recent demand is an exponentially decaying arrival count per model: each arrival
+# decays the stored score to now and adds one, so score/half-life tracks the rate.
+# The arrival is also counted under its hour of (local) day in a per-day hash.
+_ARRIVE_LUA = """
+local now, half_life = tonumber(ARGV[2]), tonumber(ARGV[3])
+local vals = redis.call('hmget', KEYS[1], ARGV[1], ARGV[1] .. '|t')
+local score = tonumber(vals[1]) or 0
+local t = tonumber(vals[2]) or now
+score = score * math.pow(0.5, math.max(now - t, 0) / half_life) + 1
+redis.call('hset', KEYS[1], ARGV[1], tostring(score), ARGV[1] .. '|t', tostring(now))
+redis.call('hincrby', KEYS[2], ARGV[4], 1)
+redis.call('expire', KEYS[2], ARGV[5])
+"""
+
+
+def day_key(ts: float) -> str:
+    return f"{DEMAND_PREFIX}:day:{time.strftime('%Y%m%d', time.localtime(ts))}"
+
+
+async def record_arrival(aconn, cfg, model: Optional[str], switcher=None):
+    pcfg = cfg.gateway.get("preload", {})
+    # Runs before the body is validated, so model may be anything.
+    if not isinstance(model, str) or model not in cfg.models.get("models", {}):
+        return
+    if switcher is not None:
+        METRICS.inc("llm_model_hits_total", model=model, outcome="warm" if switcher.is_ready(model) else "cold")
+    if not pcfg.get("enabled", True):
+        return
+    now = time.time()
+    await aconn.register_script(_ARRIVE_LUA)(
+        keys=[RECENT_KEY, day_key(now)],
+        args=[
+            model,
+            now,
+            float(pcfg.get("recent_half_life_sec", 1800)),
+            f"{model}|{time.localtime(now).tm_hour}",
+            (int(pcfg.get("history_days", 14)) + 1) * 86400,
+        ],
+    )
+
+
+def demand_scores(conn: Redis, cfg, models: Iterable[str], now: Optional[float] = None) -> Dict[str, float]:
+    # Expected near-term demand per model: the decayed recent arrivals plus, weighted by
+    # time_of_day_weight, the mean arrivals in this hour and the next on previous days.
+    pcfg = cfg.gateway.get("preload", {})
+    now = time.time() if now is None else now
+    half_life = float(pcfg.get("recent_half_life_sec", 1800))
+    days = int(pcfg.get("history_days", 14))
+    hours = [time.localtime(now).tm_hour, time.localtime(now + 3600).tm_hour]
+    models = sorted(set(models))
+    with conn.pipeline(transaction=False) as pipe:
+        pipe.hgetall(RECENT_KEY)
+        for d in range(1, days + 1):
+            pipe.hmget(day_key(now - d * 86400), [f"{m}|{h}" for m in models for h in hours])
+        recent, *history = pipe.execute()
+    recent = {k.decode(): float(v) for k, v in recent.items()}
+    weight = float(pcfg.get("time_of_day_weight", 1.0))
+    scores = {}
+    for i, model in enumerate(models):
+        age = max(now - recent.get(f"{model}|t", now), 0.0)
+        score = recent.get(model, 0.0) * math.pow(0.5, age / half_life)
+        counts = [int(row[i * len(hours) + j] or 0) for row in history for j in range(len(hours))]
+        scores[model] = round(score + weight * sum(counts) / max(days, 1), 3)
+    return scores
+
+
+def pinned_model(conn: Redis, cfg) -> Optional[str]:
+    pinned = conn.get(PINNED_KEY)
+    return pinned.decode() if pinned else cfg.gateway.get("preload", {}).get("pinned_model")
+
+
+def set_pinned_model(conn: Redis, model: Optional[str]):
+    if model:
+        conn.set(PINNED_KEY, model)
+    else:
+        conn.delete(PINNED_KEY)
+
+
+# Runs in the worker: once the queue has been idle for idle_sec, loads the pinned
+# model, or else the model with the highest demand score. Hysteresis keeps it from
+# flapping: a loaded model is replaced only after min_dwell_sec, and only by one whose
+# score beats it by switch_margin. The load itself goes through preload, which the
+# engine runs behind its switch barrier and aborts when real work arrives.
+class Preloader:
+    def __init__(self, cfg, conn: Redis, scheduler, switcher, busy: Callable[[], bool], preload: Callable[[str], Awaitable[bool]]):
+        pcfg = cfg.gateway.get("preload", {})
+        self.cfg = cfg
+        self.conn = conn
+        self.scheduler = scheduler
+        self.switcher = switcher
+        self.busy = busy
+        self.preload = preload
+        self.interval_sec = float(pcfg.get("interval_sec", 10))
+        self.idle_sec = float(pcfg.get("idle_sec", 60))
+        self.min_dwell_sec = float(pcfg.get("min_dwell_sec", 600))
+        self.switch_margin = float(pcfg.get("switch_margin", 0.5))
+        self.min_score = float(pcfg.get("min_score", 1.0))
+        self._idle_since: Optional[float] = None
+        self._active = switcher.active_model
+        self._active_since = time.monotonic()
+
+    def _queue_empty(self) -> bool:
+        return not self.scheduler.pending_heads() and not self.scheduler.queue.count
+
+    def choose(self) -> Optional[Tuple[str, str]]:
+        # (model, reason) to load now, or None to keep the current one.
+        active = self.switcher.active_model
+        # Another worker's switch may be loading the very model we would pick.
+        if any(i.get("switching") for n, i in live_workers(self.conn, self.cfg).items() if n != self.switcher.worker):
+            return None
+        # In a pool, a model loaded on another worker is already warm.
+        resident = self.switcher.resident_models() | pool_resident_models(self.conn, self.cfg)
+        pinned = pinned_model(self.conn, self.cfg)
+        if pinned:
+            return (pinned, "pinned") if pinned not in resident else None
+        scores = demand_scores(self.conn, self.cfg, self.cfg.models.get("models", {}))
+        best = max(scores, key=scores.get, default=None)
+        if best is None or best in resident or scores[best] < self.min_score:
+            return None
+        if active is not None:
+            if time.monotonic() - self._active_since < self.min_dwell_sec:
+                return None
+            if scores[best] < scores.get(active, 0.0) * (1 + self.switch_margin):
+                return None
+        return best, "predicted"
+
+    async def _tick(self):
+        now = time.monotonic()
+        if self.switcher.active_model != self._active:
+            self._active, self._active_since = self.switcher.active_model, now
+        if self.busy() or self.switcher.switching or not await asyncio.to_thread(self._queue_empty):
+            self._idle_since = None
+            return
+        if self._idle_since is None:
+            self._idle_since = now
+        if now - self._idle_since < self.idle_sec:
+            return
+        choice = await asyncio.to_thread(self.choose)
+        if choice is None:
+            return
+        model, reason = choice
+        claim = f"{CLAIM_PREFIX}:{model}"
+        ttl = int(self.cfg.gateway.get("timeouts", {}).get("SWITCH_TIMEOUT_SEC", 900))
+        if not await asyncio.to_thread(self.conn.set, claim, self.switcher.worker, nx=True, ex=ttl):
+            return
+        try:
+            log.info("Queue idle for %.0fs, preloading %s (%s)", now - self._idle_since, model, reason)
+            METRICS.inc("llm_preloads_total", model=model, reason=reason)
+            if not await self.preload(model):
+                log.info("Preload of %s aborted: work for another model arrived", model)
+        finally:
+            self._idle_since = None
+            await asyncio.to_thread(self.conn.delete, claim)
+
+    async def run(self):
+        while True:
+            try:
+                await self._tick()
+            except Exception:
+                log.warning("Preload failed", exc_info=True)
+            await asyncio.sleep(self.interval_sec)
@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import asyncio
+import ctypes
+import logging
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", ".gguf")
+_CHUNK = 16 * 1024 * 1024
+_WINDOW = 1024 * 1024 * 1024
+_PAGE = mmap.PAGESIZE
+
+_libc = None
+
+
+def _mincore_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_void_p]
+        _libc = libc
+    return _libc
+
+
+def _resident(fd: int, offset: int, length: int) -> int:
+    # Bytes of [offset, offset + length) in the page cache, via mincore on a throwaway
+    # mapping (nothing is read). offset must be page-aligned.
+    libc = _mincore_libc()
+    addr = libc.mmap(None, length, mmap.PROT_READ, mmap.MAP_SHARED, fd, offset)
+    if addr in (None, ctypes.c_void_p(-1).value):
+        raise OSError(ctypes.get_errno(), "mmap failed")
+    try:
+        pages = (length + _PAGE - 1) // _PAGE
+        vec = (ctypes.c_ubyte * pages)()
+        if libc.mincore(addr, length, vec) != 0:
+            raise OSError(ctypes.get_errno(), "mincore failed")
+        return min((pages - bytes(vec).count(0)) * _PAGE, length)
+    finally:
+        libc.munmap(addr, length)
+
+
+def weight_files(cfg, model: str) -> List[Path]:
+    # The checkpoint vLLM will read for model, resolved the way start_model passes it: a
+    # local directory as is, otherwise the repo's snapshot in the Hugging Face cache.
+    source = str(cfg.models.get("models", {}).get(model, {}).get("source", {}).get("value", ""))
+    if not source:
+        return []
+    if source.startswith("/"):
+        return _collect(Path(source)) if Path(source).is_dir() else []
+    hf_home = cfg.gateway.get("paths", {}).get("hf_home", "/var/lib/huggingface")
+    repo = Path(hf_home) / "hub" / ("models--" + source.replace("/", "--"))
+    ref = repo / "refs" / "main"
+    if ref.is_file():
+        snapshot = repo / "snapshots" / ref.read_text().strip()
+    elif (repo / "snapshots").is_dir():
+        snapshot = max((repo / "snapshots").iterdir(), key=lambda p: p.stat().st_mtime, default=None)
+    else:
+        return []
+    return _collect(snapshot) if snapshot is not None and snapshot.is_dir() else []
+
+
+def _collect(root: Path) -> List[Path]:
+    # Shards in name order, which is the order vLLM loads them. HF snapshots are symlinks into blobs/.
+    files = {}
+    for path in sorted(root.rglob("*")):
+        if path.name.endswith(WEIGHT_SUFFIXES) and path.is_file():
+            files.setdefault(path.resolve(), None)
+    return list(files)
+
+
+def checkpoint_residency(files: List[Path]) -> Tuple[int, int]:
+    # (bytes in page cache, total bytes) of the given files.
+    cached = total = 0
+    for path in files:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            size = os.fstat(fd).st_size
+            total += size
+            for offset in range(0, size, _WINDOW):
+                cached += _resident(fd, offset, min(_WINDOW, size - offset))
+        finally:
+            os.close(fd)
+    return cached, total
+
+
+def _mem_free_bytes() -> int:
+    with open("/proc/meminfo") as f:
+        for line in f:
+            if line.startswith("MemFree:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def stage_files(
+    files: List[Path],
+    max_bytes: int,
+    min_free_bytes: int,
+    max_bytes_per_sec: float,
+    should_stop: Callable[[], bool],
+    should_pause: Callable[[], bool] = lambda: False,
+) -> int:
+    # Reads the files sequentially in large chunks so they land in the page cache, skipping
+    # chunks already there. Stops at max_bytes read, when free memory drops below
+    # min_free_bytes (further reads would only evict other cached data), or when asked;
+    # throttled to max_bytes_per_sec. Returns the bytes read from disk.
+    buf = memoryview(bytearray(_CHUNK))
+    staged = 0
+    began = time.monotonic()
+    for path in files:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_SEQUENTIAL)
+            offset = 0
+            while offset < size:
+                if should_stop():
+                    return staged
+                if should_pause():
+                    time.sleep(1)
+                    continue
+                n = min(_CHUNK, size - offset)
+                if _resident(fd, offset, n) < n:
+                    if staged >= max_bytes or _mem_free_bytes() < min_free_bytes:
+                        return staged
+                    staged += os.preadv(fd, [buf[:n]], offset)
+                    if max_bytes_per_sec > 0:
+                        ahead = staged / max_bytes_per_sec - (time.monotonic() - began)
+                        if ahead > 0:
+                            time.sleep(ahead)
+                offset += n
+        finally:
+            os.close(fd)
+    return staged
+
+
+# Runs in the worker: while the loaded model serves, the weights of the next model the
+# queue will need are read into the page cache, so its switch loads from memory.
+class Prestager:
+    def __init__(self, cfg, scheduler, switcher):
+        pcfg = cfg.gateway.get("prestage", {})
+        self.cfg = cfg
+        self.scheduler = scheduler
+        self.switcher = switcher
+        self.interval_sec = float(pcfg.get("interval_sec", 5))
+        self.max_bytes = int(float(pcfg.get("max_gb", 64)) * 1024**3)
+        self.min_free_bytes = int(float(pcfg.get("min_free_gb", 16)) * 1024**3)
+        self.max_bytes_per_sec = float(pcfg.get("max_mb_per_sec", 1000)) * 1024**2
+        self.target: Optional[str] = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def next_model(self) -> Optional[str]:
+        # The model whose oldest pending job is due first, among models not resident:
+        # the model the scheduler switches to next.
+        resident = self.switcher.resident_models()
+        heads = {}
+        for (_, model), score in self.scheduler.pending_heads().items():
+            if model not in resident:
+                heads[model] = min(score, heads.get(model, score))
+        return min(heads, key=heads.get) if heads else None
+
+    def _stage(self, model: str, stop: threading.Event):
+        began = time.monotonic()
+        try:
+            staged = stage_files(
+                weight_files(self.cfg, model),
+                self.max_bytes,
+                self.min_free_bytes,
+                self.max_bytes_per_sec,
+                should_stop=stop.is_set,
+                # The loader of a switch in progress needs the disk more than we do.
+                should_pause=lambda: self.switcher.switching,
+            )
+        except OSError:
+            log.warning("Prestaging %s failed", model, exc_info=True)
+            return
+        if staged:
+            METRICS.inc("llm_prestage_bytes_total", staged, model=model)
+            log.info("Prestaged %.1f GiB of %s in %.0fs", staged / 1024**3, model, time.monotonic() - began)
+
+    def _retarget(self, model: Optional[str]):
+        self._stop.set()
+        self.target = model
+        self._stop = threading.Event()
+        if model is not None:
+            self._task = asyncio.create_task(asyncio.to_thread(self._stage, model, self._stop))
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    model = await asyncio.to_thread(self.next_model)
+                    # A finished run is not repeated for an unchanged target.
+                    if model != self.target:
+                        self._retarget(model)
+                except Exception:
+                    log.warning("Prestage target lookup failed", exc_info=True)
+                await asyncio.sleep(self.interval_sec)
+        finally:
+            self._stop.set()
@@ -1,13 +1,110 @@
 from __future__ import annotations
 
-from typing import Any, Dict
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
 import httpx
 
+from .backend_client import get_backend_client
+from .metrics import METRICS
+
+CHAT_PATH = "/v1/chat/completions"
+
+
+def observe_completion(model: str, elapsed: float, usage: Optional[Dict[str, Any]]):
+    METRICS.observe("llm_inference_seconds", elapsed, model=model)
+    tokens = (usage or {}).get("completion_tokens")
+    if tokens and elapsed > 0:
+        METRICS.observe("llm_tokens_per_second", tokens / elapsed, model=model)
+
 
 async def call_backend_chat(model_cfg: Dict[str, Any], payload: Dict[str, Any], timeout_sec: int = 1200) -> Dict[str, Any]:
-    port = int(model_cfg.get("backend", {}).get("port", 8001))
-    url = f"http://127.0.0.1:{port}/v1/chat/completions"
-    async with httpx.AsyncClient(timeout=timeout_sec) as client:
-        resp = await client.post(url, json=payload)
+    backend = get_backend_client()
+    began = time.monotonic()
+    resp = await backend.for_model(model_cfg, payload.get("model")).post(CHAT_PATH, json=payload, timeout=backend.timeout(timeout_sec))
+    resp.raise_for_status()
+    result = resp.json()
+    observe_completion(payload.get("model", ""), time.monotonic() - began, result.get("usage"))
+    return result
+
+
+async def open_backend_chat(model_cfg: Dict[str, Any], body: bytes, timeout_sec: int = 1200, model: Optional[str] = None) -> httpx.Response:
+    # Sends the client's request bytes unchanged and returns the response unread,
+    # so the caller can relay its bytes (and status) as they arrive.
+    backend = get_backend_client()
+    client = backend.for_model(model_cfg, model)
+    request = client.build_request(
+        "POST", CHAT_PATH, content=body, headers={"Content-Type": "application/json"}, timeout=backend.timeout(timeout_sec)
+    )
+    return await client.send(request, stream=True)
+
+
+async def read_backend_chat(resp: httpx.Response) -> bytes:
+    try:
+        return await resp.aread()
+    finally:
+        await resp.aclose()
+
+
+async def relay_backend_stream(resp: httpx.Response, model: str, began: float) -> AsyncIterator[bytes]:
+    first = True
+    try:
+        async for chunk in resp.aiter_raw():
+            if first:
+                METRICS.observe("llm_backend_ttft_seconds", time.monotonic() - began, model=model)
+                first = False
+            yield chunk
+    finally:
+        await resp.aclose()
+    # The relayed stream is not parsed, so there is no token count here.
+    METRICS.observe("llm_inference_seconds", time.monotonic() - began, model=model)
+
+
+async def stream_backend_events(model_cfg: Dict[str, Any], payload: Dict[str, Any], timeout_sec: int = 1200) -> AsyncIterator[str]:
+    backend = get_backend_client()
+    model, began, first = payload.get("model", ""), time.monotonic(), True
+    client = backend.for_model(model_cfg, model)
+    async with client.stream("POST", CHAT_PATH, json={**payload, "stream": True}, timeout=backend.timeout(timeout_sec)) as resp:
+        if resp.status_code >= 400:
+            await resp.aread()
         resp.raise_for_status()
-        return resp.json()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                return
+            if first:
+                METRICS.observe("llm_backend_ttft_seconds", time.monotonic() - began, model=model)
+                first = False
+            yield data
+
+
+# Rebuilds a chat.completion response from streamed chat.completion.chunk events.
+class StreamAccumulator:
+    def __init__(self):
+        self.meta: Dict[str, Any] = {}
+        self.choices: Dict[int, Dict[str, Any]] = {}
+        self.usage: Dict[str, Any] | None = None
+
+    def add(self, chunk: Dict[str, Any]):
+        if not self.meta:
+            self.meta = {k: chunk.get(k) for k in ("id", "created", "model")}
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices", []):
+            idx = choice.get("index", 0)
+            acc = self.choices.setdefault(idx, {"index": idx, "message": {"role": "assistant", "content": ""}, "finish_reason": None})
+            delta = choice.get("delta") or {}
+            if delta.get("role"):
+                acc["message"]["role"] = delta["role"]
+            if delta.get("content"):
+                acc["message"]["content"] += delta["content"]
+            if choice.get("finish_reason"):
+                acc["finish_reason"] = choice["finish_reason"]
+
+    def result(self) -> Dict[str, Any]:
+        out = {**self.meta, "object": "chat.completion", "choices": [self.choices[i] for i in sorted(self.choices)]}
+        if self.usage is not None:
+            out["usage"] = self.usage
+        return out
@@ -1,14 +1,44 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from redis import Redis
+import weakref
+
+from redis import ConnectionPool, Redis
+from redis.asyncio import ConnectionPool as AsyncConnectionPool
+from redis.asyncio import Redis as AsyncRedis
 from rq import Queue
 
+QUEUE_NAME = "llm_jobs"
+
+_POOL: ConnectionPool | None = None
+# redis.asyncio connections are bound to the loop that opened them, so each loop gets its own pool.
+_ASYNC_POOLS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncConnectionPool]" = weakref.WeakKeyDictionary()
+
+
+def _redis_url() -> str:
+    return os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+
+
+def get_redis_conn() -> Redis:
+    global _POOL
+    if _POOL is None:
+        _POOL = ConnectionPool.from_url(_redis_url())
+    return Redis(connection_pool=_POOL)
+
+
+def get_async_redis_conn() -> AsyncRedis:
+    loop = asyncio.get_running_loop()
+    pool = _ASYNC_POOLS.get(loop)
+    if pool is None:
+        pool = _ASYNC_POOLS[loop] = AsyncConnectionPool.from_url(_redis_url())
+    # The client does not own the pool, so aclose() returns connections instead of dropping them.
+    return AsyncRedis(connection_pool=pool)
+
 
-def get_redis_conn():
-    url = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
-    return Redis.from_url(url)
+def get_queue(connection: Redis | None = None) -> Queue:
+    return Queue(QUEUE_NAME, connection=connection or get_redis_conn(), default_timeout=7200)
 
 
-def get_queue() -> Queue:
-    return Queue("llm_jobs", connection=get_redis_conn(), default_timeout=7200)
+async def queue_length(aconn: AsyncRedis) -> int:
+    return await aconn.llen(Queue.redis_queue_namespace_prefix + QUEUE_NAME)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+RATE_PREFIX = "llm:ratelimit"
+_DEFAULT_PER_MINUTE = {"requests": 120, "tokens": 0}
+
+# Token bucket refilled continuously at ARGV[2] per second up to ARGV[1]. A positive
+# cost is taken only if the bucket holds it; a negative cost is a refund. Returns
+# {allowed, seconds until the cost would fit}. Server time keeps every gateway on
+# one clock.
+_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = math.min(tonumber(ARGV[3]), capacity)
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local b = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+if cost > 0 and tokens < cost then
+  return {0, tostring((cost - tokens) / rate)}
+end
+tokens = math.min(capacity, tokens - cost)
+redis.call('hset', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('pexpire', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {1, '0'}
+"""
+
+
+def client_id(api_key: Optional[str], host: Optional[str]) -> str:
+    # API keys are hashed so they never appear in Redis key names.
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return f"ip:{host or 'unknown'}"
+
+
+def bucket_key(kind: str, client: str) -> str:
+    return f"{RATE_PREFIX}:{kind}:{client}"
+
+
+def bucket_limits(cfg, kind: str) -> Optional[Tuple[float, float]]:
+    # (capacity, refill per second) for the "requests" or "tokens" bucket, None if unlimited.
+    rl = cfg.gateway.get("security", {}).get("rate_limit", {})
+    if not rl.get("enabled", True):
+        return None
+    per_minute = float(rl.get(f"{kind}_per_minute", _DEFAULT_PER_MINUTE[kind]) or 0)
+    if per_minute <= 0:
+        return None
+    return float(rl.get(f"{kind}_burst") or per_minute), per_minute / 60
+
+
+async def take(aconn: AsyncRedis, limits: Optional[Tuple[float, float]], kind: str, client: str, cost: float = 1) -> float:
+    # Seconds to wait before retrying, or 0 if the cost was taken. Fails open if Redis is down.
+    if limits is None:
+        return 0.0
+    try:
+        allowed, retry_after = await aconn.register_script(_BUCKET_LUA)(keys=[bucket_key(kind, client)], args=[*limits, cost])
+    except Exception:
+        log.warning("Rate limiter unavailable, letting request through", exc_info=True)
+        return 0.0
+    if allowed:
+        return 0.0
+    METRICS.inc("llm_rate_limited_total", kind=kind)
+    return max(float(retry_after), 0.001)
+
+
+def refund(conn: Redis, cfg, charge: Optional[Dict[str, Any]], used: Optional[int] = None):
+    # Returns the unused part of an up-front token charge (all of it if nothing was generated).
+    if not charge:
+        return
+    limits = bucket_limits(cfg, "tokens")
+    amount = charge["tokens"] - (used or 0)
+    if limits is None or amount <= 0:
+        return
+    try:
+        conn.register_script(_BUCKET_LUA)(keys=[bucket_key("tokens", charge["client"])], args=[*limits, -amount])
+    except Exception:
+        log.warning("Could not refund %s tokens", amount, exc_info=True)
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+async def charge_tokens(aconn: AsyncRedis, request: Request, max_tokens: int) -> Dict[str, Any]:
+    # Charges max_tokens against the caller's token budget; the worker or the sync
+    # path refunds what the completion did not use.
+    limits = bucket_limits(request.app.state.cfg, "tokens")
+    if limits is None:
+        return {}
+    client = client_id(request.headers.get("x-api-key"), request.client.host if request.client else None)
+    retry_after = await take(aconn, limits, "tokens", client, max_tokens)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Token rate limit exceeded", headers=retry_after_header(retry_after))
+    # The bucket takes at most its capacity, so that is all a refund may give back.
+    return {"client": client, "tokens": min(max_tokens, limits[0])}
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Dict, Optional
+
+import orjson
+from redis import Redis
+
+log = logging.getLogger(__name__)
+
+RESULT_PREFIX = "llm:result"
+_CHUNK = 64 * 1024
+_GZIP = 31
+SPILL_PROBE_KEY = f"{RESULT_PREFIX}:spill_probe"
+# ttl <= 0 (rq's "keep forever") still needs a file expiry; this is far enough out.
+_FOREVER_SEC = 10 * 365 * 86400
+_PROBE_RECHECK_SEC = 60
+_probe_checked: Dict[str, Any] = {"at": 0.0, "ok": False}
+
+# Job results are stored outside rq as gzip'd JSON in one hash per job: "size" (JSON
+# bytes) plus either "data" (the gzip blob, when it fits inline_max_bytes) or "file"
+# (the sha256 of the JSON, naming a file under spill_dir). Spilled files are shared
+# by identical results and their mtime holds the expiry, which the sweeper enforces,
+# so Redis holds at most inline_max_bytes per job.
+#
+# The gateway serves spilled files, so a worker (possibly on another host) spills only
+# while it sees the gateway's spill_dir: the gateway leaves a random token in a probe
+# file there and in Redis, and a worker whose copy of the file does not match keeps
+# every result inline.
+
+
+def result_key(job_id: str) -> str:
+    return f"{RESULT_PREFIX}:{job_id}"
+
+
+def _spill_dir(cfg) -> Path:
+    return Path(cfg.gateway.get("results", {}).get("spill_dir", "/var/lib/llm-switchboard/results"))
+
+
+def spill_path(cfg, digest: str) -> Path:
+    return _spill_dir(cfg) / digest[:2] / f"{digest}.json.gz"
+
+
+def publish_spill_probe(conn: Redis, cfg):
+    token = uuid.uuid4().hex
+    root = _spill_dir(cfg)
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        tmp = root / f".probe.{token}"
+        tmp.write_text(token)
+        os.replace(tmp, root / ".probe")
+    except OSError:
+        log.warning("Cannot write to %s; results will be kept in Redis", root, exc_info=True)
+        conn.delete(SPILL_PROBE_KEY)
+        return
+    conn.set(SPILL_PROBE_KEY, token)
+
+
+def _can_spill(conn: Redis, cfg) -> bool:
+    now = time.time()
+    if now - _probe_checked["at"] < _PROBE_RECHECK_SEC:
+        return _probe_checked["ok"]
+    token = conn.get(SPILL_PROBE_KEY)
+    try:
+        ok = token is not None and (_spill_dir(cfg) / ".probe").read_text() == token.decode()
+    except OSError:
+        ok = False
+    if not ok and (_probe_checked["ok"] or not _probe_checked["at"]):
+        log.warning("%s is not the gateway's spill_dir; keeping large results in Redis", _spill_dir(cfg))
+    _probe_checked.update(at=now, ok=ok)
+    return ok
+
+
+def _spill(path: Path, blob: bytes, expires_at: float):
+    try:
+        if os.stat(path).st_mtime < expires_at:
+            os.utime(path, (expires_at, expires_at))
+        return
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    tmp.write_bytes(blob)
+    os.utime(tmp, (expires_at, expires_at))
+    os.replace(tmp, path)
+
+
+def store_result(conn: Redis, cfg, job_id: str, result: Any, ttl: int) -> Dict[str, Any]:
+    rcfg = cfg.gateway.get("results", {})
+    raw = orjson.dumps(result)
+    comp = zlib.compressobj(int(rcfg.get("compress_level", 6)), zlib.DEFLATED, _GZIP)
+    blob = comp.compress(raw) + comp.flush()
+    entry: Dict[str, Any] = {"size": len(raw)}
+    if len(blob) <= int(rcfg.get("inline_max_bytes", 65536)) or not _can_spill(conn, cfg):
+        entry["data"] = blob
+    else:
+        entry["file"] = hashlib.sha256(raw).hexdigest()
+        _spill(spill_path(cfg, entry["file"]), blob, time.time() + (ttl if ttl > 0 else _FOREVER_SEC))
+    key = result_key(job_id)
+    with conn.pipeline() as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping=entry)
+        if ttl > 0:
+            pipe.expire(key, ttl)
+        pipe.execute()
+    return entry
+
+
+def open_result(cfg, entry: Dict[bytes, bytes]) -> BinaryIO:
+    # entry is the raw HGETALL of result_key; raises FileNotFoundError if the spill file is gone.
+    if b"data" in entry:
+        return io.BytesIO(entry[b"data"])
+    return open(spill_path(cfg, entry[b"file"].decode()), "rb")
+
+
+def decode_result(cfg, entry: Dict[bytes, bytes]) -> Optional[Any]:
+    try:
+        with open_result(cfg, entry) as fh:
+            return orjson.loads(zlib.decompress(fh.read(), _GZIP))
+    except FileNotFoundError:
+        log.warning("Spilled result %s is missing", entry.get(b"file"))
+        return None
+
+
+def load_result(conn: Redis, cfg, job_id: str) -> Optional[Any]:
+    # None if the job has no stored result (not finished, expired, or finished before the store existed).
+    entry = conn.hgetall(result_key(job_id))
+    return decode_result(cfg, entry) if entry else None
+
+
+async def read_result(cfg, entry: Dict[bytes, bytes]) -> Optional[Any]:
+    if b"data" in entry:
+        return decode_result(cfg, entry)
+    return await asyncio.to_thread(decode_result, cfg, entry)
+
+
+async def iter_result(fh: BinaryIO) -> AsyncIterator[bytes]:
+    # Decompresses chunk by chunk, so a spilled result is never held in memory whole.
+    d = zlib.decompressobj(_GZIP)
+    try:
+        while chunk := await asyncio.to_thread(fh.read, _CHUNK):
+            if out := d.decompress(chunk):
+                yield out
+        if tail := d.flush():
+            yield tail
+    finally:
+        fh.close()
+
+
+def sweep_spilled(cfg) -> int:
+    removed, now = 0, time.time()
+    root = _spill_dir(cfg)
+    if not root.is_dir():
+        return 0
+    for sub in root.iterdir():
+        if not sub.is_dir():
+            continue
+        for path in sub.iterdir():
+            try:
+                if path.stat().st_mtime < now:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+async def run_sweeper(cfg, interval_sec: float):
+    while True:
+        try:
+            removed = await asyncio.to_thread(sweep_spilled, cfg)
+            if removed:
+                log.info("Removed %d expired spilled results", removed)
+        except Exception:
+            log.warning("Spilled result sweep failed", exc_info=True)
+        await asyncio.sleep(interval_sec)
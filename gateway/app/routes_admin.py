@@ -1,13 +1,22 @@
 from __future__ import annotations
 
+import asyncio
 import time
 
 from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 
 from .auth import require_admin_api_key
+from .cache import cache_stats
 from .config import get_admin_api_key
-from .models import HealthResponse, QueueInfoResponse, StatusResponse, SwitchRequest
-from .queue import get_queue, get_redis_conn
+from .eta import queue_overview
+from .metrics import METRICS, render_metrics
+from .models import HealthResponse, PinRequest, QueueInfoResponse, StatusResponse, SwitchRequest
+from .pool import live_workers
+from .preload import pinned_model, set_pinned_model
+from .queue import get_async_redis_conn, get_queue, queue_length
+from .scheduler import enqueue_job, pending_by_class, pending_by_lane, pending_by_model, priority_classes, switches_avoided, wait_percentiles
+from .switcher import recent_switches
 
 router = APIRouter(tags=["admin"])
 START_TS = time.time()
@@ -24,33 +33,74 @@ async def health(request: Request):
             raise HTTPException(status_code=401, detail="Invalid or missing admin API key")
     redis_ok = True
     try:
-        get_redis_conn().ping()
+        await get_async_redis_conn().ping()
     except Exception:
         redis_ok = False
     return HealthResponse(status="ok" if redis_ok else "degraded", redis_ok=redis_ok)
 
 
+def _scrape(conn) -> str:
+    # This process's own observations go out first, so a scrape is never a flush interval behind.
+    METRICS.flush(conn)
+    return render_metrics(conn, pending_by_lane(conn))
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    if not request.app.state.cfg.gateway.get("security", {}).get("metrics_without_api_key", False):
+        if request.headers.get("x-api-key") != get_admin_api_key():
+            raise HTTPException(status_code=401, detail="Invalid or missing admin API key")
+    text = await asyncio.to_thread(_scrape, get_queue().connection)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+
 @router.get("/status", response_model=StatusResponse)
 async def status(request: Request, _: None = Depends(require_admin_api_key)):
-    q = get_queue()
+    conn = get_queue().connection
     sw = request.app.state.switcher
+    queue_len, avoided, cache, switches, workers = await asyncio.gather(
+        queue_length(get_async_redis_conn()),
+        asyncio.to_thread(switches_avoided, conn),
+        asyncio.to_thread(cache_stats, conn),
+        asyncio.to_thread(recent_switches, conn),
+        asyncio.to_thread(live_workers, conn, request.app.state.cfg),
+    )
     return StatusResponse(
         active_model=sw.active_model,
         switching=sw.switching,
         backend_state=sw.backend_state,
-        queue_length=len(q),
+        resident_models=sw.resident,
+        workers=workers,
+        queue_length=queue_len,
         uptime_sec=int(time.time() - START_TS),
+        switches_avoided=avoided,
+        cache=cache,
+        recent_switches=switches,
     )
 
 
 @router.get("/queue", response_model=QueueInfoResponse)
 async def queue_info(request: Request, _: None = Depends(require_admin_api_key)):
-    q = get_queue()
-    current_job = get_redis_conn().get("rq:worker:current_job")
+    aconn = get_async_redis_conn()
+    conn = get_queue().connection
+    queue_len, workers, pending, by_class, waits = await asyncio.gather(
+        queue_length(aconn),
+        asyncio.to_thread(live_workers, conn, request.app.state.cfg),
+        asyncio.to_thread(pending_by_model, conn),
+        asyncio.to_thread(pending_by_class, conn),
+        asyncio.to_thread(wait_percentiles, conn, priority_classes(request.app.state.cfg)),
+    )
     sw = request.app.state.switcher
+    overview = await asyncio.to_thread(queue_overview, conn, request.app.state.cfg, pending, sw.active_model)
+    running = sorted(j for info in workers.values() for j in info.get("running", []))
     return QueueInfoResponse(
-        queue_length=len(q),
-        current_job_id=current_job.decode() if current_job else None,
+        queue_length=queue_len,
+        pending_by_model=pending,
+        pending_by_class=by_class,
+        wait_percentiles=waits,
+        **overview,
+        current_job_id=running[0] if running else None,
+        running_job_ids=running,
         active_model=sw.active_model,
         switching=sw.switching,
         drain_mode=DRAIN_MODE,
@@ -61,16 +111,22 @@ async def queue_info(request: Request, _: None = Depends(require_admin_api_key))
 async def admin_switch(req: SwitchRequest, request: Request, _: None = Depends(require_admin_api_key)):
     if DRAIN_MODE:
         raise HTTPException(status_code=409, detail="Drain mode enabled")
-    q = get_queue()
-    sw = request.app.state.switcher
-    if len(q) == 0 and not sw.switching:
-        await sw.ensure_model_active(req.model)
-        return {"status": "switched", "active_model": sw.active_model}
-
-    job = q.enqueue("worker.tasks.admin_switch_job", kwargs={"model": req.model}, at_front=True)
+    # Backends belong to the workers, so the switch always goes through the queue (at its front).
+    job = await asyncio.to_thread(enqueue_job, get_queue(), "worker.tasks.admin_switch_job", req.model, {"model": req.model}, at_front=True)
     return {"status": "queued", "job_id": job.id}
 
 
+@router.post("/admin/pin")
+async def admin_pin(req: PinRequest, request: Request, _: None = Depends(require_admin_api_key)):
+    # The idle preloader keeps the pinned model loaded; null unpins (back to preload.pinned_model).
+    cfg = request.app.state.cfg
+    if req.model is not None and req.model not in cfg.models.get("models", {}):
+        raise HTTPException(status_code=404, detail=f"Unknown model: {req.model}")
+    conn = get_queue().connection
+    await asyncio.to_thread(set_pinned_model, conn, req.model)
+    return {"pinned_model": await asyncio.to_thread(pinned_model, conn, cfg)}
+
+
 @router.post("/admin/drain")
 async def admin_drain(_: None = Depends(require_admin_api_key)):
     global DRAIN_MODE
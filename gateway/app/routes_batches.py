@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from rq.job import Job
+
+from .auth import require_api_key
+from .batches import BatchParseError, batch_job_ids, batch_summary, create_batch, iter_batch_results, parse_batch
+from .completion import public_status, request_cancel
+from .jobstore import cancel_queued_job
+from .models import BatchCreateResponse, BatchStatusResponse
+from .queue import get_async_redis_conn, get_queue, get_redis_conn
+from .scheduler import priority_classes, resolve_priority
+
+router = APIRouter(prefix="/batches", tags=["batches"])
+
+
+async def _read_upload(request: Request, limit: int) -> bytes:
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f"Batch upload exceeds {limit} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+@router.post("", response_model=BatchCreateResponse)
+async def create_batch_route(request: Request, _: None = Depends(require_api_key)):
+    cfg = request.app.state.cfg
+    bcfg = cfg.gateway.get("batches", {})
+    raw = await _read_upload(request, int(float(bcfg.get("max_upload_mb", 256)) * 1024 * 1024))
+    # Lines without their own priority fall into the key's class, else batches.priority.
+    priority = resolve_priority(cfg, None, request.headers.get("x-api-key"), default=bcfg.get("priority", "batch"))
+    try:
+        items = await asyncio.to_thread(
+            parse_batch,
+            raw,
+            cfg.models.get("models", {}),
+            priority_classes(cfg),
+            int(bcfg.get("max_requests", 50000)),
+            cfg.gateway.get("security", {}).get("max_tokens_upper_bound"),
+        )
+    except BatchParseError as exc:
+        raise HTTPException(status_code=422, detail=exc.errors)
+
+    jobs_cfg = cfg.gateway.get("jobs", {})
+    batch_id, jobs = await asyncio.to_thread(
+        create_batch,
+        get_queue(),
+        items,
+        int(bcfg.get("ttl_sec", 604800)),
+        priority,
+        result_ttl=jobs_cfg.get("result_ttl_sec", 86400),
+        failure_ttl=jobs_cfg.get("failure_ttl_sec", 86400),
+    )
+    return BatchCreateResponse(
+        id=batch_id,
+        status="in_progress",
+        total=len(jobs),
+        status_url=f"/batches/{batch_id}",
+        results_url=f"/batches/{batch_id}/results",
+    )
+
+
+@router.get("/{batch_id}", response_model=BatchStatusResponse)
+async def get_batch(batch_id: str, _: None = Depends(require_api_key)):
+    summary = await batch_summary(get_async_redis_conn(), batch_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    summary["created_at"] = datetime.fromtimestamp(summary["created_at"], tz=timezone.utc).isoformat()
+    return BatchStatusResponse(**summary)
+
+
+@router.get("/{batch_id}/results")
+async def get_batch_results(batch_id: str, request: Request, _: None = Depends(require_api_key)):
+    aconn = get_async_redis_conn()
+    if await batch_summary(aconn, batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    headers = {"Content-Disposition": f'attachment; filename="{batch_id}.jsonl"'}
+    return StreamingResponse(iter_batch_results(aconn, request.app.state.cfg, batch_id), media_type="application/x-ndjson", headers=headers)
+
+
+def _cancel_jobs(job_ids, cfg):
+    # Queued jobs are dropped; running ones are soft-cancelled by their worker.
+    cancelled = cancelling = 0
+    conn = get_redis_conn()
+    for job in Job.fetch_many(job_ids, connection=conn):
+        status = public_status(job.get_status(refresh=False)) if job is not None else None
+        if status == "queued":
+            cancel_queued_job(job, cfg)
+            cancelled += 1
+        elif status == "running":
+            request_cancel(conn, cfg, job.id)
+            cancelling += 1
+    return cancelled, cancelling
+
+
+@router.post("/{batch_id}/cancel")
+async def cancel_batch(batch_id: str, request: Request, _: None = Depends(require_api_key)):
+    aconn = get_async_redis_conn()
+    if await batch_summary(aconn, batch_id) is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    cancelled = cancelling = 0
+    async for ids in batch_job_ids(aconn, batch_id):
+        dropped, signalled = await asyncio.to_thread(_cancel_jobs, ids, request.app.state.cfg)
+        cancelled += dropped
+        cancelling += signalled
+    return {"id": batch_id, "cancelled": cancelled, "cancelling": cancelling}
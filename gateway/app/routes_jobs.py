@@ -1,31 +1,31 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+from datetime import timezone
+from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request
-from rq.job import Job
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 
+from .admission import admit_request, release_admission
 from .auth import require_api_key
-from .models import JobCreateRequest, JobCreateResponse, JobResultResponse, JobStatusResponse
-from .queue import get_queue, get_redis_conn
+from .cache import ResponseCache, create_cached_job
+from .completion import TERMINAL_STATUSES, public_status, request_cancel
+from .eta import model_stats, queue_estimate, running_estimate
+from .jobstore import cancel_queued_job, fetch_job, job_options, job_summary
+from .models import JOB_OPTIONS, JobCreateRequest, JobCreateResponse, JobResultResponse, JobStatusResponse, JobWaitResponse
+from .preload import record_arrival
+from .queue import get_async_redis_conn, get_queue, get_redis_conn
+from .ratelimit import charge_tokens
+from .results import iter_result, load_result, open_result, result_key
+from .scheduler import enqueue_job
+from .streams import relay_job_stream
+from .webhooks import notify_webhook
 
 router = APIRouter(prefix="/jobs", tags=["jobs"])
 
 
-def _job_status(job: Job):
-    if job.is_finished:
-        return "succeeded"
-    if job.is_failed:
-        return "failed"
-    if job.get_status() == "canceled":
-        return "cancelled"
-    if job.get_status() in {"queued", "deferred", "scheduled"}:
-        return "queued"
-    if job.get_status() == "started":
-        return "running"
-    return "queued"
-
-
 def _iso(dt):
     if not dt:
         return None
@@ -35,70 +35,186 @@ def _iso(dt):
 
 
 @router.post("", response_model=JobCreateResponse)
-async def create_job(req: JobCreateRequest, _: None = Depends(require_api_key)):
+async def create_job(
+    req: JobCreateRequest,
+    request: Request,
+    response: Response,
+    background: BackgroundTasks,
+    _: None = Depends(require_api_key),
+):
+    cfg = request.app.state.cfg
+    meta = await job_options(cfg, req, request.headers.get("x-api-key"))
+    await record_arrival(get_async_redis_conn(), cfg, req.model, request.app.state.switcher)
     q = get_queue()
-    payload = req.model_dump()
+    payload = req.model_dump(exclude=JOB_OPTIONS)
     payload["async"] = True
-    job = q.enqueue("worker.tasks.process_chat_job", kwargs={"payload": payload})
-    return JobCreateResponse(id=job.id, status="queued", status_url=f"/jobs/{job.id}")
-
-
-@router.get("/{job_id}", response_model=JobStatusResponse)
-async def get_job(job_id: str, _: None = Depends(require_api_key)):
+    cached = await asyncio.to_thread(ResponseCache(q.connection, cfg).get, payload)
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        result_ttl = cfg.gateway.get("jobs", {}).get("result_ttl_sec", 86400)
+        job = await asyncio.to_thread(create_cached_job, q, cfg, payload, cached, result_ttl)
+        notify_webhook(background, cfg, meta, {"id": job.id, "status": "succeeded", "requested_model": req.model, "result": cached})
+        return JobCreateResponse(id=job.id, status="succeeded", status_url=f"/jobs/{job.id}")
+    cost = meta["admission_cost"] = await admit_request(request, req.model, meta["priority"], req.max_tokens)
     try:
-        job = Job.fetch(job_id, connection=get_redis_conn())
+        meta["rate_limit"] = await charge_tokens(get_async_redis_conn(), request, req.max_tokens)
+        job = await asyncio.to_thread(enqueue_job, q, "worker.tasks.process_chat_job", req.model, {"payload": payload}, meta=meta)
     except Exception:
-        raise HTTPException(status_code=404, detail="Job not found")
+        await asyncio.to_thread(release_admission, q.connection, req.model, cost)
+        raise
+    return JobCreateResponse(
+        id=job.id,
+        status="queued",
+        status_url=f"/jobs/{job.id}",
+        stream_url=f"/jobs/{job.id}/stream" if req.stream else None,
+    )
+
 
-    status = _job_status(job)
-    meta = job.meta or {}
+def _estimate(request: Request, job_id: str, status: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    conn, cfg = get_redis_conn(), request.app.state.cfg
+    if status == "queued":
+        return queue_estimate(conn, cfg, job_id, meta, request.app.state.switcher.active_model) or {}
+    model = meta.get("requested_model", "")
+    progress, eta = running_estimate(meta, model_stats(conn, cfg, [model])[model])
+    return {"progress": progress, "eta_sec": eta}
+
+
+async def _status_response(request: Request, job_id: str, summary: Dict[str, Any]) -> JobStatusResponse:
+    meta = summary["meta"]
+    status = "expired" if meta.get("expired") else public_status(summary["status"])
+    error = meta.get("error")
+    if status == "failed":
+        job = await fetch_job(job_id)
+        error = str(job.exc_info)[:4000] if job else error
+    estimate = {"progress": meta.get("progress")}
+    if status in {"queued", "running"}:
+        estimate.update(await asyncio.to_thread(_estimate, request, job_id, status, meta))
     return JobStatusResponse(
-        id=job.id,
+        id=job_id,
         status=status,
         requested_model=meta.get("requested_model", "unknown"),
-        created_at=_iso(job.created_at),
+        created_at=_iso(summary["created_at"]),
         started_at=meta.get("started_at"),
         finished_at=meta.get("finished_at"),
-        queue_position=meta.get("queue_position"),
-        progress=meta.get("progress"),
-        error=str(job.exc_info)[:4000] if status == "failed" else meta.get("error"),
+        error=error,
+        **estimate,
     )
 
 
+@router.get("/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str, request: Request, _: None = Depends(require_api_key)):
+    summary = await job_summary(get_async_redis_conn(), job_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await _status_response(request, job_id, summary)
+
+
+@router.get("/{job_id}/wait", response_model=JobWaitResponse)
+async def wait_job(job_id: str, request: Request, timeout: Optional[float] = None, _: None = Depends(require_api_key)):
+    max_wait = float(request.app.state.cfg.gateway.get("timeouts", {}).get("WAIT_TIMEOUT_SEC", 900))
+    timeout = max_wait if timeout is None else min(max(timeout, 0.0), max_wait)
+    aconn = get_async_redis_conn()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    with request.app.state.completions.watch(job_id) as done:
+        while True:
+            # Cleared before reading, so a signal landing between the read and the wait is kept.
+            done.clear()
+            summary = await job_summary(aconn, job_id)
+            if summary is None:
+                raise HTTPException(status_code=404, detail="Job not found")
+            remaining = deadline - loop.time()
+            if summary["status"] in TERMINAL_STATUSES or remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(done.wait(), min(remaining, 15))
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+
+    status = await _status_response(request, job_id, summary)
+    result = None
+    if status.status == "succeeded":
+        result = await asyncio.to_thread(load_result, get_redis_conn(), request.app.state.cfg, job_id)
+        if result is None:
+            result = await _legacy_result(job_id)
+    return JobWaitResponse(**status.model_dump(), result=result)
+
+
+async def _legacy_result(job_id: str):
+    # Jobs finished before the result store existed kept their result in rq.
+    job = await fetch_job(job_id)
+    return await asyncio.to_thread(lambda: job.result) if job else None
+
+
 @router.get("/{job_id}/result", response_model=JobResultResponse)
-async def get_job_result(job_id: str, _: None = Depends(require_api_key)):
-    try:
-        job = Job.fetch(job_id, connection=get_redis_conn())
-    except Exception:
+async def get_job_result(job_id: str, request: Request, _: None = Depends(require_api_key)):
+    aconn = get_async_redis_conn()
+    summary = await job_summary(aconn, job_id)
+    if summary is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    if not job.is_finished:
+    if summary["status"] != "finished":
         raise HTTPException(status_code=409, detail="Job is not finished")
-    return JobResultResponse(id=job.id, result=job.result)
+    entry = await aconn.hgetall(result_key(job_id))
+    fh = None
+    if entry:
+        try:
+            fh = await asyncio.to_thread(open_result, request.app.state.cfg, entry)
+        except FileNotFoundError:
+            pass
+    elif (result := await _legacy_result(job_id)) is not None:
+        return JobResultResponse(id=job_id, result=result)
+    if fh is None:
+        raise HTTPException(status_code=404, detail="Job result not found")
+
+    # The JobResultResponse envelope is written around the decompressed result as it streams.
+    head, tail = b'{"id":' + orjson.dumps(job_id) + b',"result":', b"}"
+
+    async def body():
+        yield head
+        async for chunk in iter_result(fh):
+            yield chunk
+        yield tail
+
+    length = len(head) + int(entry[b"size"]) + len(tail)
+    return StreamingResponse(body(), media_type="application/json", headers={"Content-Length": str(length)})
+
+
+@router.get("/{job_id}/stream")
+async def stream_job(job_id: str, _: None = Depends(require_api_key)):
+    job = await fetch_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not (job.kwargs or {}).get("payload", {}).get("stream"):
+        raise HTTPException(status_code=409, detail="Job was not submitted with stream=true")
+
+    async def relay():
+        aconn = get_async_redis_conn()
+        try:
+            async for chunk in relay_job_stream(aconn, job_id):
+                yield chunk
+        finally:
+            await aconn.aclose()
+
+    return StreamingResponse(relay(), media_type="text/event-stream")
 
 
 @router.post("/{job_id}/cancel")
-async def cancel_job(job_id: str, request: Request, _: None = Depends(require_api_key)):
-    redis_conn = get_redis_conn()
-    try:
-        job = Job.fetch(job_id, connection=redis_conn)
-    except Exception:
+async def cancel_job(job_id: str, request: Request, background: BackgroundTasks, _: None = Depends(require_api_key)):
+    job = await fetch_job(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
 
-    status = _job_status(job)
+    status = public_status(job.get_status(refresh=False))
+    body = {"id": job_id, "status": "cancelled", "requested_model": job.meta.get("requested_model")}
     if status == "queued":
-        q = get_queue()
-        q.remove(job.id)
-        job.meta["cancelled_at"] = datetime.now(timezone.utc).isoformat()
-        job.set_status("canceled")
-        job.save_meta()
+        await asyncio.to_thread(cancel_queued_job, job, request.app.state.cfg)
+        notify_webhook(background, request.app.state.cfg, job.meta, body)
         return {"id": job_id, "status": "cancelled", "mode": "queued-remove"}
 
     if status == "running":
-        request.app.state.switcher.stop_current_model()
-        job.meta["cancelled_at"] = datetime.now(timezone.utc).isoformat()
-        job.meta["finished_at"] = datetime.now(timezone.utc).isoformat()
-        job.set_status("canceled")
-        job.save_meta()
-        return {"id": job_id, "status": "cancelled", "mode": "hard-cancel"}
+        # The worker running it aborts the backend request and records the outcome (and sends the webhook).
+        await asyncio.to_thread(request_cancel, get_redis_conn(), request.app.state.cfg, job_id)
+        return {"id": job_id, "status": "cancelling", "mode": "soft-cancel"}
 
     return {"id": job_id, "status": status, "detail": "Job already terminal"}
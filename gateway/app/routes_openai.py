@@ -1,10 +1,27 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+import asyncio
+import time
+from typing import Any, Dict
 
+import orjson
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import ValidationError
+
+from .admission import admit_request, check_max_tokens, release_admission
 from .auth import require_api_key
-from .models import ChatCompletionRequest, JobCreateResponse, OpenAIModel, OpenAIModelsResponse
-from .queue import get_queue
+from .cache import ResponseCache, create_cached_job
+from .jobstore import job_options
+from .metrics import METRICS
+from .models import JOB_OPTIONS, ChatCompletionRequest, JobCreateResponse, OpenAIModel, OpenAIModelsResponse
+from .preload import record_arrival
+from .proxy import observe_completion, open_backend_chat, read_backend_chat, relay_backend_stream
+from .queue import get_async_redis_conn, get_queue, queue_length
+from .ratelimit import charge_tokens, refund
+from .scheduler import enqueue_job
+from .webhooks import notify_webhook
 
 router = APIRouter(prefix="/v1", tags=["openai"])
 
@@ -17,29 +34,129 @@ async def list_models(request: Request, _: None = Depends(require_api_key)):
     return OpenAIModelsResponse(data=data, active_model=switcher.active_model, backend_ready=switcher.backend_state == "ready")
 
 
+def _parse_body(raw: bytes) -> Dict[str, Any]:
+    try:
+        doc = orjson.loads(raw)
+    except orjson.JSONDecodeError as exc:
+        raise RequestValidationError([{"type": "json_invalid", "loc": ("body",), "msg": f"JSON decode error: {exc}", "input": {}}])
+    if not isinstance(doc, dict):
+        raise RequestValidationError([{"type": "dict_type", "loc": ("body",), "msg": "Input should be a valid dictionary", "input": doc}])
+    return doc
+
+
+def _validate(doc: Dict[str, Any]) -> ChatCompletionRequest:
+    try:
+        return ChatCompletionRequest.model_validate(doc)
+    except ValidationError as exc:
+        raise RequestValidationError([{**e, "loc": ("body", *e["loc"])} for e in exc.errors(include_url=False)])
+
+
+# The body is read raw: async requests are validated into ChatCompletionRequest,
+# sync requests are only peeked at and forwarded to the backend byte for byte.
 @router.post("/chat/completions")
-async def chat_completions(req: ChatCompletionRequest, request: Request, _: None = Depends(require_api_key)):
-    cfg = request.app.state.cfg.gateway
-    if req.stream and req.async_mode:
-        raise HTTPException(status_code=400, detail="streaming not implemented in async mode yet")
+async def chat_completions(
+    request: Request,
+    response: Response,
+    background: BackgroundTasks,
+    _: None = Depends(require_api_key),
+):
+    raw = await request.body()
+    doc = _parse_body(raw)
+    await record_arrival(get_async_redis_conn(), request.app.state.cfg, doc.get("model"), request.app.state.switcher)
+    if doc.get("async", True):
+        return await _enqueue_chat(_validate(doc), request, response, background)
+    return await _proxy_chat(raw, doc, request, response, background)
 
-    q = get_queue()
-    if not req.async_mode:
-        queue_empty = len(q) == 0
-        switcher = request.app.state.switcher
-        if not (queue_empty and switcher.active_model == req.model and not switcher.switching):
+
+async def _proxy_chat(raw: bytes, doc: Dict[str, Any], request: Request, response: Response, background: BackgroundTasks):
+    cfg = request.app.state.cfg
+    model = doc.get("model")
+    if not isinstance(model, str):
+        _validate(doc)
+    queue_empty = await queue_length(get_async_redis_conn()) == 0
+    switcher = request.app.state.switcher
+    if not (queue_empty and switcher.is_ready(model) and not switcher.switching):
+        if not cfg.gateway.get("admission", {}).get("downgrade_sync", False):
             raise HTTPException(status_code=409, detail="Queue not empty or model switch required; use async")
+        METRICS.inc("llm_requests_shed_total", action="downgraded", model=model or "")
+        response.headers["X-Downgraded"] = "async"
+        return await _enqueue_chat(_validate(doc), request, response, background)
+
+    q = get_queue()
+    cache = ResponseCache(q.connection, cfg)
+    payload = None
+    if cache.cacheable(doc):
+        # Only cacheable requests pay for validation: the cache key must match the async path's.
+        payload = _validate(doc).model_dump(by_alias=True, exclude=JOB_OPTIONS)
+        cached = await asyncio.to_thread(cache.get, payload)
+        if cached is not None:
+            return ORJSONResponse(cached, headers={"X-Cache": "HIT"})
+    max_tokens = doc.get("max_tokens") or ChatCompletionRequest.model_fields["max_tokens"].default
+    check_max_tokens(cfg, max_tokens)
+    charge = await charge_tokens(get_async_redis_conn(), request, max_tokens)
+
+    timeout = cfg.gateway.get("timeouts", {}).get("INFERENCE_TIMEOUT_SEC", 1200)
+    began = time.monotonic()
+    try:
+        # The raw body still carries gateway-only fields such as "async"; vLLM ignores unknown fields.
+        resp = await open_backend_chat(cfg.models["models"][model], raw, timeout_sec=timeout, model=model)
+    except Exception:
+        await asyncio.to_thread(refund, q.connection, cfg, charge)
+        raise
+    media_type = resp.headers.get("content-type")
+    if doc.get("stream") and resp.status_code < 400:
+        # The relayed stream is not parsed for usage, so a streamed charge is not refunded.
+        return StreamingResponse(relay_backend_stream(resp, model, began), status_code=resp.status_code, media_type=media_type)
+
+    content = await read_backend_chat(resp)
+    usage = None
+    if resp.status_code < 400 and (charge or payload is not None):
+        result = orjson.loads(content)
+        usage = result.get("usage") or {}
+        if payload is not None:
+            await asyncio.to_thread(cache.put, payload, result)
+    observe_completion(model, time.monotonic() - began, usage)
+    if charge:
+        await asyncio.to_thread(refund, q.connection, cfg, charge, (usage or {}).get("completion_tokens"))
+    headers = {"X-Cache": "MISS"} if payload is not None else None
+    return Response(content, status_code=resp.status_code, media_type=media_type, headers=headers)
+
+
+async def _enqueue_chat(req: ChatCompletionRequest, request: Request, response: Response, background: BackgroundTasks):
+    cfg = request.app.state.cfg.gateway
+    meta = await job_options(request.app.state.cfg, req, request.headers.get("x-api-key"))
+    q = get_queue()
+    result_ttl = cfg.get("jobs", {}).get("result_ttl_sec", 86400)
+    payload = req.model_dump(by_alias=True, exclude=JOB_OPTIONS)
+    cache = ResponseCache(q.connection, request.app.state.cfg)
+    cached = await asyncio.to_thread(cache.get, payload)
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        job = await asyncio.to_thread(create_cached_job, q, request.app.state.cfg, payload, cached, result_ttl)
+        notify_webhook(background, request.app.state.cfg, meta, {"id": job.id, "status": "succeeded", "requested_model": req.model, "result": cached})
+        return JobCreateResponse(id=job.id, status="succeeded", status_url=f"/jobs/{job.id}")
+    if cache.cacheable(payload):
+        response.headers["X-Cache"] = "MISS"
 
-        from .proxy import call_backend_chat
-        model_cfg = request.app.state.cfg.models["models"][req.model]
-        payload = req.model_dump(by_alias=True)
-        payload.pop("async", None)
-        return await call_backend_chat(model_cfg, payload, timeout_sec=cfg.get("timeouts", {}).get("INFERENCE_TIMEOUT_SEC", 1200))
-
-    job = q.enqueue(
-        "worker.tasks.process_chat_job",
-        kwargs={"payload": req.model_dump(by_alias=True), "request_id": request.state.request_id},
-        result_ttl=cfg.get("jobs", {}).get("result_ttl_sec", 86400),
-        failure_ttl=cfg.get("jobs", {}).get("failure_ttl_sec", 86400),
+    cost = meta["admission_cost"] = await admit_request(request, req.model, meta["priority"], req.max_tokens)
+    try:
+        meta["rate_limit"] = await charge_tokens(get_async_redis_conn(), request, req.max_tokens)
+        job = await asyncio.to_thread(
+            enqueue_job,
+            q,
+            "worker.tasks.process_chat_job",
+            req.model,
+            {"payload": payload, "request_id": request.state.request_id},
+            meta=meta,
+            result_ttl=result_ttl,
+            failure_ttl=cfg.get("jobs", {}).get("failure_ttl_sec", 86400),
+        )
+    except Exception:
+        await asyncio.to_thread(release_admission, q.connection, req.model, cost)
+        raise
+    return JobCreateResponse(
+        id=job.id,
+        status="queued",
+        status_url=f"/jobs/{job.id}",
+        stream_url=f"/jobs/{job.id}/stream" if req.stream else None,
     )
-    return JobCreateResponse(id=job.id, status="queued", status_url=f"/jobs/{job.id}")
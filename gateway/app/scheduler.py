@@ -0,0 +1,479 @@
+from __future__ import annotations
+
+import time
+from datetime import timezone
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Tuple
+
+from redis import Redis
+from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, JobStatus
+
+from .config import get_api_key_classes
+from .metrics import METRICS
+
+SCHED_PREFIX = "llm:sched"
+LANES_KEY = f"{SCHED_PREFIX}:lanes"
+DEADLINES_KEY = f"{SCHED_PREFIX}:deadlines"
+WAKEUP_KEY = f"{SCHED_PREFIX}:wakeup"
+SWITCHES_AVOIDED_KEY = f"{SCHED_PREFIX}:switches_avoided"
+# Admission cost (tokens) of each model's pending jobs; see admission.py.
+QUEUED_COST_KEY = f"{SCHED_PREFIX}:queued_cost"
+DEFAULT_CLASS = "standard"
+DEFAULT_CLASSES = {"interactive": {"weight": 8}, "standard": {"weight": 4}, "batch": {"weight": 1}}
+WAIT_SAMPLES = 1000
+
+# Pending jobs live in one lane (sorted set, scored by enqueue time) per priority
+# class and model; the lane's jobs with a deadline are also in a second sorted set,
+# scored by deadline. Pops one job of a lane and removes it from the rq list in one
+# step, so two workers can never claim the same job: the earliest deadline due by
+# ARGV[2], else the oldest.
+_CLAIM_LUA = """
+local d = redis.call('zrangebyscore', KEYS[5], '-inf', ARGV[2], 'LIMIT', 0, 1)
+local id = d[1] or redis.call('zrange', KEYS[1], 0, 0)[1]
+if id then redis.call('zrem', KEYS[1], id) end
+if redis.call('zcard', KEYS[1]) == 0 then redis.call('srem', KEYS[3], ARGV[1]) end
+if not id then return false end
+redis.call('zrem', KEYS[5], id)
+redis.call('lrem', KEYS[2], 1, id)
+redis.call('zrem', KEYS[4], id)
+return id
+"""
+
+# Drops a job from its lane if nobody claimed it first.
+_EXPIRE_LUA = """
+redis.call('zrem', KEYS[4], ARGV[1])
+redis.call('zrem', KEYS[5], ARGV[1])
+if redis.call('zrem', KEYS[1], ARGV[1]) == 0 then return 0 end
+if redis.call('zcard', KEYS[1]) == 0 then redis.call('srem', KEYS[3], ARGV[2]) end
+redis.call('lrem', KEYS[2], 1, ARGV[1])
+return 1
+"""
+
+
+def lane_name(priority: str, model: str) -> str:
+    return f"{priority}|{model}"
+
+
+def split_lane(lane: str) -> Tuple[str, str]:
+    priority, model = lane.split("|", 1)
+    return priority, model
+
+
+def pending_key(model: str, priority: str = DEFAULT_CLASS) -> str:
+    return f"{SCHED_PREFIX}:pending:{priority}:{model}"
+
+
+def lane_deadlines_key(model: str, priority: str = DEFAULT_CLASS) -> str:
+    return f"{SCHED_PREFIX}:lane_deadlines:{priority}:{model}"
+
+
+def lane_keys(q: Queue, model: str, priority: str) -> List[str]:
+    # KEYS of the claim and expire scripts.
+    return [pending_key(model, priority), q.key, LANES_KEY, DEADLINES_KEY, lane_deadlines_key(model, priority)]
+
+
+def waits_key(priority: str) -> str:
+    return f"{SCHED_PREFIX}:waits:{priority}"
+
+
+def priority_classes(cfg) -> Dict[str, Dict[str, Any]]:
+    return cfg.gateway.get("scheduler", {}).get("classes") or DEFAULT_CLASSES
+
+
+def resolve_priority(cfg, requested: Optional[str], api_key: Optional[str], default: Optional[str] = None) -> str:
+    # Per-request class first, then the class bound to the API key, then the caller's default.
+    classes = priority_classes(cfg)
+    if requested is not None:
+        if requested not in classes:
+            raise ValueError(f"Unknown priority class {requested!r}; expected one of {sorted(classes)}")
+        return requested
+    for candidate in (get_api_key_classes().get(api_key or ""), default):
+        if candidate in classes:
+            return candidate
+    return cfg.gateway.get("scheduler", {}).get("default_class", DEFAULT_CLASS)
+
+
+def scheduling_meta(priority: str, deadline_sec: Optional[float]) -> Dict[str, Any]:
+    meta: Dict[str, Any] = {"priority": priority}
+    if deadline_sec is not None:
+        meta["deadline"] = time.time() + deadline_sec
+    return meta
+
+
+def _enqueue(pipe, q: Queue, func: str, model: str, kwargs: Dict[str, Any], score: float, at_front: bool, meta, job_kwargs) -> Job:
+    meta = {"requested_model": model, **(meta or {})}
+    priority = meta.setdefault("priority", DEFAULT_CLASS)
+    # Jobs never have dependencies, and rq's dependency check would open its own
+    # MULTI per job, so they go straight onto the queue inside the caller's pipeline.
+    job = q.create_job(func, kwargs=kwargs, meta=meta, **job_kwargs)
+    q._enqueue_job(job, pipeline=pipe, at_front=at_front)
+    deadline = meta.get("deadline")
+    if deadline is not None and not at_front:
+        pipe.zadd(DEADLINES_KEY, {job.id: deadline})
+        pipe.zadd(lane_deadlines_key(model, priority), {job.id: deadline})
+    pipe.zadd(pending_key(model, priority), {job.id: score})
+    pipe.sadd(LANES_KEY, lane_name(priority, model))
+    return job
+
+
+def _wakeup(pipe):
+    pipe.lpush(WAKEUP_KEY, 1)
+    pipe.ltrim(WAKEUP_KEY, 0, 0)
+
+
+def enqueue_job(
+    q: Queue,
+    func: str,
+    model: str,
+    kwargs: Dict[str, Any],
+    at_front: bool = False,
+    meta: Optional[Dict[str, Any]] = None,
+    **job_kwargs,
+) -> Job:
+    # Score 0 makes the job look infinitely old; pick_lane serves such lanes first.
+    score = 0 if at_front else time.time()
+    with q.connection.pipeline() as pipe:
+        job = _enqueue(pipe, q, func, model, kwargs, score, at_front, meta, job_kwargs)
+        _wakeup(pipe)
+        pipe.execute()
+    return job
+
+
+def enqueue_many(
+    q: Queue,
+    func: str,
+    specs: Iterable[Tuple[str, Dict[str, Any], Optional[Dict[str, Any]]]],
+    pipe=None,
+    **job_kwargs,
+) -> List[Job]:
+    # specs are (model, kwargs, meta). All jobs land in one MULTI/EXEC, so the
+    # scheduler never sees a partially enqueued batch. Pass pipe to add more
+    # writes to the same transaction; the caller then executes it.
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = q.connection.pipeline()
+    now = time.time()
+    # Microsecond steps keep submission order within a model.
+    jobs = [
+        _enqueue(pipe, q, func, model, kwargs, now + i * 1e-6, False, meta, job_kwargs)
+        for i, (model, kwargs, meta) in enumerate(specs)
+    ]
+    _wakeup(pipe)
+    if own_pipe:
+        with pipe:
+            pipe.execute()
+    return jobs
+
+
+def release_cost(conn: Redis, job: Job):
+    # conn may be a pipeline. Called only by whoever removed the job from its lane (claim, cancel
+    # or expiry), so a cancel racing a claim releases the cost once.
+    meta = job.meta or {}
+    if meta.get("admission_cost"):
+        conn.hincrbyfloat(QUEUED_COST_KEY, meta.get("requested_model", ""), -float(meta["admission_cost"]))
+
+
+def requeue_job(q: Queue, job: Job):
+    # Puts a started job (e.g. one whose worker died) back into its lane at its original
+    # place, with its admission cost.
+    meta = job.meta or {}
+    model, priority = meta.get("requested_model"), meta.get("priority", DEFAULT_CLASS)
+    score = job.enqueued_at.replace(tzinfo=timezone.utc).timestamp() if job.enqueued_at else time.time()
+    with q.connection.pipeline() as pipe:
+        q.started_job_registry.remove(job, pipeline=pipe)
+        q._enqueue_job(job, pipeline=pipe)
+        if model:
+            if meta.get("deadline") is not None:
+                pipe.zadd(DEADLINES_KEY, {job.id: meta["deadline"]})
+                pipe.zadd(lane_deadlines_key(model, priority), {job.id: meta["deadline"]})
+            pipe.zadd(pending_key(model, priority), {job.id: score})
+            pipe.sadd(LANES_KEY, lane_name(priority, model))
+            if meta.get("admission_cost"):
+                pipe.hincrbyfloat(QUEUED_COST_KEY, model, float(meta["admission_cost"]))
+        _wakeup(pipe)
+        pipe.execute()
+
+
+def forget_job(conn: Redis, job: Job):
+    meta = job.meta or {}
+    model = meta.get("requested_model")
+    if model:
+        priority = meta.get("priority", DEFAULT_CLASS)
+        with conn.pipeline() as pipe:
+            pipe.zrem(pending_key(model, priority), job.id)
+            pipe.zrem(lane_deadlines_key(model, priority), job.id)
+            pipe.zrem(DEADLINES_KEY, job.id)
+            removed = pipe.execute()[0]
+        # A worker that already claimed the job has released its cost.
+        if removed:
+            release_cost(conn, job)
+
+
+def queued_cost(conn: Redis) -> Dict[str, float]:
+    return {m.decode(): round(max(float(v), 0.0), 1) for m, v in conn.hgetall(QUEUED_COST_KEY).items()}
+
+
+def _lanes(conn: Redis) -> List[str]:
+    return sorted(lane.decode() for lane in conn.smembers(LANES_KEY))
+
+
+def pending_by_model(conn: Redis) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for (_, model), count in pending_by_lane(conn).items():
+        counts[model] = counts.get(model, 0) + count
+    return counts
+
+
+def pending_by_class(conn: Redis) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for (priority, _), count in pending_by_lane(conn).items():
+        counts[priority] = counts.get(priority, 0) + count
+    return counts
+
+
+def pending_by_lane(conn: Redis) -> Dict[Tuple[str, str], int]:
+    lanes = _lanes(conn)
+    with conn.pipeline() as pipe:
+        for lane in lanes:
+            priority, model = split_lane(lane)
+            pipe.zcard(pending_key(model, priority))
+        counts = pipe.execute()
+    return {split_lane(lane): int(c) for lane, c in zip(lanes, counts) if c}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3)
+
+
+def wait_percentiles(conn: Redis, priorities: Iterable[str]) -> Dict[str, Dict[str, float]]:
+    priorities = list(priorities)
+    with conn.pipeline() as pipe:
+        for priority in priorities:
+            pipe.lrange(waits_key(priority), 0, -1)
+        rows = pipe.execute()
+    stats: Dict[str, Dict[str, float]] = {}
+    for priority, raw in zip(priorities, rows):
+        if not raw:
+            continue
+        waits = sorted(float(w) for w in raw)
+        stats[priority] = {f"p{int(q * 100)}": _percentile(waits, q) for q in (0.5, 0.9, 0.99)}
+        stats[priority]["samples"] = len(waits)
+    return stats
+
+
+def switches_avoided(conn: Redis) -> int:
+    return int(conn.get(SWITCHES_AVOIDED_KEY) or 0)
+
+
+class ModelAffinityScheduler:
+    def __init__(
+        self,
+        conn: Redis,
+        queue: Queue,
+        max_wait_sec: float = 600,
+        max_batch: int = 0,
+        weights: Optional[Dict[str, float]] = None,
+        deadline_margin_sec: float = 0,
+        class_max_wait_sec: Optional[Dict[str, float]] = None,
+        switch_sec: Optional[Callable[[Iterable[str]], Dict[str, float]]] = None,
+    ):
+        self.conn = conn
+        self.queue = queue
+        self.max_wait_sec = max_wait_sec
+        self.max_batch = max_batch
+        self.weights = weights or {name: c["weight"] for name, c in DEFAULT_CLASSES.items()}
+        self.deadline_margin_sec = deadline_margin_sec
+        self.class_max_wait_sec = class_max_wait_sec or {}
+        self.switch_sec = switch_sec or (lambda models: {})
+        self._claim = conn.register_script(_CLAIM_LUA)
+        self._expire = conn.register_script(_EXPIRE_LUA)
+        self._last_model: Optional[str] = None
+        self._batch_run = 0
+        # Stride scheduling: each class advances its pass by 1/weight per job served,
+        # and the class with the lowest pass goes next.
+        self._pass: Dict[str, float] = {}
+        self._vtime = 0.0
+
+    @classmethod
+    def from_config(cls, conn: Redis, queue: Queue, cfg) -> "ModelAffinityScheduler":
+        from .eta import model_stats
+
+        sched_cfg = cfg.gateway.get("scheduler", {})
+        return cls(
+            conn,
+            queue,
+            max_wait_sec=float(sched_cfg.get("max_wait_sec", 600)),
+            max_batch=int(sched_cfg.get("max_batch", 0)),
+            weights={name: float(c.get("weight", 1)) for name, c in priority_classes(cfg).items()},
+            deadline_margin_sec=float(sched_cfg.get("deadline_margin_sec", 0)),
+            class_max_wait_sec={name: float(c["max_wait_sec"]) for name, c in priority_classes(cfg).items() if "max_wait_sec" in c},
+            switch_sec=lambda models: {m: s["switch_sec"] for m, s in model_stats(conn, cfg, models).items()},
+        )
+
+    def pending_heads(self) -> Dict[Tuple[str, str], float]:
+        lanes = _lanes(self.conn)
+        with self.conn.pipeline() as pipe:
+            for lane in lanes:
+                priority, model = split_lane(lane)
+                pipe.zrange(pending_key(model, priority), 0, 0, withscores=True)
+            heads = pipe.execute()
+        return {split_lane(lane): h[0][1] for lane, h in zip(lanes, heads) if h}
+
+    def _windows(self, models: Iterable[str]) -> Dict[str, float]:
+        # A job is urgent once its deadline is this close: it must start now to make it,
+        # counting the switch to its model.
+        switch = self.switch_sec(models)
+        return {m: self.deadline_margin_sec + switch.get(m, 0.0) for m in models}
+
+    def urgent_lanes(self, lanes: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], float]:
+        # Lanes holding an urgent job, with its deadline.
+        lanes = list(lanes)
+        with self.conn.pipeline() as pipe:
+            for priority, model in lanes:
+                pipe.zrange(lane_deadlines_key(model, priority), 0, 0, withscores=True)
+            rows = pipe.execute()
+        deadlines = {lane: row[0][1] for lane, row in zip(lanes, rows) if row}
+        if not deadlines:
+            return {}
+        windows = self._windows({m for _, m in deadlines})
+        now = time.time()
+        return {lane: d for lane, d in deadlines.items() if d - now <= windows[lane[1]]}
+
+    def _pick_class(self, classes: Iterable[str]) -> str:
+        for priority in classes:
+            # A class returning from idle starts at the current virtual time instead of
+            # cashing in the turns it did not need.
+            self._pass[priority] = max(self._pass.get(priority, 0.0), self._vtime)
+        return min(classes, key=lambda p: (self._pass[p], -self.weights.get(p, 1.0)))
+
+    def _charge_class(self, priority: str):
+        self._vtime = self._pass[priority]
+        self._pass[priority] += 1.0 / max(self.weights.get(priority, 1.0), 1e-6)
+
+    def _max_wait(self, priority: str) -> float:
+        return self.class_max_wait_sec.get(priority, self.max_wait_sec)
+
+    def pick_model(
+        self,
+        active_model: Optional[str],
+        heads: Dict[str, float],
+        max_wait_sec: Optional[float] = None,
+        resident: Collection[str] = (),
+    ) -> Tuple[Optional[str], Optional[str]]:
+        if not heads:
+            return None, None
+        oldest = min(heads, key=heads.get)
+        # Moving to another resident model costs no switch, so it is served in FIFO order.
+        if active_model in heads and oldest != active_model and oldest not in resident:
+            starving = time.time() - heads[oldest] > (self.max_wait_sec if max_wait_sec is None else max_wait_sec)
+            batch_full = self.max_batch > 0 and self._last_model == active_model and self._batch_run >= self.max_batch
+            if not (starving or batch_full):
+                return active_model, oldest
+        return oldest, oldest
+
+    def pick_lane(
+        self,
+        active_model: Optional[str],
+        require_model: Optional[str] = None,
+        resident: Collection[str] = (),
+        allowed: Optional[Collection[str]] = None,
+    ) -> Tuple[Optional[Tuple[str, str]], Optional[str]]:
+        heads = self.pending_heads()
+        if require_model is not None:
+            heads = {lane: score for lane, score in heads.items() if lane[1] == require_model}
+        if allowed is not None:
+            # In a worker pool, the models this worker may claim (see pool.claimable_models).
+            heads = {lane: score for lane, score in heads.items() if lane[1] in allowed}
+        if not heads:
+            return None, None
+        front = sorted(lane for lane, score in heads.items() if score == 0)
+        if front:
+            # Jobs enqueued at_front (admin switches) go before every class and deadline.
+            self._pick_class({front[0][0]})  # still charged for the turn
+            return front[0], front[0][1]
+        urgent = self.urgent_lanes(heads)
+        if urgent:
+            # A job about to miss its deadline goes first, whatever the class or the switch.
+            lane = min(urgent, key=urgent.get)
+            self._pick_class({lane[0]})  # still charged for the turn
+            return lane, lane[1]
+        priority = self._pick_class({p for p, _ in heads})
+        class_heads = {m: s for (p, m), s in heads.items() if p == priority}
+        fifo_model = min(class_heads, key=class_heads.get)
+        if active_model is not None and active_model not in class_heads and fifo_model not in resident:
+            # The class whose turn it is would force a model switch. Until its oldest
+            # job has waited the class's max_wait_sec, serve the loaded model from the
+            # next class in line instead; the skipped class keeps its low pass.
+            loaded = {p for p, m in heads if m == active_model}
+            if loaded and time.time() - class_heads[fifo_model] <= self._max_wait(priority):
+                priority = min(loaded, key=lambda p: (self._pass[p], -self.weights.get(p, 1.0)))
+                return (priority, active_model), fifo_model
+        model, fifo_model = self.pick_model(active_model, class_heads, self._max_wait(priority), resident)
+        return (priority, model), fifo_model
+
+    def expire_overdue(self) -> List[Job]:
+        # Jobs that can no longer start in time are dropped instead of being run late.
+        due = self.conn.zrangebyscore(DEADLINES_KEY, "-inf", time.time() + self.deadline_margin_sec)
+        expired = []
+        for job_id in due:
+            job_id = job_id.decode()
+            try:
+                job = Job.fetch(job_id, connection=self.conn)
+            except NoSuchJobError:
+                self.conn.zrem(DEADLINES_KEY, job_id)
+                continue
+            meta = job.meta or {}
+            priority, model = meta.get("priority", DEFAULT_CLASS), meta.get("requested_model", "")
+            if self._expire(keys=lane_keys(self.queue, model, priority), args=[job_id, lane_name(priority, model)]):
+                release_cost(self.conn, job)
+                expired.append(job)
+        return expired
+
+    def next_job(
+        self,
+        active_model: Optional[str],
+        require_model: Optional[str] = None,
+        resident: Collection[str] = (),
+        allowed: Optional[Collection[str]] = None,
+    ) -> Optional[Job]:
+        while True:
+            lane, fifo_model = self.pick_lane(active_model, require_model, resident, allowed)
+            if lane is None:
+                return None
+            priority, model = lane
+            due = time.time() + self._windows([model])[model]
+            job_id = self._claim(keys=lane_keys(self.queue, model, priority), args=[lane_name(priority, model), due])
+            if job_id is None:
+                continue
+            try:
+                job = Job.fetch(job_id.decode(), connection=self.conn)
+            except NoSuchJobError:
+                continue
+            # The claim took the job out of its lane, so its cost is ours to release even if it
+            # was cancelled meanwhile (forget_job then finds nothing to remove).
+            release_cost(self.conn, job)
+            if job.get_status() != JobStatus.QUEUED:
+                continue
+            self._charge_class(priority)
+            self._record_wait(job, priority)
+            if model != fifo_model:
+                self.conn.incr(SWITCHES_AVOIDED_KEY)
+            if model == self._last_model:
+                self._batch_run += 1
+            else:
+                self._last_model, self._batch_run = model, 1
+            return job
+
+    def _record_wait(self, job: Job, priority: str):
+        if job.enqueued_at is None:
+            return
+        waited = max(time.time() - job.enqueued_at.replace(tzinfo=timezone.utc).timestamp(), 0.0)
+        METRICS.observe("llm_queue_wait_seconds", waited, priority=priority, model=(job.meta or {}).get("requested_model", ""))
+        with self.conn.pipeline() as pipe:
+            pipe.lpush(waits_key(priority), round(waited, 3))
+            pipe.ltrim(waits_key(priority), 0, WAIT_SAMPLES - 1)
+            pipe.execute()
+
+    def wait(self, timeout: int):
+        self.conn.blpop([WAKEUP_KEY], timeout=timeout)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import AsyncIterator, List, Optional
+
+from redis.asyncio import Redis as AsyncRedis
+
+STREAM_PREFIX = "llm:stream"
+TERMINAL_STATUSES = {b"finished", b"failed", b"canceled", b"stopped"}
+# Chunks are appended to a stream at most this often, several per entry.
+FLUSH_SEC = 0.05
+
+
+def stream_key(job_id: str) -> str:
+    return f"{STREAM_PREFIX}:{job_id}"
+
+
+# Appends a job's chunks on redis.asyncio, batched: chunks arriving within FLUSH_SEC
+# of a flush share one XADD entry, joined by newlines (SSE data never holds one),
+# so the worker's event loop does not wait on Redis for every token.
+class StreamPublisher:
+    def __init__(self, aconn: AsyncRedis, job_id: str, ttl: int):
+        self.aconn = aconn
+        self.key = stream_key(job_id)
+        self.ttl = ttl
+        self._chunks: List[str] = []
+        self._flushed_at = 0.0
+        self._timer: Optional[asyncio.Task] = None
+        # Keeps entries in order when the timer's flush and a caller's overlap.
+        self._lock = asyncio.Lock()
+
+    async def add(self, data: str):
+        self._chunks.append(data)
+        if self._timer is not None:
+            return
+        wait = self._flushed_at + FLUSH_SEC - time.monotonic()
+        if wait <= 0:
+            await self.flush()
+        else:
+            self._timer = asyncio.create_task(self._flush_after(wait))
+
+    async def _flush_after(self, wait: float):
+        await asyncio.sleep(wait)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self, event: Optional[str] = None, data: str = ""):
+        # event (e.g. "done") is appended after the buffered chunks.
+        async with self._lock:
+            chunks, self._chunks = self._chunks, []
+            self._flushed_at = time.monotonic()
+            if not chunks and event is None:
+                return
+            async with self.aconn.pipeline(transaction=False) as pipe:
+                if chunks:
+                    pipe.xadd(self.key, {"event": "chunk", "data": "\n".join(chunks)})
+                if event is not None:
+                    pipe.xadd(self.key, {"event": event, "data": data})
+                pipe.expire(self.key, self.ttl)
+                await pipe.execute()
+
+    async def close(self, event: Optional[str] = None, data: str = ""):
+        if self._timer is not None:
+            # Still sleeping (a timer that woke has already cleared itself).
+            self._timer.cancel()
+            self._timer = None
+        try:
+            await self.flush(event, data)
+        finally:
+            await self.aconn.aclose()
+
+
+async def relay_job_stream(aconn: AsyncRedis, job_id: str, block_ms: int = 15000) -> AsyncIterator[bytes]:
+    key = stream_key(job_id)
+    last_id = "0-0"
+    draining = False
+    while True:
+        resp = await aconn.xread({key: last_id}, block=None if draining else block_ms, count=256)
+        if not resp:
+            if draining:
+                yield b"data: [DONE]\n\n"
+                return
+            # Nothing yet: the job may still be queued, or it ended without
+            # publishing (e.g. cancelled). Keep the connection alive meanwhile.
+            status = await aconn.hget(f"rq:job:{job_id}", "status")
+            draining = status is None or status in TERMINAL_STATUSES
+            yield b": keepalive\n\n"
+            continue
+        for _, entries in resp:
+            for entry_id, fields in entries:
+                last_id = entry_id
+                event = fields.get(b"event", b"chunk")
+                data = fields.get(b"data", b"")
+                if event == b"done":
+                    yield b"data: [DONE]\n\n"
+                    return
+                if event == b"error":
+                    yield b"event: error\ndata: " + data + b"\n\n"
+                    return
+                for part in data.split(b"\n"):
+                    yield b"data: " + part + b"\n\n"
@@ -1,107 +1,506 @@
 from __future__ import annotations
 
 import asyncio
+import logging
 import os
-import subprocess
+import socket
 import time
-from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
 
-import httpx
+import orjson
+from redis import Redis
 
-from .locks import file_switch_lock, switch_lock
+from .backend_client import get_backend_client, set_backend_routes
+from .backend_manager import BackendManager
+from .config import get_worker_name
+from .eta import model_stats, record_switch_stats
+from .metrics import METRICS
+from .locks import async_file_switch_lock, switch_lock
+from .placement import container_name, instance_args, instance_port, plan_evictions
+from .prestage import checkpoint_residency, weight_files
+from .queue import get_async_redis_conn
+
+
+log = logging.getLogger(__name__)
+
+SWITCH_HISTORY_KEY = "llm:switch:history"
+SWITCH_HISTORY_LEN = 50
+STATE_KEY = "llm:switcher:state"
+STATE_CHANNEL = "llm:switcher:events"
+MODEL_LABEL = "llm-switchboard.model"
+PORT_LABEL = "llm-switchboard.port"
+WORKER_LABEL = "llm-switchboard.worker"
+
+# Writes a worker's switcher state and publishes it with a monotonically increasing
+# version, so followers can drop events that arrive out of order.
+_PUBLISH_STATE_LUA = """
+local v = redis.call('hincrby', KEYS[1], 'version', 1)
+redis.call('hset', KEYS[1], 'active_model', ARGV[1], 'backend_state', ARGV[2], 'switching', ARGV[3], 'updated_at', ARGV[4], 'owner', ARGV[5], 'resident', ARGV[6], 'worker', ARGV[7])
+redis.call('publish', KEYS[2], cjson.encode({version = v, active_model = ARGV[1], backend_state = ARGV[2], switching = ARGV[3], updated_at = ARGV[4], owner = ARGV[5], resident = ARGV[6], worker = ARGV[7]}))
+return v
+"""
+
+# vLLM start-up log lines that mark the end of each load phase:
+# (milestone, backend_state once reached, substrings to match).
+LOG_MILESTONES = [
+    ("weights_loaded", "warming_up", ("Loading weights took", "Model loading took")),
+    ("graphs_captured", "warming_up", ("Graph capturing finished",)),
+    ("server_up", "warming_up", ("Application startup complete", "Uvicorn running on")),
+]
+
+
+def state_key(worker: str) -> str:
+    return f"{STATE_KEY}:{worker}"
+
+
+def parse_state(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "active_model": data.get("active_model") or None,
+        "backend_state": data.get("backend_state") or "idle",
+        "switching": str(data.get("switching")) == "1",
+        "updated_at": data.get("updated_at") or None,
+        "resident": orjson.loads(data.get("resident") or "{}"),
+    }
+
+
+def recent_switches(conn: Redis, limit: int = 10) -> List[Dict[str, Any]]:
+    return [orjson.loads(raw) for raw in conn.lrange(SWITCH_HISTORY_KEY, 0, limit - 1)]
 
 
 class ModelSwitcher:
-    def __init__(self, cfg):
+    def __init__(self, cfg, manager: Optional[BackendManager] = None, conn: Optional[Redis] = None, worker: Optional[str] = None):
         self.cfg = cfg
-        self.active_model: Optional[str] = None
-        self.switching = False
-        self.backend_state = "idle"
+        self.manager = manager or BackendManager()
+        self.conn = conn
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        # Each worker drives the backends on its own host and publishes their state under its name.
+        self.worker = worker or get_worker_name()
+        self.backend_host = os.getenv("WORKER_BACKEND_HOST") or cfg.gateway.get("backend_client", {}).get("host", "127.0.0.1")
+        self.last_switch: Optional[Dict[str, Any]] = None
+        # active_model is the model jobs last ran on and backend_state its instance's state;
+        # resident maps every running instance's model to its container, port, state and
+        # last_used (when it was last active), for routing and eviction, plus the host other
+        # processes reach it on.
+        self._state: Dict[str, Any] = {"active_model": None, "switching": False, "backend_state": "idle", "updated_at": None, "resident": {}}
+        self._version = 0
+        self._load_history: Dict[str, float] = {}
+        self._publish_state = conn.register_script(_PUBLISH_STATE_LUA) if conn is not None else None
+        self._publisher: Optional[asyncio.Task] = None
+        self._dirty = False
+
+    @property
+    def active_model(self) -> Optional[str]:
+        return self._state["active_model"]
+
+    @property
+    def switching(self) -> bool:
+        return self._state["switching"]
+
+    @property
+    def backend_state(self) -> str:
+        return self._state["backend_state"]
+
+    @property
+    def resident(self) -> Dict[str, Dict[str, Any]]:
+        return self._state["resident"]
 
     def get_active_model(self) -> Optional[str]:
         return self.active_model
 
-    def _container_name(self) -> str:
-        prefix = os.getenv("BACKEND_CONTAINER_NAME_PREFIX", "llm-backend")
-        return f"{prefix}-active"
+    def is_ready(self, model: Optional[str]) -> bool:
+        return self.resident.get(model, {}).get("state") == "ready"
+
+    def resident_models(self) -> Set[str]:
+        # Models whose instance is up or coming up: running a job on one needs no new load.
+        return {m for m, info in self.resident.items() if info.get("state") != "failed"}
+
+    def _update(self, **fields):
+        previous = self.active_model
+        self._state.update(fields)
+        if previous != self.active_model and previous in self.resident:
+            self.resident[previous]["last_used"] = time.time()
+        if "backend_state" in fields and self.active_model in self.resident:
+            self.resident[self.active_model]["state"] = self.backend_state
+        self._state["updated_at"] = datetime.now(timezone.utc).isoformat()
+        self._set_routes(self.resident)
+        if self._publish_state is None:
+            return
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._version = int(self._publish_state(keys=self._state_keys(), args=self._state_args()))
+            self._dirty = False
+            return
+        # Published off the event loop by one task at a time, so versions follow the order of
+        # updates; a burst of updates goes out as the latest state.
+        if self._publisher is None or self._publisher.done():
+            self._publisher = loop.create_task(self._publish())
+
+    def _state_keys(self) -> List[str]:
+        return [state_key(self.worker), STATE_CHANNEL]
+
+    def _state_args(self) -> List[Any]:
+        return [
+            self.active_model or "",
+            self.backend_state,
+            "1" if self.switching else "0",
+            self._state["updated_at"],
+            self.owner,
+            orjson.dumps(self.resident),
+            self.worker,
+        ]
+
+    async def _publish(self):
+        while self._dirty:
+            self._dirty = False
+            try:
+                script = get_async_redis_conn().register_script(_PUBLISH_STATE_LUA)
+                self._version = max(self._version, int(await script(keys=self._state_keys(), args=self._state_args())))
+            except Exception:
+                # Other processes would route by a stale state, so keep retrying until it goes out.
+                log.warning("Could not publish switcher state, retrying", exc_info=True)
+                self._dirty = True
+                await asyncio.sleep(1)
+
+    async def flush_state(self, timeout: float = 5):
+        # Lets a pending publish go out, e.g. before the worker leaves the pool.
+        if self._publisher is not None and not self._publisher.done():
+            await asyncio.wait({self._publisher}, timeout=timeout)
+            self._publisher.cancel()
+
+    def announce(self):
+        # Publishes the current state again, e.g. after the pool forgot this worker.
+        self._update()
 
-    def _docker(self, args: list[str], check: bool = True) -> subprocess.CompletedProcess:
-        return subprocess.run(["docker", *args], capture_output=True, text=True, check=check)
+    def _set_routes(self, resident: Dict[str, Dict[str, Any]]):
+        set_backend_routes({m: (None, info["port"]) for m, info in resident.items()})
 
-    def stop_current_model(self):
-        cname = self._container_name()
+    def _apply_shared_state(self, data: Dict[str, Any]):
+        version = int(data.get("version") or 0)
+        if data.get("worker", self.worker) != self.worker or version <= self._version:
+            return
+        self._version = version
+        self._state.update(parse_state(data))
+        self._set_routes(self.resident)
+
+    def _load_shared_state(self):
+        if self.conn is None:
+            return
+        raw = self.conn.hgetall(state_key(self.worker))
+        if raw:
+            self._apply_shared_state({k.decode(): v.decode() for k, v in raw.items()})
+
+    async def follow_shared_state(self):
+        if self.conn is None:
+            return
+        while True:
+            aconn = get_async_redis_conn()
+            try:
+                async with aconn.pubsub() as pubsub:
+                    await pubsub.subscribe(STATE_CHANNEL)
+                    # Load after subscribing so no change can slip in between.
+                    self._load_shared_state()
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        data = orjson.loads(message["data"])
+                        # Our own publish can echo back before its version is recorded, and
+                        # the local state may have moved on since.
+                        if data.get("owner") != self.owner:
+                            self._apply_shared_state(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Switcher state subscription lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await aconn.aclose()
+
+    def _switch_is_stale(self) -> bool:
+        updated_at = self._state.get("updated_at")
+        if not updated_at:
+            return True
+        age = (datetime.now(timezone.utc) - datetime.fromisoformat(updated_at)).total_seconds()
+        return age > int(self.cfg.gateway.get("timeouts", {}).get("SWITCH_TIMEOUT_SEC", 900))
+
+    async def _probe_ready(self, model_name: str) -> bool:
+        backend = get_backend_client()
+        try:
+            r = await backend.for_model(self.cfg.models["models"][model_name], model_name).get("/v1/models", timeout=backend.timeout(5.0))
+            return r.status_code == 200
+        except Exception:
+            return False
+
+    async def adopt_running_backend(self):
+        # On start-up, take over the backend containers that are still running
+        # instead of assuming nothing is loaded and restarting them later.
+        self._load_shared_state()
+        if self.switching and not self._switch_is_stale():
+            return
+        try:
+            containers = await self.manager.list(MODEL_LABEL)
+        except Exception:
+            log.warning("Cannot list backend containers; keeping shared state", exc_info=True)
+            return
+        resident: Dict[str, Dict[str, Any]] = {}
+        for info in containers:
+            if not info.get("State", {}).get("Running"):
+                continue
+            labels = info.get("Config", {}).get("Labels") or {}
+            if labels.get(WORKER_LABEL, self.worker) != self.worker:
+                continue
+            model = labels.get(MODEL_LABEL)
+            if model not in self.cfg.models.get("models", {}):
+                log.warning("Running backend container has unknown model label %r; not adopting", model)
+                continue
+            port = int(labels.get(PORT_LABEL) or self.cfg.models["models"][model].get("backend", {}).get("port", 8001))
+            resident[model] = {
+                "container": info.get("Name", "").lstrip("/"),
+                "port": port,
+                "host": self.backend_host,
+                "state": "loading_weights",
+                "last_used": time.time(),
+            }
+        if not resident:
+            if self.active_model or self.switching or self.resident or self.backend_state not in {"idle", "stopped"}:
+                self._update(active_model=None, backend_state="stopped", switching=False, resident={})
+            return
+        self._set_routes(resident)
+        for model, info in resident.items():
+            info["state"] = "ready" if await self._probe_ready(model) else "loading_weights"
+        active = self.active_model if self.active_model in resident else next(iter(resident))
+        self._update(active_model=active, backend_state=resident[active]["state"], switching=False, resident=resident)
+        log.info("Adopted running backends: %s", {m: info["state"] for m, info in resident.items()})
+
+    def _container_name(self, model: Optional[str] = None) -> str:
+        prefix = os.getenv("BACKEND_CONTAINER_NAME_PREFIX", "llm-backend")
+        return container_name(self.cfg, prefix, model)
+
+    async def stop_model(self, model: Optional[str]):
         graceful = int(self.cfg.gateway.get("timeouts", {}).get("GRACEFUL_STOP_TIMEOUT_SEC", 20))
-        self._docker(["rm", "-f", cname], check=False)
-        stop = self._docker(["stop", "--time", str(graceful), cname], check=False)
-        if stop.returncode != 0:
-            self._docker(["kill", cname], check=False)
-        self._docker(["rm", "-f", cname], check=False)
-        self.active_model = None
-        self.backend_state = "stopped"
-
-    def start_model(self, model_name: str):
+        info = self.resident.pop(model, None) or {}
+        await self.manager.stop(info.get("container") or self._container_name(model), graceful)
+        if model is None or model == self.active_model:
+            self._update(active_model=None, backend_state="stopped")
+        else:
+            self._update()
+
+    async def stop_current_model(self):
+        await self.stop_model(self.active_model)
+
+    async def start_model(self, model_name: str):
         model_cfg = self.cfg.models["models"][model_name]
         image = model_cfg.get("backend", {}).get("image", "nvcr.io/nvidia/vllm:25.11-py3")
-        port = int(model_cfg.get("backend", {}).get("port", 8001))
-        args = model_cfg.get("backend", {}).get("vllm_args", [])
+        # BACKEND_BASE_PORT (with its own BACKEND_CONTAINER_NAME_PREFIX) lets several workers share a host.
+        base_port = os.getenv("BACKEND_BASE_PORT")
+        taken = [info["port"] for m, info in self.resident.items() if m != model_name]
+        port = instance_port(self.cfg, model_name, taken, int(base_port) if base_port else None)
+        name = self._container_name(model_name)
         source = model_cfg["source"]["value"]
         hf_home = self.cfg.gateway.get("paths", {}).get("hf_home", "/var/lib/huggingface")
 
-        cmd = [
-            "run", "-d", "--name", self._container_name(), "--network", os.getenv("DOCKER_NETWORK_MODE", "host"),
-            "-e", f"HF_TOKEN={os.getenv('HF_TOKEN', '')}",
-            "-e", f"HF_HOME={hf_home}",
-            "-e", f"TRANSFORMERS_CACHE={hf_home}",
-            "-v", "/mnt/models:/mnt/models",
-            "-v", f"{hf_home}:{hf_home}",
-            image,
-            "python", "-m", "vllm.entrypoints.openai.api_server",
-            "--model", source,
-            "--port", str(port),
-            *args,
-        ]
-        self._docker(cmd)
-        self.active_model = model_name
-        self.backend_state = "starting"
+        await self.manager.run(
+            name=name,
+            image=image,
+            command=[
+                "python", "-m", "vllm.entrypoints.openai.api_server",
+                "--model", source,
+                *instance_args(self.cfg, model_name, port),
+            ],
+            environment={
+                "HF_TOKEN": os.getenv("HF_TOKEN", ""),
+                "HF_HOME": hf_home,
+                "TRANSFORMERS_CACHE": hf_home,
+            },
+            volumes={
+                "/mnt/models": {"bind": "/mnt/models", "mode": "rw"},
+                hf_home: {"bind": hf_home, "mode": "rw"},
+            },
+            labels={MODEL_LABEL: model_name, PORT_LABEL: str(port), WORKER_LABEL: self.worker},
+            network_mode=os.getenv("DOCKER_NETWORK_MODE", "host"),
+        )
+        self.resident[model_name] = {"container": name, "port": port, "host": self.backend_host, "state": "loading_weights", "last_used": time.time()}
+        self._update(active_model=model_name, backend_state="loading_weights")
 
-    async def wait_backend_ready(self, model_name: str):
+    async def wait_backend_ready(self, model_name: str, marks: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        marks = marks if marks is not None else {}
         model_cfg = self.cfg.models["models"][model_name]
-        port = int(model_cfg.get("backend", {}).get("port", 8001))
         timeout = int(self.cfg.gateway.get("timeouts", {}).get("BACKEND_READY_TIMEOUT_SEC", 600))
-        start = time.time()
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            while time.time() - start < timeout:
+        readiness = self.cfg.gateway.get("readiness", {})
+        slow_probe = float(readiness.get("slow_probe_sec", 2.0))
+        fast_probe = float(readiness.get("fast_probe_sec", 0.25))
+        # Switch to fast probing once this fraction of the last known load time has passed.
+        expected = self._load_history.get(model_name)
+        fast_after = expected * float(readiness.get("fast_probe_after_fraction", 0.8)) if expected else None
+
+        name = self.resident.get(model_name, {}).get("container") or self._container_name(model_name)
+        start = time.monotonic()
+        backend = get_backend_client()
+        client = backend.for_model(model_cfg, model_name)
+        watcher = asyncio.create_task(self._watch_logs(name, marks))
+        try:
+            while time.monotonic() - start < timeout:
+                state = await self.manager.state(name)
+                if not state or not state.get("Running", state.get("Status") == "running"):
+                    logs = await self.manager.logs(name, tail=200)
+                    self._update(backend_state="failed")
+                    exit_code = state.get("ExitCode") if state else None
+                    raise RuntimeError(f"Backend container for {model_name} exited (code {exit_code}) before becoming ready. Logs:\n{logs}")
                 try:
-                    r = await client.get(f"http://127.0.0.1:{port}/v1/models")
+                    r = await client.get("/v1/models", timeout=backend.timeout(5.0))
                     if r.status_code == 200:
-                        self.backend_state = "ready"
-                        return
+                        marks["ready"] = time.monotonic()
+                        self._update(backend_state="ready")
+                        self._load_history[model_name] = marks["ready"] - start
+                        return marks
                 except Exception:
                     pass
-                await asyncio.sleep(2)
+                near_end = fast_after is not None and time.monotonic() - start >= fast_after
+                interval = fast_probe if near_end or "server_up" in marks else slow_probe
+                if watcher.done():
+                    # The log stream ended but the container runs: probe at the normal
+                    # pace and follow the logs again.
+                    await asyncio.sleep(interval)
+                    watcher = asyncio.create_task(self._watch_logs(name, marks))
+                else:
+                    # Wakes early when the log stream ends, usually because the container stopped.
+                    await asyncio.wait({watcher}, timeout=interval)
+        finally:
+            watcher.cancel()
+
+        logs = await self.manager.logs(name, tail=200)
+        self._update(backend_state="failed")
+        raise RuntimeError(f"Backend readiness timeout for {model_name}. Logs:\n{logs}")
 
-        logs = self._docker(["logs", "--tail", "200", self._container_name()], check=False)
-        self.backend_state = "failed"
-        raise RuntimeError(f"Backend readiness timeout for {model_name}. Logs:\n{logs.stdout}\n{logs.stderr}")
+    async def _watch_logs(self, name: str, marks: Dict[str, float]):
+        async for line in self.manager.follow_logs(name):
+            for milestone, state, markers in LOG_MILESTONES:
+                if milestone not in marks and any(m in line for m in markers):
+                    marks[milestone] = time.monotonic()
+                    if self.backend_state != "ready":
+                        self._update(backend_state=state)
+
+    def _cached_ratio(self, model_name: str) -> Optional[float]:
+        # Share of the checkpoint already in the page cache (e.g. prestaged) when the switch began.
+        try:
+            cached, total = checkpoint_residency(weight_files(self.cfg, model_name))
+        except Exception:
+            log.debug("Could not measure page cache residency of %s", model_name, exc_info=True)
+            return None
+        return round(cached / total, 3) if total else None
+
+    def _record_switch(
+        self,
+        from_model: Optional[str],
+        to_model: str,
+        marks: Dict[str, float],
+        error: Optional[str] = None,
+        cached_ratio: Optional[float] = None,
+        evicted: Optional[List[str]] = None,
+    ):
+        def span(end: str, *starts: str) -> Optional[float]:
+            if end not in marks:
+                return None
+            begin = next((marks[s] for s in starts if s in marks), None)
+            return round(marks[end] - begin, 3) if begin is not None else None
+
+        record = {
+            "from": from_model,
+            "to": to_model,
+            "worker": self.worker,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "ok": error is None,
+            "error": error[:500] if error else None,
+            "total_sec": round(marks.get("ready", time.monotonic()) - marks["begin"], 3),
+            "weights_cached_ratio": cached_ratio,
+            "evicted": evicted or [],
+            "phases": {
+                "stop": span("stopped", "begin"),
+                "start": span("started", "stopped", "begin"),
+                "weight_load": span("weights_loaded", "started"),
+                "warmup": span("server_up", "weights_loaded", "started"),
+                "first_ready": span("ready", "server_up", "weights_loaded", "started"),
+            },
+        }
+        self.last_switch = record
+        METRICS.inc("llm_model_switches_total", from_model=from_model or "", to_model=to_model, outcome="ok" if error is None else "error")
+        if error is None:
+            METRICS.observe("llm_model_switch_seconds", record["total_sec"], from_model=from_model or "", to_model=to_model)
+            if cached_ratio is not None:
+                METRICS.observe("llm_model_switch_cached_ratio", cached_ratio, to_model=to_model)
+        log.info("Switch %s -> %s: %s", from_model, to_model, record)
+        if self.conn is not None:
+            try:
+                with self.conn.pipeline(transaction=False) as pipe:
+                    pipe.lpush(SWITCH_HISTORY_KEY, orjson.dumps(record))
+                    pipe.ltrim(SWITCH_HISTORY_KEY, 0, SWITCH_HISTORY_LEN - 1)
+                    if error is None:
+                        record_switch_stats(self.conn, self.cfg, to_model, record["total_sec"], pipe=pipe)
+                    pipe.execute()
+            except Exception:
+                log.warning("Could not persist switch record", exc_info=True)
+
+    def _activate(self, model_name: str):
+        # A resident instance that is ready: switching to it is just routing.
+        if self.active_model != model_name:
+            log.info("Switch %s -> %s: already resident", self.active_model, model_name)
+            self._update(active_model=model_name, backend_state="ready")
+
+    def _switch_costs(self) -> Optional[Dict[str, float]]:
+        if self.conn is None or self.cfg.gateway.get("placement", {}).get("eviction", "lru") != "cost":
+            return None
+        return {m: stats["switch_sec"] for m, stats in model_stats(self.conn, self.cfg, self.resident).items()}
 
     async def ensure_model_active(self, model_name: str):
         model_cfg = self.cfg.models.get("models", {})
         if model_name not in model_cfg:
             raise ValueError(f"Unknown model: {model_name}")
 
-        if self.active_model == model_name and self.backend_state == "ready":
+        if self.is_ready(model_name):
+            self._activate(model_name)
             return
 
         lock_path = self.cfg.gateway.get("locks", {}).get("file_lock_path", "/var/lock/llm-switch.lock")
         async with switch_lock:
-            with file_switch_lock(lock_path, timeout=int(self.cfg.gateway.get("timeouts", {}).get("SWITCH_TIMEOUT_SEC", 900))):
-                if self.active_model == model_name and self.backend_state == "ready":
+            async with async_file_switch_lock(lock_path, timeout=int(self.cfg.gateway.get("timeouts", {}).get("SWITCH_TIMEOUT_SEC", 900))):
+                # Another process may have switched while we waited for the lock.
+                self._load_shared_state()
+                if self.is_ready(model_name):
+                    self._activate(model_name)
                     return
-                self.switching = True
+                instance = self.resident.get(model_name)
+                if instance and instance.get("state") in {"loading_weights", "warming_up"}:
+                    state = await self.manager.state(instance["container"])
+                    if state and state.get("Running"):
+                        # An adopted backend is still starting: wait for it rather than restart it.
+                        self._update(active_model=model_name, backend_state=instance["state"], switching=True)
+                        try:
+                            await self.wait_backend_ready(model_name)
+                        finally:
+                            self._update(switching=False)
+                        return
+                self._update(switching=True)
+                previous = self.active_model
+                marks = {"begin": time.monotonic()}
+                cached_ratio = await asyncio.to_thread(self._cached_ratio, model_name)
+                evicted: List[str] = []
                 try:
-                    if self.active_model:
-                        self.stop_current_model()
-                    self.start_model(model_name)
-                    await self.wait_backend_ready(model_name)
+                    if previous in self.resident:
+                        self.resident[previous]["last_used"] = time.time()
+                    costs = await asyncio.to_thread(self._switch_costs)
+                    for victim in plan_evictions(self.cfg, self.resident, model_name, costs):
+                        await self.stop_model(victim)
+                        evicted.append(victim)
+                    marks["stopped"] = time.monotonic()
+                    await self.start_model(model_name)
+                    marks["started"] = time.monotonic()
+                    await self.wait_backend_ready(model_name, marks)
+                except Exception as exc:
+                    self._record_switch(previous, model_name, marks, error=str(exc), cached_ratio=cached_ratio, evicted=evicted)
+                    raise
+                else:
+                    self._record_switch(previous, model_name, marks, cached_ratio=cached_ratio, evicted=evicted)
                 finally:
-                    self.switching = False
+                    self._update(switching=False)
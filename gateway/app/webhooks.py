@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import logging
+import socket
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+import orjson
+from fastapi import BackgroundTasks, HTTPException
+
+log = logging.getLogger(__name__)
+
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def webhook_error(cfg, webhook_url: str) -> Optional[str]:
+    # Why the URL may not be called, or None. Checked at submit and again before each
+    # delivery, since what a name resolves to can change in between.
+    wcfg = cfg.gateway.get("webhooks", {})
+    if not wcfg.get("enabled", False):
+        return "Webhooks are disabled"
+    parts = urlsplit(webhook_url)
+    if parts.scheme not in {"http", "https"} or not parts.hostname:
+        return "webhook_url must be an absolute http(s) URL"
+    allowed = wcfg.get("allowed_hosts") or []
+    if allowed and parts.hostname not in allowed:
+        return f"webhook host {parts.hostname} is not allowed"
+    if wcfg.get("allow_private_networks", False):
+        return None
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, parts.port or 443, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError):
+        return f"webhook host {parts.hostname} does not resolve"
+    if not all(_public(info[4][0]) for info in infos):
+        return f"webhook host {parts.hostname} resolves to a non-public address"
+    return None
+
+
+async def webhook_meta(cfg, webhook_url: Optional[str]) -> Dict[str, Any]:
+    if not webhook_url:
+        return {}
+    error = await webhook_error(cfg, webhook_url)
+    if error:
+        raise HTTPException(status_code=422, detail=error)
+    return {"webhook_url": webhook_url}
+
+
+def notify_webhook(background: BackgroundTasks, cfg, meta: Dict[str, Any], body: Dict[str, Any]):
+    if meta.get("webhook_url"):
+        background.add_task(deliver_webhook, cfg, meta["webhook_url"], body)
+
+
+def _client(cfg) -> httpx.AsyncClient:
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.AsyncClient(timeout=float(cfg.gateway.get("webhooks", {}).get("timeout_sec", 10)))
+    return _CLIENT
+
+
+async def deliver_webhook(cfg, url: str, body: Dict[str, Any]):
+    wcfg = cfg.gateway.get("webhooks", {})
+    attempts = max(1, int(wcfg.get("max_attempts", 3)))
+    error = await webhook_error(cfg, url)
+    if error:
+        log.error("Not delivering webhook %s for job %s: %s", url, body.get("id"), error)
+        return
+    content = orjson.dumps(body)
+    for attempt in range(1, attempts + 1):
+        try:
+            resp = await _client(cfg).post(url, content=content, headers={"Content-Type": "application/json"})
+            if resp.status_code < 500:
+                if resp.status_code >= 400:
+                    log.warning("Webhook %s for job %s rejected: HTTP %s", url, body.get("id"), resp.status_code)
+                return
+        except httpx.HTTPError as exc:
+            log.warning("Webhook %s for job %s failed (attempt %s/%s): %s", url, body.get("id"), attempt, attempts, exc)
+        if attempt < attempts:
+            await asyncio.sleep(float(wcfg.get("retry_backoff_sec", 2)) * 2 ** (attempt - 1))
+    log.error("Giving up on webhook %s for job %s", url, body.get("id"))
+
+
+async def close_webhook_client():
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
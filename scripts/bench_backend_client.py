@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Per-request overhead of a fresh httpx.AsyncClient per call vs the shared pooled BackendClient.
+
+Starts scripts/stub_backend.py (zero generation delay) unless --no-stub is given, then sends the
+same chat request N times through both paths and reports mean/p50/p99 latency.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from app.backend_client import BackendClient  # noqa: E402
+from app.config import AppConfig  # noqa: E402
+
+PAYLOAD = {"model": "stub", "messages": [{"role": "user", "content": "ping"}], "max_tokens": 4}
+
+
+async def per_call_client(port: int):
+    async with httpx.AsyncClient(timeout=30) as client:
+        resp = await client.post(f"http://127.0.0.1:{port}/v1/chat/completions", json=PAYLOAD)
+        resp.raise_for_status()
+
+
+async def run(label: str, n: int, concurrency: int, call):
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            await call()
+            samples.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - t0
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<14} mean={statistics.mean(samples):7.2f}ms p50={statistics.median(samples):7.2f}ms p99={p99:7.2f}ms rps={n / wall:8.1f}")
+
+
+async def wait_ready(port: int):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}/v1/models")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("stub backend did not start")
+
+
+async def main_async(args):
+    await wait_ready(args.port)
+    model_cfg = {"backend": {"port": args.port}}
+    shared = BackendClient(AppConfig(gateway={}, models={}))
+    client = shared.for_model(model_cfg)
+
+    async def pooled():
+        resp = await client.post("/v1/chat/completions", json=PAYLOAD)
+        resp.raise_for_status()
+
+    for _ in range(20):
+        await pooled()
+    for concurrency in args.concurrency:
+        print(f"-- {args.requests} requests, concurrency={concurrency}")
+        await run("per-call", args.requests, concurrency, lambda: per_call_client(args.port))
+        await run("shared-pool", args.requests, concurrency, pooled)
+    await shared.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--no-stub", action="store_true", help="use a backend already listening on --port")
+    args = parser.parse_args()
+
+    stub = None
+    if not args.no_stub:
+        stub = subprocess.Popen([sys.executable, str(ROOT / "scripts" / "stub_backend.py"), "--port", str(args.port), "--tokens", "4"])
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        if stub:
+            stub.terminate()
+            stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Gateway-added latency and requests/s: BaseHTTPMiddleware stack vs the pure-ASGI one.
+
+Starts scripts/stub_backend.py and one uvicorn process per middleware variant, then measures GET /health
+and a sync POST /v1/chat/completions (proxied to the stub) at each concurrency level. "direct" calls the
+stub itself, so gateway overhead is the difference to it. "legacy" reproduces the previous
+BaseHTTPMiddleware request-id and in-memory rate-limit middlewares; "current" installs the real stack
+(request id, Redis rate limiter, body limit). Needs Redis at REDIS_URL.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.backend_client import close_backend_client, init_backend_client  # noqa: E402
+from app.config import AppConfig  # noqa: E402
+
+PAYLOAD = {"model": "stub", "messages": [{"role": "user", "content": "ping"}], "max_tokens": 4, "async": False}
+
+
+class LegacyRequestContextMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request_id = str(uuid.uuid4())
+        request.state.request_id = request_id
+        response = await call_next(request)
+        response.headers["X-Request-Id"] = request_id
+        return response
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, rpm: int = 120):
+        super().__init__(app)
+        self.rpm = rpm
+        self.reqs = defaultdict(deque)
+
+    async def dispatch(self, request: Request, call_next):
+        limiter_cfg = request.app.state.cfg.gateway.get("security", {}).get("rate_limit", {})
+        rpm = int(limiter_cfg.get("requests_per_minute", self.rpm))
+        key = request.headers.get("x-api-key") or (request.client.host if request.client else "unknown")
+        now = time.time()
+        bucket = self.reqs[key]
+        while bucket and bucket[0] < now - 60:
+            bucket.popleft()
+        if len(bucket) >= rpm:
+            return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
+        bucket.append(now)
+        return await call_next(request)
+
+
+def build_app(variant: str, backend_port: int) -> FastAPI:
+    from app.middleware import install_middleware
+    from app.routes_admin import router as admin_router
+    from app.routes_openai import router as openai_router
+
+    # Budgets too large to ever reject, so the limiter does its full work on every request.
+    cfg = AppConfig(
+        gateway={
+            "security": {"require_api_key": False, "rate_limit": {"requests_per_minute": 10**9, "tokens_per_minute": 10**12}},
+            "cache": {"enabled": False},
+        },
+        models={"models": {"stub": {"backend": {"port": backend_port}}}},
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        init_backend_client(cfg)
+        yield
+        await close_backend_client()
+
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.state.cfg = cfg
+    app.state.switcher = SimpleNamespace(active_model="stub", switching=False, backend_state="ready", is_ready=lambda model: True)
+    if variant == "legacy":
+        app.add_middleware(LegacyRequestContextMiddleware)
+        app.add_middleware(LegacyRateLimitMiddleware, rpm=10**9)
+    else:
+        install_middleware(app, cfg)
+    app.include_router(openai_router)
+    app.include_router(admin_router)
+    return app
+
+
+async def run(label: str, client: httpx.AsyncClient, method: str, path: str, n: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+    kwargs = {"json": PAYLOAD} if method == "POST" else {}
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            resp = await client.request(method, path, **kwargs)
+            resp.raise_for_status()
+            samples.append((time.perf_counter() - t0) * 1000)
+
+    for _ in range(50):
+        await one()
+    samples.clear()
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - t0
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<8} mean={statistics.mean(samples):7.2f}ms p50={statistics.median(samples):7.2f}ms p99={p99:7.2f}ms rps={n / wall:8.1f}")
+
+
+async def wait_ready(port: int, path: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}{path}")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server on :{port} did not start")
+
+
+def serve(variant: str, port: int, backend_port: int):
+    import uvicorn
+
+    uvicorn.run(build_app(variant, backend_port), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--port", type=int, default=18200)
+    parser.add_argument("--serve", choices=["legacy", "current"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend-port", type=int, default=18299)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port, args.backend_port)
+        return
+
+    procs = [subprocess.Popen([sys.executable, str(ROOT / "scripts" / "stub_backend.py"), "--port", str(args.backend_port), "--tokens", "4"])]
+    ports = {"legacy": args.port, "current": args.port + 1}
+    try:
+        for variant, port in ports.items():
+            procs.append(subprocess.Popen([sys.executable, __file__, "--serve", variant, "--port", str(port), "--backend-port", str(args.backend_port)]))
+
+        async def bench():
+            await wait_ready(args.backend_port, "/v1/models")
+            for port in ports.values():
+                await wait_ready(port, "/health")
+            targets = {"direct": args.backend_port, **ports}
+            for concurrency in args.concurrency:
+                limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+                for method, path in (("GET", "/health"), ("POST", "/v1/chat/completions")):
+                    print(f"-- {method} {path}, {args.requests} requests, concurrency={concurrency}")
+                    for label, port in targets.items():
+                        if label == "direct" and path == "/health":
+                            continue
+                        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+                            await run(label, client, method, path, args.requests, concurrency)
+
+        asyncio.run(bench())
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Concurrent GET /jobs/{id} polling: the old blocking handler vs the pooled, non-blocking one.
+
+Seeds jobs into the Redis at REDIS_URL, starts one uvicorn process per variant and polls random job
+ids at each concurrency level. "legacy" reproduces the previous handler (new Redis client and a
+blocking Job.fetch on the event loop per request); "current" mounts the real routes_jobs router.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from fastapi import FastAPI, HTTPException  # noqa: E402
+from redis import Redis  # noqa: E402
+from rq.job import Job  # noqa: E402
+
+from app.config import AppConfig  # noqa: E402
+from app.queue import get_queue, get_redis_conn  # noqa: E402
+
+BENCH_PREFIX = "bench-status-"
+
+
+def legacy_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        try:
+            job = Job.fetch(job_id, connection=Redis.from_url(os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")))
+        except Exception:
+            raise HTTPException(status_code=404, detail="Job not found")
+        meta = job.meta or {}
+        return {"id": job.id, "status": job.get_status(), "requested_model": meta.get("requested_model"), "progress": meta.get("progress")}
+
+    return app
+
+
+def current_app() -> FastAPI:
+    from app.routes_jobs import router
+
+    app = FastAPI()
+    app.state.cfg = AppConfig(gateway={"security": {"require_api_key": False}}, models={})
+    app.include_router(router)
+    return app
+
+
+def seed(n: int) -> list[str]:
+    q = get_queue()
+    ids = []
+    for i in range(n):
+        job = Job.create(
+            "worker.tasks.process_chat_job",
+            kwargs={"payload": {"model": "bench", "messages": [{"role": "user", "content": "x" * 2000}]}},
+            connection=q.connection,
+            id=f"{BENCH_PREFIX}{i}",
+            meta={"requested_model": "bench", "progress": 0.5},
+            origin=q.name,
+        )
+        job.save()
+        ids.append(job.id)
+    return ids
+
+
+def cleanup(ids: list[str]):
+    conn = get_redis_conn()
+    conn.delete(*(Job.key_for(job_id) for job_id in ids))
+
+
+async def run(label: str, port: int, ids: list[str], n: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+
+        async def one():
+            async with sem:
+                t0 = time.perf_counter()
+                resp = await client.get(f"/jobs/{random.choice(ids)}")
+                resp.raise_for_status()
+                samples.append((time.perf_counter() - t0) * 1000)
+
+        for _ in range(50):
+            await one()
+        samples.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        wall = time.perf_counter() - t0
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<8} mean={statistics.mean(samples):7.2f}ms p50={statistics.median(samples):7.2f}ms p99={p99:7.2f}ms rps={n / wall:8.1f}")
+
+
+async def wait_ready(port: int):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                await client.get(f"http://127.0.0.1:{port}/docs")
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"server on :{port} did not start")
+
+
+def serve(variant: str, port: int):
+    import uvicorn
+
+    app = legacy_app() if variant == "legacy" else current_app()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 64, 256])
+    parser.add_argument("--port", type=int, default=18100)
+    parser.add_argument("--serve", choices=["legacy", "current"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    ids = seed(args.jobs)
+    servers = {}
+    try:
+        for offset, variant in enumerate(("legacy", "current")):
+            port = args.port + offset
+            servers[variant] = (port, subprocess.Popen([sys.executable, __file__, "--serve", variant, "--port", str(port)]))
+
+        async def bench():
+            for port, _ in servers.values():
+                await wait_ready(port)
+            for concurrency in args.concurrency:
+                print(f"-- {args.requests} requests, concurrency={concurrency}")
+                for variant, (port, _) in servers.items():
+                    await run(variant, port, ids, args.requests, concurrency)
+
+        asyncio.run(bench())
+    finally:
+        for _, proc in servers.values():
+            proc.terminate()
+            proc.wait()
+        cleanup(ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Run a pool of workers on one machine against fake backends and report where jobs ran.
+
+Starts --workers worker processes (scripts/fake_worker.py), each with its own
+WORKER_NAME, container prefix, switch lock and BACKEND_BASE_PORT, so their stub backends
+listen on different ports as if on different hosts. Placement fits one model per worker.
+Enqueues --jobs chat jobs for --models models in random order and waits for all of them,
+then reports which worker ran each model's jobs and how many switches each made. With
+--kill-after N, the first worker is killed (SIGKILL, with its backends) once N jobs have
+finished; the others requeue its jobs after pool.dead_after_sec. The database at
+--redis-url is flushed first.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import orjson
+import yaml
+from redis import Redis
+from rq.job import Job
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from app.config import AppConfig  # noqa: E402
+from app.pool import live_workers  # noqa: E402
+from app.queue import get_queue  # noqa: E402
+from app.scheduler import enqueue_job  # noqa: E402
+from app.switcher import SWITCH_HISTORY_KEY  # noqa: E402
+
+TERMINAL = {"finished", "failed", "canceled", "stopped"}
+
+
+def write_configs(tmp: Path, names, args):
+    models = {
+        f"model-{chr(ord('a') + i)}": {
+            "source": {"type": "local_path", "value": f"/mnt/models/model-{i}"},
+            "backend": {"port": 8001, "vllm_args": [], "max_concurrency": 4},
+            "resources": {"memory_gb": 40},
+        }
+        for i in range(args.models)
+    }
+    gateway = {
+        "jobs": {"result_ttl_sec": 3600, "max_concurrency": 4},
+        "results": {"spill_dir": str(tmp / "results")},
+        "timeouts": {"BACKEND_READY_TIMEOUT_SEC": int(args.load_delay * 4 + 30), "GRACEFUL_STOP_TIMEOUT_SEC": 5},
+        "placement": {"memory_budget_gb": 50, "total_memory_gb": 128},
+        "pool": {"heartbeat_sec": 1, "dead_after_sec": args.dead_after, "poll_sec": 0.5, "locality_wait_sec": 30, "max_requeues": 2},
+        "prestage": {"enabled": False},
+        "preload": {"enabled": False},
+        "cache": {"enabled": False},
+        "webhooks": {"enabled": False},
+    }
+    (tmp / "models.yaml").write_text(yaml.safe_dump({"models": models}))
+    for name in names:
+        cfg = {**gateway, "locks": {"file_lock_path": str(tmp / f"{name}.lock")}}
+        (tmp / f"{name}.yaml").write_text(yaml.safe_dump(cfg))
+    return AppConfig(gateway=gateway, models={"models": models})
+
+
+def start_worker(tmp: Path, name: str, index: int, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "REDIS_URL": args.redis_url,
+        "GATEWAY_YAML_PATH": str(tmp / f"{name}.yaml"),
+        "MODELS_YAML_PATH": str(tmp / "models.yaml"),
+        "WORKER_NAME": name,
+        "BACKEND_CONTAINER_NAME_PREFIX": f"llm-backend-{name}",
+        "BACKEND_BASE_PORT": str(args.base_port + index * 10),
+        "FAKE_DOCKER_LOAD_DELAY_SEC": str(args.load_delay),
+        "FAKE_DOCKER_TOKEN_DELAY_MS": str(args.token_delay_ms),
+    }
+    log = open(tmp / f"{name}.log", "wb")
+    # Its own session, so killing the worker's group also takes down its stub backends.
+    return subprocess.Popen([sys.executable, str(ROOT / "scripts" / "fake_worker.py")], env=env, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--redis-url", default="redis://127.0.0.1:6379/15")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--models", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--load-delay", type=float, default=3.0, help="fake model load time")
+    parser.add_argument("--token-delay-ms", type=float, default=50.0, help="fake generation time per token (16 tokens a job)")
+    parser.add_argument("--base-port", type=int, default=8201)
+    parser.add_argument("--dead-after", type=float, default=5.0)
+    parser.add_argument("--kill-after", type=int, default=0, help="kill the first worker once this many jobs finished")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ["REDIS_URL"] = args.redis_url
+    conn = Redis.from_url(args.redis_url)
+    conn.flushdb()
+    names = [f"w{i + 1}" for i in range(args.workers)]
+    procs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        cfg = write_configs(tmp, names, args)
+        try:
+            for i, name in enumerate(names):
+                procs[name] = start_worker(tmp, name, i, args)
+            deadline = time.time() + 30
+            while len(live_workers(conn, cfg)) < len(names):
+                if time.time() > deadline:
+                    raise SystemExit(f"workers did not join the pool; see {tmp}/*.log")
+                time.sleep(0.2)
+
+            random.seed(args.seed)
+            models = sorted(cfg.models["models"])
+            queue = get_queue(conn)
+            began = time.time()
+            ids = []
+            for _ in range(args.jobs):
+                model = random.choice(models)
+                payload = {"model": model, "messages": [{"role": "user", "content": "ping"}], "max_tokens": 16}
+                ids.append(enqueue_job(queue, "worker.tasks.process_chat_job", model, {"payload": payload}).id)
+
+            killed = None
+            while True:
+                statuses = [s.decode() if s else None for s in (conn.hget(f"rq:job:{i}", "status") for i in ids)]
+                done = sum(s in TERMINAL for s in statuses)
+                if args.kill_after and killed is None and done >= args.kill_after:
+                    killed = names[0]
+                    os.killpg(procs[killed].pid, signal.SIGKILL)
+                    print(f"killed {killed} after {done} jobs")
+                if done == len(ids):
+                    break
+                time.sleep(0.2)
+            elapsed = time.time() - began
+
+            placed = defaultdict(Counter)
+            outcomes = Counter(statuses)
+            requeued = 0
+            for job in Job.fetch_many(ids, connection=conn):
+                placed[job.worker_name][job.meta.get("requested_model")] += 1
+                requeued += bool(job.meta.get("requeues"))
+            switches = Counter(orjson.loads(r).get("worker") for r in conn.lrange(SWITCH_HISTORY_KEY, 0, -1))
+
+            print(f"{len(ids)} jobs over {len(models)} models on {len(names)} workers in {elapsed:.1f}s: {dict(outcomes)}")
+            for name in names:
+                print(f"  {name}: switches={switches.get(name, 0)} jobs={dict(sorted(placed.get(name, {}).items()))}")
+            print(f"requeued after a worker died: {requeued}")
+        finally:
+            for proc in procs.values():
+                if proc.poll() is None:
+                    os.killpg(proc.pid, signal.SIGTERM)
+            for proc in procs.values():
+                try:
+                    proc.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    os.killpg(proc.pid, signal.SIGKILL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""Checkpoint load time from disk vs after prestaging into the page cache.
+
+Writes --shards synthetic weight files (--size-gb in total) under --dir, which must be on a
+real disk rather than tmpfs, and evicts them with POSIX_FADV_DONTNEED. A stand-in loader then
+reads every shard sequentially in 1 MiB reads, as a checkpoint load does, first cold and then
+after app.prestage.stage_files has staged the files. Reports the residency the switcher would
+record as weights_cached_ratio before each load.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from app.prestage import checkpoint_residency, stage_files  # noqa: E402
+
+
+def write_shards(root: Path, shards: int, size: int):
+    block = os.urandom(1024 * 1024)
+    files = []
+    for i in range(shards):
+        path = root / f"model-{i + 1:05d}-of-{shards:05d}.safetensors"
+        with open(path, "wb") as f:
+            for _ in range(size // shards // len(block)):
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        files.append(path)
+    return files
+
+
+def evict(files):
+    for path in files:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def load(files) -> float:
+    began = time.perf_counter()
+    for path in files:
+        with open(path, "rb", buffering=0) as f:
+            while f.read(1024 * 1024):
+                pass
+    return time.perf_counter() - began
+
+
+def ratio(files) -> float:
+    cached, total = checkpoint_residency(files)
+    return cached / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dir", default="/var/tmp", help="parent directory for the shards (not tmpfs)")
+    parser.add_argument("--size-gb", type=float, default=2.0)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--max-mb-per-sec", type=float, default=0, help="prestage throttle, 0 = unthrottled")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        files = write_shards(Path(tmp), args.shards, int(args.size_gb * 1024**3))
+        gib = sum(p.stat().st_size for p in files) / 1024**3
+        print(f"{len(files)} shards, {gib:.2f} GiB in {tmp}")
+
+        evict(files)
+        cold_ratio = ratio(files)
+        cold = load(files)
+
+        evict(files)
+        began = time.perf_counter()
+        staged = stage_files(files, 1 << 62, 0, args.max_mb_per_sec * 1024**2, should_stop=lambda: False)
+        stage_sec = time.perf_counter() - began
+        warm_ratio = ratio(files)
+        warm = load(files)
+
+        print(f"prestage    {staged / 1024**3:6.2f} GiB in {stage_sec:6.2f}s ({staged / 1024**2 / stage_sec:.0f} MiB/s)")
+        print(f"cold load   {cold:6.2f}s  {gib / cold:5.2f} GiB/s  cached_ratio={cold_ratio:.3f}")
+        print(f"staged load {warm:6.2f}s  {gib / warm:5.2f} GiB/s  cached_ratio={warm_ratio:.3f}")
+        print(f"speedup     {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Time model switches offline against the fake Docker client.
+
+Each fake container runs scripts/stub_backend.py with --startup-delay-sec, standing in for
+vLLM's weight load. While switching, a ticker task measures event-loop lag to show that the
+lifecycle calls no longer block the loop. With --co-resident both models fit the placement
+budget, so after each has loaded once, switching between them starts nothing.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from app.backend_client import close_backend_client, init_backend_client  # noqa: E402
+from app.backend_manager import BackendManager  # noqa: E402
+from app.config import AppConfig  # noqa: E402
+from app.switcher import ModelSwitcher  # noqa: E402
+from fake_docker import FakeDockerClient  # noqa: E402
+
+
+def build_config(port: int, ready_timeout: int, co_resident: bool = False) -> AppConfig:
+    models = {
+        name: {
+            "source": {"type": "local_path", "value": f"/mnt/models/{name}"},
+            "backend": {"port": port, "vllm_args": []},
+            "resources": {"memory_gb": 40},
+        }
+        for name in ("model-a", "model-b")
+    }
+    gateway = {
+        "timeouts": {"BACKEND_READY_TIMEOUT_SEC": ready_timeout, "GRACEFUL_STOP_TIMEOUT_SEC": 5},
+        "locks": {"file_lock_path": str(Path(tempfile.gettempdir()) / "llm-switch-bench.lock")},
+        "placement": {"memory_budget_gb": 100 if co_resident else 0, "base_port": port},
+    }
+    return AppConfig(gateway=gateway, models={"models": models})
+
+
+async def ticker(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - t0 - interval)
+
+
+async def main_async(args):
+    cfg = build_config(args.port, ready_timeout=int(args.load_delay * 4 + 30), co_resident=args.co_resident)
+    client = FakeDockerClient(load_delay_sec=args.load_delay, stop_delay_sec=args.stop_delay)
+    switcher = ModelSwitcher(cfg, manager=BackendManager(client))
+    init_backend_client(cfg)
+
+    lags: list = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    durations = []
+    try:
+        for i in range(args.switches):
+            model = "model-a" if i % 2 == 0 else "model-b"
+            t0 = time.perf_counter()
+            last = switcher.last_switch
+            await switcher.ensure_model_active(model)
+            durations.append(time.perf_counter() - t0)
+            phases = switcher.last_switch["phases"] if switcher.last_switch is not last else "resident"
+            print(f"switch {i + 1}: -> {model} in {durations[-1]:.2f}s phases={phases}")
+        for model in list(switcher.resident):
+            await switcher.stop_model(model)
+    finally:
+        stop.set()
+        await tick
+        await close_backend_client()
+
+    print(f"switch mean={statistics.mean(durations):.2f}s max={max(durations):.2f}s")
+    print(f"event-loop lag during switches: max={max(lags) * 1000:.1f}ms mean={statistics.mean(lags) * 1000:.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=18101)
+    parser.add_argument("--switches", type=int, default=4)
+    parser.add_argument("--load-delay", type=float, default=1.0, help="simulated weight load seconds")
+    parser.add_argument("--stop-delay", type=float, default=0.2, help="simulated graceful stop seconds")
+    parser.add_argument("--co-resident", action="store_true", help="let both models stay loaded (placement budget)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Sync /v1/chat/completions with large prompts: validate-and-reserialize vs raw byte passthrough.
+
+Starts scripts/stub_backend.py and one uvicorn process per variant, then posts the same large multi-turn
+request (--messages x --message-kb) at each concurrency level. "legacy" reproduces the previous sync path
+(pydantic validation, model_dump, httpx json=, resp.json(), ORJSONResponse); "current" mounts the real
+routes_openai router, which peeks at the body with orjson and forwards the bytes unchanged. "direct"
+posts to the stub itself. Needs Redis at REDIS_URL.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Literal
+
+import httpx
+import orjson
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.responses import ORJSONResponse  # noqa: E402
+from pydantic import BaseModel, Field  # noqa: E402
+
+from app.backend_client import close_backend_client, get_backend_client, init_backend_client  # noqa: E402
+from app.config import AppConfig  # noqa: E402
+
+
+class LegacyMessage(BaseModel):
+    role: Literal["system", "user", "assistant", "tool"]
+    content: str
+
+
+class LegacyRequest(BaseModel):
+    model: str
+    messages: List[LegacyMessage]
+    temperature: float = 0.7
+    max_tokens: int = 512
+    stream: bool = False
+    async_mode: bool = Field(default=True, alias="async")
+
+
+def make_body(messages: int, message_kb: int) -> bytes:
+    text = ("lorem ipsum dolor sit amet " * (message_kb * 1024 // 27 + 1))[: message_kb * 1024]
+    turns = [{"role": "user" if i % 2 == 0 else "assistant", "content": text} for i in range(messages)]
+    return orjson.dumps({"model": "stub", "messages": turns, "max_tokens": 4, "async": False})
+
+
+def build_app(variant: str, backend_port: int) -> FastAPI:
+    cfg = AppConfig(
+        gateway={"security": {"require_api_key": False}, "cache": {"enabled": False}},
+        models={"models": {"stub": {"backend": {"port": backend_port}}}},
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        init_backend_client(cfg)
+        yield
+        await close_backend_client()
+
+    app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+    app.state.cfg = cfg
+    app.state.switcher = SimpleNamespace(active_model="stub", switching=False, backend_state="ready", is_ready=lambda model: True)
+    if variant == "legacy":
+
+        @app.post("/v1/chat/completions")
+        async def chat(req: LegacyRequest, request: Request):
+            payload = req.model_dump(by_alias=True)
+            payload.pop("async", None)
+            backend = get_backend_client()
+            resp = await backend.for_model(cfg.models["models"]["stub"]).post("/v1/chat/completions", json=payload, timeout=backend.timeout(60))
+            resp.raise_for_status()
+            return resp.json()
+
+    else:
+        from app.routes_openai import router
+
+        app.include_router(router)
+    return app
+
+
+async def run(label: str, port: int, body: bytes, n: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    headers = {"Content-Type": "application/json"}
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120) as client:
+
+        async def one():
+            async with sem:
+                t0 = time.perf_counter()
+                resp = await client.post("/v1/chat/completions", content=body, headers=headers)
+                resp.raise_for_status()
+                samples.append((time.perf_counter() - t0) * 1000)
+
+        for _ in range(10):
+            await one()
+        samples.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(n)))
+        wall = time.perf_counter() - t0
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{label:<8} mean={statistics.mean(samples):7.2f}ms p50={statistics.median(samples):7.2f}ms p99={p99:7.2f}ms rps={n / wall:8.1f}")
+
+
+async def wait_ready(port: int, path: str):
+    async with httpx.AsyncClient() as client:
+        for _ in range(100):
+            try:
+                if (await client.get(f"http://127.0.0.1:{port}{path}")).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"server on :{port} did not start")
+
+
+def serve(variant: str, port: int, backend_port: int):
+    import uvicorn
+
+    uvicorn.run(build_app(variant, backend_port), host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--message-kb", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--port", type=int, default=18300)
+    parser.add_argument("--serve", choices=["legacy", "current"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend-port", type=int, default=18399)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port, args.backend_port)
+        return
+
+    body = make_body(args.messages, args.message_kb)
+    procs = [subprocess.Popen([sys.executable, str(ROOT / "scripts" / "stub_backend.py"), "--port", str(args.backend_port), "--tokens", "4"])]
+    ports = {"legacy": args.port, "current": args.port + 1}
+    try:
+        for variant, port in ports.items():
+            procs.append(subprocess.Popen([sys.executable, __file__, "--serve", variant, "--port", str(port), "--backend-port", str(args.backend_port)]))
+
+        async def bench():
+            await wait_ready(args.backend_port, "/v1/models")
+            for port in ports.values():
+                await wait_ready(port, "/docs")
+            for concurrency in args.concurrency:
+                print(f"-- {len(body) / 1024:.0f} KiB body, {args.requests} requests, concurrency={concurrency}")
+                for label, port in {"direct": args.backend_port, **ports}.items():
+                    await run(label, port, body, args.requests, concurrency)
+
+        asyncio.run(bench())
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
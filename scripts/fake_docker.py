@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from docker.errors import APIError, NotFound
+
+STUB_BACKEND = Path(__file__).resolve().parent / "stub_backend.py"
+
+
+def _arg(command: List[str], flag: str) -> Optional[str]:
+    if flag in command:
+        idx = command.index(flag)
+        if idx + 1 < len(command):
+            return command[idx + 1]
+    return None
+
+
+# In-memory stand-in for docker.DockerClient. Each "container" runs
+# scripts/stub_backend.py on the port from the vLLM command line, after a
+# configurable load delay, so switches can be exercised and timed offline.
+class FakeContainer:
+    def __init__(self, client: "FakeDockerClient", name: str, image: str, command: List[str], labels: Dict[str, str]):
+        self.client = client
+        self.name = name
+        self.image = image
+        self.command = command
+        self.labels = labels
+        self.status = "running"
+        self.exit_code = 0
+        self._log = tempfile.NamedTemporaryFile(prefix=f"fake-{name}-", suffix=".log", delete=False)
+        self._proc: Optional[subprocess.Popen] = None
+        port = _arg(command, "--port")
+        if client.spawn_stubs and port:
+            self._proc = subprocess.Popen(
+                [
+                    sys.executable, str(STUB_BACKEND),
+                    "--port", port,
+                    "--model", _arg(command, "--served-model-name") or _arg(command, "--model") or name,
+                    "--startup-delay-sec", str(client.load_delay_sec),
+                    "--token-delay-ms", str(client.token_delay_ms),
+                ],
+                stdout=self._log,
+                stderr=subprocess.STDOUT,
+            )
+
+    @property
+    def attrs(self) -> Dict[str, Any]:
+        self.reload()
+        return {
+            "Name": f"/{self.name}",
+            "Config": {"Image": self.image, "Cmd": self.command, "Labels": dict(self.labels)},
+            "State": {"Status": self.status, "Running": self.status == "running", "ExitCode": self.exit_code},
+        }
+
+    def reload(self):
+        if self._proc is not None and self.status == "running" and self._proc.poll() is not None:
+            self.status = "exited"
+            self.exit_code = self._proc.returncode
+
+    def stop(self, timeout: int = 10):
+        time.sleep(self.client.stop_delay_sec)
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+        self.status = "exited"
+        self.exit_code = self._proc.returncode if self._proc is not None else 0
+
+    def kill(self, signal=None):
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
+            self._proc.wait()
+        self.status = "exited"
+        self.exit_code = 137
+
+    def remove(self, force: bool = False):
+        self.reload()
+        if self.status == "running":
+            if not force:
+                raise APIError(f"You cannot remove a running container {self.name}")
+            self.kill()
+        self.client.containers._remove(self.name)
+        self._log.close()
+        os.unlink(self._log.name)
+
+    def logs(self, tail="all", stream: bool = False, follow: bool = False, **kwargs):
+        if stream:
+            return self._follow(follow)
+        self._log.flush()
+        lines = Path(self._log.name).read_bytes().splitlines(keepends=True)
+        if tail != "all":
+            lines = lines[-int(tail):]
+        return b"".join(lines)
+
+
+    def _follow(self, follow: bool):
+        with open(self._log.name, "rb") as f:
+            while True:
+                line = f.readline()
+                if line:
+                    yield line
+                    continue
+                self.reload()
+                if not follow or self.status != "running":
+                    return
+                time.sleep(0.05)
+
+
+class FakeContainerCollection:
+    def __init__(self, client: "FakeDockerClient"):
+        self.client = client
+        self._containers: Dict[str, FakeContainer] = {}
+        self._lock = threading.Lock()
+
+    def run(self, image: str, command=None, name: Optional[str] = None, labels=None, **kwargs) -> FakeContainer:
+        time.sleep(self.client.create_delay_sec)
+        name = name or f"fake-{len(self._containers)}"
+        with self._lock:
+            if name in self._containers:
+                raise APIError(f"Conflict. The container name {name} is already in use")
+            container = FakeContainer(self.client, name, image, list(command or []), dict(labels or {}))
+            self._containers[name] = container
+        return container
+
+    def get(self, name: str) -> FakeContainer:
+        with self._lock:
+            container = self._containers.get(name)
+        if container is None:
+            raise NotFound(f"No such container: {name}")
+        return container
+
+    def list(self, all: bool = False, filters: Optional[Dict[str, Any]] = None) -> List[FakeContainer]:
+        with self._lock:
+            containers = list(self._containers.values())
+        if not all:
+            containers = [c for c in containers if c.attrs["State"]["Running"]]
+        wanted = (filters or {}).get("label", [])
+        for label in [wanted] if isinstance(wanted, str) else wanted:
+            key, _, value = label.partition("=")
+            containers = [c for c in containers if key in c.labels and (not value or c.labels[key] == value)]
+        return containers
+
+    def _remove(self, name: str):
+        with self._lock:
+            self._containers.pop(name, None)
+
+
+class FakeDockerClient:
+    def __init__(
+        self,
+        load_delay_sec: float = 0.0,
+        stop_delay_sec: float = 0.0,
+        create_delay_sec: float = 0.0,
+        spawn_stubs: bool = True,
+        token_delay_ms: float = 0.0,
+    ):
+        self.load_delay_sec = load_delay_sec
+        self.token_delay_ms = token_delay_ms
+        self.stop_delay_sec = stop_delay_sec
+        self.create_delay_sec = create_delay_sec
+        self.spawn_stubs = spawn_stubs
+        self.containers = FakeContainerCollection(self)
+
+    @classmethod
+    def from_env(cls) -> "FakeDockerClient":
+        return cls(
+            load_delay_sec=float(os.getenv("FAKE_DOCKER_LOAD_DELAY_SEC", "0")),
+            stop_delay_sec=float(os.getenv("FAKE_DOCKER_STOP_DELAY_SEC", "0")),
+            create_delay_sec=float(os.getenv("FAKE_DOCKER_CREATE_DELAY_SEC", "0")),
+            spawn_stubs=os.getenv("FAKE_DOCKER_SPAWN_STUBS", "1").lower() in {"1", "true", "yes"},
+            token_delay_ms=float(os.getenv("FAKE_DOCKER_TOKEN_DELAY_MS", "0")),
+        )
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""Run worker/worker.py with its backend containers replaced by scripts/stub_backend.py processes.
+
+For offline runs of the whole stack and for bench_pool.py. The worker is configured as usual
+(REDIS_URL, GATEWAY_YAML_PATH, WORKER_NAME, ...); the fake Docker client reads
+FAKE_DOCKER_LOAD_DELAY_SEC, FAKE_DOCKER_STOP_DELAY_SEC, FAKE_DOCKER_CREATE_DELAY_SEC,
+FAKE_DOCKER_TOKEN_DELAY_MS and FAKE_DOCKER_SPAWN_STUBS.
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "gateway"))
+
+from app.backend_manager import BackendManager  # noqa: E402
+from app.queue import get_redis_conn  # noqa: E402
+from app.switcher import ModelSwitcher  # noqa: E402
+from fake_docker import FakeDockerClient  # noqa: E402
+from worker import tasks  # noqa: E402
+from worker.worker import main  # noqa: E402
+
+
+if __name__ == "__main__":
+    # The engine takes the process's switcher from tasks, so it drives the fake containers.
+    tasks.SWITCHER = ModelSwitcher(tasks._load_cfg(), manager=BackendManager(FakeDockerClient.from_env()), conn=get_redis_conn())
+    main()
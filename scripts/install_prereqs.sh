@@ -16,8 +16,8 @@ fi
 sudo usermod -aG docker "$USER_NAME" || true
 echo "[INFO] Added $USER_NAME to docker group. Run 'newgrp docker' or relogin."
 
-sudo mkdir -p "$ROOT_DIR" /var/lib/huggingface /mnt/models "/home/$USER_NAME/work"
-sudo chown -R "$USER_NAME":"$USER_NAME" "$ROOT_DIR" "/home/$USER_NAME/work"
+sudo mkdir -p "$ROOT_DIR" /var/lib/huggingface /var/lib/llm-switchboard/results /mnt/models "/home/$USER_NAME/work"
+sudo chown -R "$USER_NAME":"$USER_NAME" "$ROOT_DIR" /var/lib/llm-switchboard "/home/$USER_NAME/work"
 
 python3 -m venv "$PY_VENV"
 "$PY_VENV/bin/pip" install --upgrade pip
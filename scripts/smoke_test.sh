@@ -17,12 +17,12 @@ JOB1=$(curl -fsS -H "X-API-Key: $KEY" -H 'Content-Type: application/json' \
   "$API/v1/chat/completions" | python3 -c 'import sys,json;print(json.load(sys.stdin)["id"])')
 pass "job1 queued: $JOB1"
 
-for _ in $(seq 1 120); do
-  S=$(curl -fsS -H "X-API-Key: $KEY" "$API/jobs/$JOB1" | python3 -c 'import sys,json;print(json.load(sys.stdin)["status"])')
+for _ in $(seq 1 4); do
+  S=$(curl -fsS -H "X-API-Key: $KEY" "$API/jobs/$JOB1/wait?timeout=60" | python3 -c 'import sys,json;print(json.load(sys.stdin)["status"])')
   [[ "$S" == "succeeded" ]] && break
-  [[ "$S" == "failed" ]] && fail "job1 failed"
-  sleep 2
+  [[ "$S" == "failed" || "$S" == "cancelled" ]] && fail "job1 $S"
 done
+[[ "$S" == "succeeded" ]] || fail "job1 still $S"
 curl -fsS -H "X-API-Key: $KEY" "$API/jobs/$JOB1/result" >/dev/null && pass "job1 result"
 
 JOB2=$(curl -fsS -H "X-API-Key: $KEY" -H 'Content-Type: application/json' \
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Minimal OpenAI-compatible stand-in for a vLLM backend, for benchmarks and offline runs."""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+import orjson
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+
+
+def build_app(model: str, tokens: int, token_delay_ms: float) -> FastAPI:
+    app = FastAPI()
+    delay = token_delay_ms / 1000.0
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": model, "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = orjson.loads(await request.body())
+        n = min(tokens, int(body.get("max_tokens") or tokens))
+        created = int(time.time())
+        if body.get("stream"):
+            async def gen():
+                for i in range(n):
+                    if delay:
+                        await asyncio.sleep(delay)
+                    chunk = {
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": body.get("model", model),
+                        "choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": "length" if i == n - 1 else None}],
+                    }
+                    yield b"data: " + orjson.dumps(chunk) + b"\n\n"
+                usage = {"prompt_tokens": 1, "completion_tokens": n, "total_tokens": n + 1}
+                yield b"data: " + orjson.dumps({"id": "chatcmpl-stub", "choices": [], "usage": usage}) + b"\n\n"
+                yield b"data: [DONE]\n\n"
+
+            return StreamingResponse(gen(), media_type="text/event-stream")
+
+        if delay:
+            await asyncio.sleep(delay * n)
+        result = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model", model),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": " ".join(f"tok{i}" for i in range(n))}, "finish_reason": "length"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": n, "total_tokens": n + 1},
+        }
+        return Response(orjson.dumps(result), media_type="application/json")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--model", default="stub")
+    parser.add_argument("--tokens", type=int, default=16)
+    parser.add_argument("--token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--startup-delay-sec", type=float, default=0.0, help="simulate model load time")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    # Mimic vLLM's start-up log milestones so readiness tracking can be exercised.
+    print(f"INFO stub: Starting to load model {args.model}...", flush=True)
+    time.sleep(args.startup_delay_sec * 0.6)
+    print(f"INFO stub: Loading weights took {args.startup_delay_sec * 0.6:.2f} seconds", flush=True)
+    print("INFO stub: Capturing cudagraphs for decoding.", flush=True)
+    time.sleep(args.startup_delay_sec * 0.4)
+    print(f"INFO stub: Graph capturing finished in {args.startup_delay_sec * 0.4:.2f} secs", flush=True)
+    uvicorn.run(
+        build_app(args.model, args.tokens, args.token_delay_ms),
+        host=args.host,
+        port=args.port,
+        log_level="info",
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
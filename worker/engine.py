@@ -0,0 +1,459 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import signal
+import traceback
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from redis import Redis
+from rq import Queue
+from rq.defaults import DEFAULT_RESULT_TTL
+from rq.exceptions import DequeueTimeout
+from rq.job import Job, JobStatus
+from rq.utils import utcnow
+
+from . import tasks
+from app.backend_client import close_backend_client, init_backend_client
+from app.batches import record_batch_outcome
+from app.completion import CANCEL_CHANNEL, cancel_key, publish_done
+from app.config import get_worker_name
+from app.eta import model_slots
+from app.jobstore import mark_job_cancelled
+from app.metrics import METRICS
+from app.pool import advertise, claim_dead_workers, claimable_models, forget_worker, heartbeat, live_workers, orphaned_jobs
+from app.preload import Preloader
+from app.prestage import Prestager
+from app.queue import get_async_redis_conn, get_queue
+from app.ratelimit import refund
+from app.results import run_sweeper, store_result
+from app.scheduler import ModelAffinityScheduler, forget_job, requeue_job
+from app.streams import stream_key
+from app.webhooks import close_webhook_client, deliver_webhook
+
+log = logging.getLogger(__name__)
+
+
+def _job_model(job: Job) -> Optional[str]:
+    kwargs = job.kwargs or {}
+    return (job.meta or {}).get("requested_model") or kwargs.get("model") or kwargs.get("payload", {}).get("model")
+
+
+# Runs jobs in-process on one persistent event loop (no work-horse fork), so the
+# ModelSwitcher and the backend it tracks survive between jobs.
+class WorkerEngine:
+    def __init__(self, conn: Redis, name: Optional[str] = None, poll_timeout: int = 5, busy_poll_sec: float = 0.5):
+        self.conn = conn
+        self.name = name or get_worker_name()
+        self.poll_timeout = poll_timeout
+        self.busy_poll_sec = busy_poll_sec
+        self.queue = get_queue(conn)
+        self.cfg = tasks._load_cfg()
+        pool_cfg = self.cfg.gateway.get("pool", {})
+        self.heartbeat_sec = float(pool_cfg.get("heartbeat_sec", 2))
+        self.pool_poll_sec = float(pool_cfg.get("poll_sec", 1))
+        self.max_requeues = int(pool_cfg.get("max_requeues", 2))
+        self.switcher = tasks._switcher()
+        self.scheduler = ModelAffinityScheduler.from_config(conn, self.queue, self.cfg)
+        self._stop: Optional[asyncio.Event] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self._inflight_model: Optional[str] = None
+        self._webhooks: Set[asyncio.Task] = set()
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelling: Set[str] = set()
+        self._escalations: Set[asyncio.Task] = set()
+        self._preload_task: Optional[asyncio.Task] = None
+        self._preload_model: Optional[str] = None
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        init_backend_client(self.cfg)
+        await self.switcher.adopt_running_backend()
+        # Jobs still marked as started by this worker were cut off by its previous run.
+        for job, body in await asyncio.to_thread(self._recover_jobs, self.name):
+            self._notify(job, body)
+        follower = asyncio.create_task(self.switcher.follow_shared_state())
+        canceller = asyncio.create_task(self._follow_cancels())
+        pool = asyncio.create_task(self._run_pool())
+        interval = float(self.cfg.gateway.get("metrics", {}).get("flush_interval_sec", 5))
+        flusher = asyncio.create_task(METRICS.run_flusher(self.conn, interval))
+        sweeper = asyncio.create_task(run_sweeper(self.cfg, float(self.cfg.gateway.get("results", {}).get("sweep_interval_sec", 600))))
+        prestager = None
+        if self.cfg.gateway.get("prestage", {}).get("enabled", True):
+            prestager = asyncio.create_task(Prestager(self.cfg, self.scheduler, self.switcher).run())
+        preloader = None
+        if self.cfg.gateway.get("preload", {}).get("enabled", True):
+            preloader = asyncio.create_task(Preloader(self.cfg, self.conn, self.scheduler, self.switcher, lambda: bool(self._inflight), self._preload).run())
+        log.info("Worker %s listening on %s", self.name, self.queue.name)
+        while not self._stop.is_set():
+            if self._inflight and len(self._inflight) >= self._slots(self._inflight_model):
+                await asyncio.wait(self._inflight, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            # While requests are in flight only the loaded model may be admitted;
+            # a job for any other model waits until they drain (switch barrier).
+            # A preload holds the barrier for its model the same way.
+            preloading = self._preloading()
+            require_model = self._inflight_model if self._inflight else preloading
+            for job in await asyncio.to_thread(self._expire_overdue):
+                self._notify(job, {"status": "expired", "error": job.meta["error"]})
+            result = await asyncio.to_thread(self._dequeue, require_model, self._pool_info())
+            if result is None:
+                if preloading and not self._inflight:
+                    await self._abort_preload_for_work()
+                waiting = self._inflight or ({self._preload_task} if self._preloading() else set())
+                if waiting:
+                    await asyncio.wait(waiting, timeout=self.busy_poll_sec, return_when=asyncio.FIRST_COMPLETED)
+                continue
+            self._start(*result)
+
+        if self._inflight:
+            await asyncio.wait(self._inflight)
+        if self._webhooks:
+            await asyncio.wait(self._webhooks, timeout=30)
+        follower.cancel()
+        canceller.cancel()
+        pool.cancel()
+        await self.switcher.flush_state()
+        # Leave the pool, so other workers stop holding jobs for this one.
+        await asyncio.to_thread(forget_worker, self.conn, self.name)
+        for task in self._escalations:
+            task.cancel()
+        sweeper.cancel()
+        if prestager is not None:
+            prestager.cancel()
+        if preloader is not None:
+            preloader.cancel()
+        flusher.cancel()
+        await asyncio.gather(flusher, return_exceptions=True)
+        await close_backend_client()
+        await close_webhook_client()
+        log.info("Worker %s stopped", self.name)
+
+    def _slots(self, model: Optional[str]) -> int:
+        return model_slots(self.cfg, model)
+
+    def _start(self, job: Job, queue: Queue):
+        task = asyncio.create_task(self._execute(job, queue))
+        self._inflight.add(task)
+        self._inflight_model = _job_model(job)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._inflight.discard(task)
+
+    async def _preload(self, model: str) -> bool:
+        # Called by the Preloader with the queue idle. Runs as the engine's task, so the main
+        # loop holds other models' jobs back meanwhile and can abort it for them. False if aborted.
+        task = self._preload_task = asyncio.create_task(self.switcher.ensure_model_active(model))
+        self._preload_model = model
+        try:
+            await asyncio.wait({task})
+        finally:
+            self._preload_task = self._preload_model = None
+            task.cancel()
+        if task.cancelled():
+            return False
+        task.result()
+        return True
+
+    def _preloading(self) -> Optional[str]:
+        task = self._preload_task
+        return self._preload_model if task is not None and not task.done() else None
+
+    async def _abort_preload_for_work(self):
+        model, task = self._preload_model, self._preload_task
+        # Not while the container is being started: cancelling then would leave it running
+        # untracked. Before the switch begins, or once it is resident, is safe.
+        if self.switcher.switching and model not in self.switcher.resident:
+            return
+        if await asyncio.to_thread(self._other_work, model, self._pool_info()):
+            task.cancel()
+            await asyncio.wait({task})
+
+    def _other_work(self, model: Optional[str], info: Dict[str, Any]) -> bool:
+        # Whether a job for another model is pending that this worker may claim.
+        heads = self.scheduler.pending_heads()
+        models = {m for _, m in heads if m != model}
+        workers = live_workers(self.conn, self.cfg)
+        workers[self.name] = info
+        if models and len(workers) > 1:
+            models &= claimable_models(self.conn, self.cfg, self.name, workers, heads)
+        return bool(models)
+
+    def _expire_overdue(self) -> List[Job]:
+        expired = self.scheduler.expire_overdue()
+        for job in expired:
+            job.meta["expired"] = True
+            job.meta["error"] = "Deadline passed before the job could start"
+            job.meta["finished_at"] = datetime.now(timezone.utc).isoformat()
+            job.save_meta()
+            with self.conn.pipeline() as pipe:
+                job.set_status(JobStatus.CANCELED, pipeline=pipe)
+                record_batch_outcome(self.conn, job, "expired", pipe=pipe)
+                publish_done(pipe, job.id)
+                pipe.execute()
+            self._count_outcome(job, "expired")
+            refund(self.conn, self.cfg, job.meta.get("rate_limit"))
+            log.info("Job %s expired in queue (deadline passed)", job.id)
+        return expired
+
+    def _pool_info(self) -> Dict[str, Any]:
+        # What this worker advertises to the pool; built on the event loop, which owns the state.
+        busy = bool(self._inflight)
+        return {
+            "host": self.switcher.backend_host,
+            "resident": {m: dict(info) for m, info in self.switcher.resident.items()},
+            "active_model": self.switcher.active_model,
+            "switching": self.switcher.switching,
+            "inflight": len(self._inflight),
+            "inflight_model": self._inflight_model if busy else None,
+            "free_slots": self._slots(self._inflight_model) - len(self._inflight) if busy else self._slots(None),
+            # For the gateway's ETAs.
+            "running": sorted(self._running),
+        }
+
+    def _dequeue(self, require_model: Optional[str], info: Dict[str, Any]) -> Optional[Tuple[Job, Queue]]:
+        allowed, heads = None, {}
+        if require_model is None:
+            workers = live_workers(self.conn, self.cfg)
+            workers[self.name] = info
+            if len(workers) > 1:
+                heads = self.scheduler.pending_heads()
+                allowed = claimable_models(self.conn, self.cfg, self.name, workers, heads)
+        job = self.scheduler.next_job(
+            require_model or self.switcher.active_model,
+            require_model=require_model,
+            resident=self.switcher.resident_models(),
+            allowed=allowed,
+        )
+        if job is not None:
+            return job, self.queue
+        if require_model is not None:
+            return None
+        # Lane jobs left for other workers are in the rq list too, so it is only read when no lane has any.
+        if self.queue.count and not (allowed is not None and heads):
+            # Jobs enqueued without going through the scheduler are served FIFO.
+            try:
+                result = Queue.dequeue_any([self.queue], None, connection=self.conn)
+            except DequeueTimeout:
+                result = None
+            if result is not None:
+                forget_job(self.conn, result[0])
+                return result
+        # In a pool, look again soon: a job left for another worker may be ours to take next.
+        self.scheduler.wait(self.poll_timeout if allowed is None else min(self.poll_timeout, self.pool_poll_sec))
+        return None
+
+    async def _execute(self, job: Job, queue: Queue):
+        if job.get_status() == JobStatus.CANCELED:
+            return
+        if self.conn.exists(cancel_key(job.id)):
+            # Cancelled after the claim, before this worker was watching for it.
+            log.info("Job %s cancelled before it started", job.id)
+            self._handle_cancel(job, queue)
+            refund(self.conn, self.cfg, job.meta.get("rate_limit"))
+            self._notify(job, {"status": "cancelled"})
+            return
+        timeout = job.timeout or queue._default_timeout
+        registry = queue.started_job_registry
+        with self.conn.pipeline() as pipe:
+            job.prepare_for_execution(self.name, pipeline=pipe)
+            registry.add(job, timeout + 60, pipeline=pipe)
+            pipe.lrem(queue.intermediate_queue_key, 1, job.id)
+            # Other workers see the claim right away rather than at the next heartbeat.
+            info = self._pool_info()
+            advertise(pipe, self.name, {**info, "running": sorted({*info["running"], job.id})})
+            pipe.execute()
+
+        # Registered only now, with no await since the flag check above, so a cancel
+        # either was flagged there or reaches the task inside the try below.
+        self._running[job.id] = asyncio.current_task()
+        log.info("Running job %s (%s)", job.id, job.func_name)
+        token = tasks.CURRENT_JOB.set(job)
+        try:
+            rv = await asyncio.wait_for(self._call(job), timeout)
+            await asyncio.to_thread(self._store_result, job, rv)
+        except asyncio.CancelledError:
+            if job.id not in self._cancelling:
+                raise
+            asyncio.current_task().uncancel()
+            job.ended_at = utcnow()
+            log.info("Job %s cancelled", job.id)
+            self._handle_cancel(job, queue)
+            self._notify(job, {"status": "cancelled"})
+        except Exception:
+            job.ended_at = utcnow()
+            log.exception("Job %s failed", job.id)
+            exc_string = traceback.format_exc()
+            self._handle_failure(job, queue, exc_string)
+            self._count_outcome(job, "failed")
+            self._notify(job, {"status": "failed", "error": job.meta.get("error") or exc_string[-4000:]})
+        else:
+            job.ended_at = utcnow()
+            self._handle_success(job, queue)
+            self._count_outcome(job, "succeeded")
+            self._notify(job, {"status": "succeeded", "result": rv})
+        finally:
+            tasks.CURRENT_JOB.reset(token)
+            self._running.pop(job.id, None)
+            self._cancelling.discard(job.id)
+
+    async def _run_pool(self):
+        while True:
+            try:
+                if await asyncio.to_thread(heartbeat, self.conn, self.name, self._pool_info()):
+                    # New to the pool (or declared dead meanwhile): the gateway needs our state again.
+                    self.switcher.announce()
+                for job, body in await asyncio.to_thread(self._reap_dead_workers):
+                    self._notify(job, body)
+            except Exception:
+                log.warning("Pool heartbeat failed", exc_info=True)
+            await asyncio.sleep(self.heartbeat_sec)
+
+    def _reap_dead_workers(self) -> List[Tuple[Job, Dict[str, Any]]]:
+        ended = []
+        for name in claim_dead_workers(self.conn, self.cfg, self.name):
+            log.warning("Worker %s stopped sending heartbeats, recovering its jobs", name)
+            METRICS.inc("llm_pool_dead_workers_total")
+            ended += self._recover_jobs(name)
+            forget_worker(self.conn, name)
+        return ended
+
+    def _recover_jobs(self, name: str) -> List[Tuple[Job, Dict[str, Any]]]:
+        # A dead worker's jobs go back to their lanes, except cancelled ones, streams that
+        # already sent output (the client has part of an answer) and jobs requeued
+        # max_requeues times, which fail. Returns the ended ones with their webhook bodies.
+        ended = []
+        for job in orphaned_jobs(self.queue, name):
+            if self.conn.exists(cancel_key(job.id)):
+                # Its admission cost went with the original claim and is not added back.
+                log.info("Job %s of worker %s was cancelled", job.id, name)
+                self._handle_cancel(job, self.queue)
+                refund(self.conn, self.cfg, job.meta.get("rate_limit"))
+                ended.append((job, {"status": "cancelled"}))
+                continue
+            requeues = int(job.meta.get("requeues", 0))
+            streamed = (job.kwargs or {}).get("payload", {}).get("stream") and self.conn.exists(stream_key(job.id))
+            if requeues < self.max_requeues and not streamed:
+                for field in ("started_at", "generation_started_at", "progress"):
+                    job.meta.pop(field, None)
+                job.meta["requeues"] = requeues + 1
+                requeue_job(self.queue, job)
+                METRICS.inc("llm_pool_requeued_jobs_total", model=_job_model(job) or "")
+                log.info("Requeued job %s of worker %s", job.id, name)
+                continue
+            job.meta["error"] = f"Worker {name} died while running the job"
+            job.meta["finished_at"] = datetime.now(timezone.utc).isoformat()
+            job.save_meta()
+            job.ended_at = utcnow()
+            self._handle_failure(job, self.queue, job.meta["error"])
+            self._count_outcome(job, "failed")
+            refund(self.conn, self.cfg, job.meta.get("rate_limit"))
+            ended.append((job, {"status": "failed", "error": job.meta["error"]}))
+        return ended
+
+    # Cooperative cancellation: cancelling the job's task aborts its in-flight backend
+    # request, and vLLM drops a sequence whose client went away, so the model stays
+    # loaded. Only if the task is still running CANCEL_GRACE_SEC later is the backend
+    # stopped, by this worker, whose switcher owns it.
+    async def _follow_cancels(self):
+        while True:
+            aconn = get_async_redis_conn()
+            try:
+                async with aconn.pubsub() as pubsub:
+                    await pubsub.subscribe(CANCEL_CHANNEL)
+                    # Requests published while unsubscribed are still flagged.
+                    for job_id in list(self._running):
+                        if await aconn.exists(cancel_key(job_id)):
+                            self._cancel(job_id)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._cancel(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.warning("Cancel subscription lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                await aconn.aclose()
+
+    def _cancel(self, job_id: str):
+        task = self._running.get(job_id)
+        if task is None or job_id in self._cancelling:
+            return
+        log.info("Cancelling job %s", job_id)
+        self._cancelling.add(job_id)
+        task.cancel()
+        # Under the switch barrier every in-flight job runs on _inflight_model.
+        escalation = asyncio.create_task(self._escalate(job_id, task, self._inflight_model))
+        self._escalations.add(escalation)
+        escalation.add_done_callback(self._escalations.discard)
+
+    async def _escalate(self, job_id: str, task: asyncio.Task, model: Optional[str]):
+        grace = float(self.cfg.gateway.get("timeouts", {}).get("CANCEL_GRACE_SEC", 30))
+        await asyncio.wait({task}, timeout=grace)
+        if not task.done():
+            log.warning("Job %s still running %.0fs after cancel, stopping the backend", job_id, grace)
+            await self.switcher.stop_model(model)
+
+    def _count_outcome(self, job: Job, outcome: str):
+        METRICS.inc("llm_jobs_total", outcome=outcome, model=_job_model(job) or "", priority=job.meta.get("priority", ""))
+
+    def _notify(self, job: Job, body: dict):
+        url = job.meta.get("webhook_url")
+        if not url:
+            return
+        body = {"id": job.id, "requested_model": job.meta.get("requested_model"), **body}
+        task = asyncio.create_task(deliver_webhook(self.cfg, url, body))
+        self._webhooks.add(task)
+        task.add_done_callback(self._webhooks.discard)
+
+    async def _call(self, job: Job):
+        func = job.func
+        if inspect.iscoroutinefunction(func):
+            return await func(*job.args, **job.kwargs)
+        return await asyncio.to_thread(func, *job.args, **job.kwargs)
+
+    def _store_result(self, job: Job, rv):
+        # Stored before the status flips to finished, so readers never see a finished job without it.
+        # rq's own Result then carries no return value.
+        result_ttl = job.get_result_ttl(DEFAULT_RESULT_TTL)
+        if result_ttl != 0:
+            store_result(self.conn, self.cfg, job.id, rv, result_ttl)
+
+    def _handle_success(self, job: Job, queue: Queue):
+        result_ttl = job.get_result_ttl(DEFAULT_RESULT_TTL)
+        with self.conn.pipeline() as pipe:
+            if result_ttl != 0:
+                job._handle_success(result_ttl, pipeline=pipe)
+            job.cleanup(result_ttl, pipeline=pipe, remove_from_queue=False)
+            queue.started_job_registry.remove(job, pipeline=pipe)
+            record_batch_outcome(self.conn, job, "succeeded", pipe=pipe)
+            publish_done(pipe, job.id)
+            pipe.execute()
+
+    def _handle_cancel(self, job: Job, queue: Queue):
+        with self.conn.pipeline() as pipe:
+            queue.started_job_registry.remove(job, pipeline=pipe)
+            pipe.delete(cancel_key(job.id))
+            pipe.execute()
+        mark_job_cancelled(job)
+
+    def _handle_failure(self, job: Job, queue: Queue, exc_string: str):
+        with self.conn.pipeline() as pipe:
+            job.set_status(JobStatus.FAILED, pipeline=pipe)
+            queue.started_job_registry.remove(job, pipeline=pipe)
+            job._handle_failure(exc_string, pipeline=pipe)
+            record_batch_outcome(self.conn, job, "failed", pipe=pipe)
+            publish_done(pipe, job.id)
+            pipe.execute()
@@ -2,24 +2,35 @@ from __future__ import annotations
 
 import asyncio
 import os
+import time
+from contextvars import ContextVar
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
+import orjson
 import yaml
 from rq import get_current_job
+from rq.job import Job
 
 import sys
 
 sys.path.append(str(Path(__file__).resolve().parents[1] / "gateway"))
 
-from app.proxy import call_backend_chat
+from app.cache import ResponseCache
+from app.eta import model_stats, record_job_stats
+from app.ratelimit import refund
+from app.proxy import StreamAccumulator, call_backend_chat, observe_completion, stream_backend_events
+from app.streams import StreamPublisher
+from app.queue import get_async_redis_conn, get_redis_conn
 from app.switcher import ModelSwitcher
 from app.config import AppConfig
 
 
 CFG_CACHE: AppConfig | None = None
 SWITCHER: ModelSwitcher | None = None
+CURRENT_JOB: ContextVar[Optional[Job]] = ContextVar("current_job", default=None)
+PROGRESS_INTERVAL_SEC = 1.0
 
 
 def _load_cfg() -> AppConfig:
@@ -40,41 +51,109 @@ def _switcher() -> ModelSwitcher:
     global SWITCHER
     if SWITCHER:
         return SWITCHER
-    SWITCHER = ModelSwitcher(_load_cfg())
+    SWITCHER = ModelSwitcher(_load_cfg(), conn=get_redis_conn())
     return SWITCHER
 
 
-def process_chat_job(payload: Dict[str, Any], request_id: str | None = None):
-    job = get_current_job()
+def _current_job() -> Job:
+    return CURRENT_JOB.get() or get_current_job()
+
+
+async def process_chat_job(payload: Dict[str, Any], request_id: str | None = None):
+    job = _current_job()
     sw = _switcher()
     model = payload["model"]
     job.meta["requested_model"] = model
     job.meta["started_at"] = datetime.now(timezone.utc).isoformat()
     job.save_meta()
 
-    async def _run():
-        await sw.ensure_model_active(model)
-        model_cfg = _load_cfg().models["models"][model]
-        timeout = int(_load_cfg().gateway.get("timeouts", {}).get("INFERENCE_TIMEOUT_SEC", 1200))
-        return await call_backend_chat(model_cfg, payload, timeout_sec=timeout)
+    # An identical request may have completed while this one was queued.
+    cache = ResponseCache(job.connection, _load_cfg())
+    cached = cache.get(payload, record_miss=False)
+    if cached is not None:
+        job.meta["cache_hit"] = True
+        job.meta["finished_at"] = datetime.now(timezone.utc).isoformat()
+        job.meta["progress"] = 1.0
+        job.save_meta()
+        refund(job.connection, _load_cfg(), job.meta.get("rate_limit"))
+        return cached
 
     try:
-        result = asyncio.run(_run())
+        # Shielded: cancelling the job must not abort a model switch halfway through.
+        await asyncio.shield(sw.ensure_model_active(model))
+        model_cfg = _load_cfg().models["models"][model]
+        timeout = int(_load_cfg().gateway.get("timeouts", {}).get("INFERENCE_TIMEOUT_SEC", 1200))
+        # Generation time excludes the model switch, so ETAs can price the two separately.
+        began = time.time()
+        job.meta["generation_started_at"] = began
+        job.save_meta()
+        if payload.get("stream"):
+            result = await _stream_chat(job, model_cfg, payload, timeout)
+        else:
+            result = await call_backend_chat(model_cfg, payload, timeout_sec=timeout)
+        record_job_stats(job.connection, _load_cfg(), model, time.time() - began, result.get("usage"))
+    except asyncio.CancelledError:
+        # Cancelled (or timed out); the engine records the outcome.
+        if payload.get("stream"):
+            await _publish_error(job, "Job aborted")
+        refund(job.connection, _load_cfg(), job.meta.get("rate_limit"))
+        raise
     except Exception as exc:
+        if payload.get("stream"):
+            await _publish_error(job, str(exc))
         job.meta["error"] = str(exc)
         job.meta["finished_at"] = datetime.now(timezone.utc).isoformat()
         job.save_meta()
+        refund(job.connection, _load_cfg(), job.meta.get("rate_limit"))
         raise
 
+    refund(job.connection, _load_cfg(), job.meta.get("rate_limit"), (result.get("usage") or {}).get("completion_tokens"))
+    cache.put(payload, result)
     job.meta["finished_at"] = datetime.now(timezone.utc).isoformat()
     job.meta["progress"] = 1.0
     job.save_meta()
     return result
 
 
-def admin_switch_job(model: str):
-    async def _run():
-        await _switcher().ensure_model_active(model)
+def _stream_ttl(job: Job) -> int:
+    return int(job.result_ttl or _load_cfg().gateway.get("jobs", {}).get("result_ttl_sec", 86400))
+
+
+async def _publish_error(job: Job, message: str):
+    # After any chunks _stream_chat left, which it flushes before raising.
+    await StreamPublisher(get_async_redis_conn(), job.id, _stream_ttl(job)).close("error", message)
+
+
+async def _stream_chat(job: Job, model_cfg: Dict[str, Any], payload: Dict[str, Any], timeout: int) -> Dict[str, Any]:
+    ttl = _stream_ttl(job)
+    acc = StreamAccumulator()
+    backend_payload = {**payload, "stream_options": {"include_usage": True}}
+    # Progress counts content chunks (about one token each) against max_tokens, or
+    # against the model's mean completion length when no limit was given.
+    expected = payload.get("max_tokens") or model_stats(job.connection, _load_cfg(), [payload["model"]])[payload["model"]].get("completion_tokens")
+    began = chunks_at = time.monotonic()
+    chunks = 0
+    publisher = StreamPublisher(get_async_redis_conn(), job.id, ttl)
+    try:
+        async for data in stream_backend_events(model_cfg, backend_payload, timeout_sec=timeout):
+            await publisher.add(data)
+            chunk = orjson.loads(data)
+            acc.add(chunk)
+            if expected and any((c.get("delta") or {}).get("content") for c in chunk.get("choices", [])):
+                chunks += 1
+                if time.monotonic() - chunks_at >= PROGRESS_INTERVAL_SEC:
+                    job.meta["progress"] = round(min(0.99, chunks / expected), 3)
+                    await asyncio.to_thread(job.save_meta)
+                    chunks_at = time.monotonic()
+    except BaseException:
+        # What the client has not seen yet goes out before the error event.
+        await publisher.close()
+        raise
+    observe_completion(payload["model"], time.monotonic() - began, acc.usage)
+    await publisher.close("done")
+    return acc.result()
+
 
-    asyncio.run(_run())
+async def admin_switch_job(model: str):
+    await _switcher().ensure_model_active(model)
     return {"status": "switched", "active_model": model}
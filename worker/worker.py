@@ -1,17 +1,25 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
 from redis import Redis
-from rq import Connection, Worker
+
+from worker.engine import WorkerEngine
+from app.config import get_worker_name
 
 
 def main():
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
     redis_url = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
     conn = Redis.from_url(redis_url)
-    with Connection(conn):
-        worker = Worker(["llm_jobs"], name="llm-worker-1")
-        worker.work(with_scheduler=False, logging_level=os.getenv("LOG_LEVEL", "INFO"))
+    engine = WorkerEngine(conn, name=get_worker_name())
+    asyncio.run(engine.run())
 
 
 if __name__ == "__main__":